@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from rest_framework import viewsets, permissions, serializers
 
+from tourcraft.middleware import query_budget
+from tourcraft.pagination import KeysetPagination
+
 
 User = get_user_model()
 
@@ -15,13 +18,15 @@ class UserSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'is_active',
-            'date_joined',
+            'created_at',
         )
 
 
+@query_budget(5)
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
 
@@ -40,4 +40,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.username
     
     class Meta:
-        db_table = 'accounts_user'
\ No newline at end of file
+        db_table = 'accounts_user'
+        indexes = [
+            # Keyset pagination (tourcraft.pagination)
+            models.Index(fields=['-created_at', '-id'], name='user_keyset_idx'),
+        ]
\ No newline at end of file
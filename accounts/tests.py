@@ -1,3 +1,20 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+User = get_user_model()
+
+
+@override_settings(API_PAGE_SIZE=2)
+class UserApiTests(TestCase):
+    def test_users_are_paginated_newest_first(self):
+        users = [User.objects.create_user(f'user{n}', f'user{n}@example.com', 'pass12345') for n in range(3)]
+        client = APIClient()
+        client.force_authenticate(users[0])
+
+        first = client.get('/api/users/').data
+        self.assertEqual([u['username'] for u in first['results']], ['user2', 'user1'])
+        self.assertIn('created_at', first['results'][0])
+        second = client.get(first['next']).data
+        self.assertEqual([u['username'] for u in second['results']], ['user0'])
+        self.assertIsNone(second['next'])
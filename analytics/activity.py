@@ -0,0 +1,151 @@
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from tours.models import Tour
+from tours.spool import Spool
+
+from .models import ActivityLog
+
+ACTION_LABELS = dict(ActivityLog.ACTION_CHOICES)
+
+
+def get_spool():
+    return Spool(settings.ACTIVITY_BUFFER_DIR, "activity")
+
+
+def _feed_key(user_id):
+    return f"analytics:activity-feed:{user_id}"
+
+
+def log_activity(user_id, action, tour_id=None, tour_title=""):
+    """Buffer an activity entry once the current transaction commits.
+
+    Nothing is written to the database on the request path; ``flush_activity``
+    bulk-inserts the entries and refreshes the affected users' feeds.
+    """
+    record = [user_id, action, str(tour_id) if tour_id else None, tour_title, int(time.time())]
+    transaction.on_commit(lambda: get_spool().append(record))
+
+
+def _entry(log):
+    return {
+        "id": log.pk,
+        "action": log.action,
+        "label": ACTION_LABELS.get(log.action, log.action),
+        "tour_id": log.tour_id,
+        "tour_title": log.tour_title,
+        "timestamp": log.timestamp,
+    }
+
+
+def _feed_logs(user_id):
+    return ActivityLog.objects.filter(user_id=user_id).order_by("-timestamp", "-pk")[: settings.ACTIVITY_FEED_SIZE]
+
+
+def _build_feed(user_id):
+    return [_entry(log) for log in _feed_logs(user_id)]
+
+
+def get_feed(user_id):
+    """The user's latest ACTIVITY_FEED_SIZE activities, newest first.
+
+    Kept precomputed in the cache by ``flush_activity``; a miss costs one
+    indexed query.
+    """
+    key = _feed_key(user_id)
+    feed = cache.get(key)
+    if feed is None:
+        feed = _build_feed(user_id)
+        # add() rather than set(): never overwrite a feed written by a flush.
+        cache.add(key, feed, settings.ACTIVITY_FEED_CACHE_TIMEOUT)
+    return feed
+
+
+async def aget_feed(user_id):
+    """Async ``get_feed``."""
+    key = _feed_key(user_id)
+    feed = await cache.aget(key)
+    if feed is None:
+        feed = [_entry(log) async for log in _feed_logs(user_id)]
+        await cache.aadd(key, feed, settings.ACTIVITY_FEED_CACHE_TIMEOUT)
+    return feed
+
+
+def flush_activity():
+    """Bulk-insert every buffered activity entry and return how many were flushed."""
+    with get_spool().batch() as records:
+        if records:
+            apply_activity(records)
+    return len(records)
+
+
+def apply_activity(records):
+    """Persist ``[user_id, action, tour_id, tour_title, timestamp]`` records.
+
+    Entries for users that no longer exist are dropped; entries for deleted
+    tours keep their title but lose the link.
+    """
+    user_ids = set(get_user_model().objects.filter(pk__in={r[0] for r in records}).values_list("pk", flat=True))
+    tour_ids = {uuid.UUID(r[2]) for r in records if r[2]}
+    tour_ids = set(Tour.objects.filter(pk__in=tour_ids).values_list("pk", flat=True))
+
+    logs = []
+    for user_id, action, tour_id, tour_title, timestamp in records:
+        if user_id not in user_ids or action not in ACTION_LABELS:
+            continue
+        tour_id = uuid.UUID(tour_id) if tour_id else None
+        logs.append(ActivityLog(
+            user_id=user_id,
+            tour_id=tour_id if tour_id in tour_ids else None,
+            tour_title=tour_title[:200],
+            action=action,
+            timestamp=datetime.fromtimestamp(timestamp, tz=dt_timezone.utc),
+        ))
+    with transaction.atomic():
+        ActivityLog.objects.bulk_create(logs, batch_size=500)
+        transaction.on_commit(lambda: _refresh_feeds(logs))
+
+
+def _refresh_feeds(logs):
+    # Always write the feed after the rows are committed. A reader that
+    # rebuilt it from an older snapshot either lost its add() to this set(),
+    # or wrote first and gets the new entries merged in here.
+    by_user = {}
+    for log in logs:
+        by_user.setdefault(log.user_id, []).append(log)
+    for user_id, user_logs in by_user.items():
+        key = _feed_key(user_id)
+        feed = cache.get(key)
+        if feed is None or any(log.pk is None for log in user_logs):
+            feed = _build_feed(user_id)
+        else:
+            known = {entry["id"] for entry in feed}
+            feed = [_entry(log) for log in user_logs if log.pk not in known] + feed
+            feed.sort(key=lambda entry: (entry["timestamp"], entry["id"]), reverse=True)
+            feed = feed[: settings.ACTIVITY_FEED_SIZE]
+        cache.set(key, feed, settings.ACTIVITY_FEED_CACHE_TIMEOUT)
+
+
+def prune_activity(days, batch_size, pause=0.0):
+    """Delete entries older than ``days`` in batches of ``batch_size`` primary keys.
+
+    Each batch is its own short transaction, so the table is never locked for
+    long. Returns the number of rows deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = 0
+    while True:
+        expired = ActivityLog.objects.filter(timestamp__lt=cutoff).order_by("timestamp")
+        ids = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ActivityLog.objects.filter(pk__in=ids).delete()[0]
+        if pause:
+            time.sleep(pause)
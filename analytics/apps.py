@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class AnalyticsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'analytics'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .slow_queries import install
+
+        connection_created.connect(install, dispatch_uid="analytics.slow_queries")
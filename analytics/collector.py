@@ -0,0 +1,114 @@
+import json
+import re
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from tours.models import Tour, TourStep
+
+from .models import StepEvent
+
+KINDS = {"shown": StepEvent.SHOWN, "completed": StepEvent.COMPLETED, "dismissed": StepEvent.DISMISSED}
+_SESSION_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Client clocks are trusted only this far; anything else is stamped with server time.
+MAX_CLOCK_SKEW = timedelta(hours=1)
+
+
+def _tour_key(tour_id):
+    return f"analytics:collect-tour:{tour_id}"
+
+
+def tour_steps(tour_id):
+    """Step ids of a tour that accepts events, or None; cached briefly.
+
+    Only published public tours accept events, as only they are served to
+    anonymous players.
+    """
+    key = _tour_key(tour_id)
+    steps = cache.get(key)
+    if steps is None:
+        if Tour.objects.filter(pk=tour_id, status="Published", privacy="public").exists():
+            steps = frozenset(TourStep.objects.filter(tour_id=tour_id).values_list("pk", flat=True))
+        else:
+            steps = False
+        cache.set(key, steps, settings.ANALYTICS_COLLECT_TOUR_CACHE_TIMEOUT)
+    return steps if steps is not False else None
+
+
+def parse_batch(body, now):
+    """Validate a beacon body and return unsaved StepEvents; raises ValueError.
+
+    The body is ``{"tour": <uuid>, "session": <id>, "events": [{"type": ...,
+    "step": <id or null>, "t": <epoch ms>}, ...]}``. Individual events with an
+    unknown type or step are dropped rather than failing the batch.
+    """
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Expected an object")
+    tour_id = uuid.UUID(str(data.get("tour")))
+    session = data.get("session")
+    if not isinstance(session, str) or not _SESSION_RE.match(session):
+        raise ValueError("Invalid session")
+    events = data.get("events")
+    if not isinstance(events, list) or len(events) > settings.ANALYTICS_COLLECT_MAX_EVENTS:
+        raise ValueError(f"Expected a list of at most {settings.ANALYTICS_COLLECT_MAX_EVENTS} events")
+
+    steps = tour_steps(tour_id)
+    if steps is None:
+        raise LookupError("Unknown tour")
+
+    earliest, latest = now - MAX_CLOCK_SKEW, now
+    parsed = []
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        kind = KINDS.get(event.get("type"))
+        step = event.get("step")
+        if kind is None or (step is not None and step not in steps):
+            continue
+        occurred_at = now
+        if isinstance(event.get("t"), (int, float)):
+            try:
+                client_time = datetime.fromtimestamp(event["t"] / 1000, tz=dt_timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                client_time = None
+            if client_time is not None and earliest <= client_time <= latest:
+                occurred_at = client_time
+        parsed.append(StepEvent(
+            tour_id=tour_id, step_id=step, session=session, kind=kind,
+            occurred_at=occurred_at, received_at=now,
+        ))
+    return parsed
+
+
+def _cors(response):
+    response["Access-Control-Allow-Origin"] = "*"
+    response["Access-Control-Allow-Methods"] = "POST, OPTIONS"
+    response["Access-Control-Allow-Headers"] = "Content-Type"
+    return response
+
+
+def collect(request):
+    """Store one beacon of step-progress events with a single INSERT."""
+    if request.method == "OPTIONS":
+        return _cors(HttpResponse(status=204))
+    if request.method != "POST":
+        return _cors(HttpResponse(status=405, headers={"Allow": "POST, OPTIONS"}))
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return _cors(JsonResponse({"error": "Invalid Content-Length"}, status=400))
+    if content_length > settings.ANALYTICS_COLLECT_MAX_BYTES:
+        return _cors(JsonResponse({"error": "Batch too large"}, status=413))
+    try:
+        events = parse_batch(request.body, timezone.now())
+    except LookupError as exc:
+        return _cors(JsonResponse({"error": str(exc)}, status=404))
+    except (TypeError, ValueError) as exc:
+        return _cors(JsonResponse({"error": str(exc)}, status=400))
+    StepEvent.objects.bulk_create(events)
+    return _cors(HttpResponse(status=204))
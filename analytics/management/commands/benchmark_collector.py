@@ -0,0 +1,67 @@
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from analytics.models import StepEvent
+from tours.models import Tour, TourStep
+from tours.ranks import spread
+
+
+class Command(BaseCommand):
+    help = 'Measure step-event ingestion throughput through the full middleware stack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=20, help='Events per beacon')
+        parser.add_argument('--steps', type=int, default=8)
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(
+            username='collector-benchmark', defaults={'email': 'collector-benchmark@example.invalid'}
+        )
+        tour = Tour.objects.create(title='Collector benchmark', creator=user, status='Published')
+        try:
+            steps = TourStep.objects.bulk_create(
+                TourStep(tour=tour, rank=rank, title=f'Step {n}') for n, rank in enumerate(spread(options['steps']), 1)
+            )
+            step_ids = [step.pk for step in steps]
+            now_ms = int(time.time() * 1000)
+            bodies = [
+                json.dumps({
+                    'tour': str(tour.pk),
+                    'session': uuid.uuid4().hex,
+                    'events': [
+                        {'type': 'shown' if n % 2 else 'completed', 'step': step_ids[n % len(step_ids)], 't': now_ms}
+                        for n in range(options['batch'])
+                    ],
+                })
+                for _ in range(options['requests'])
+            ]
+
+            client = Client()
+            client.post(settings.ANALYTICS_COLLECT_PATH, bodies[0], content_type='text/plain')  # warm caches
+            started = time.perf_counter()
+            for body in bodies:
+                response = client.post(settings.ANALYTICS_COLLECT_PATH, body, content_type='text/plain')
+                if response.status_code != 204:
+                    raise RuntimeError(f'Collector answered {response.status_code}: {response.content[:200]!r}')
+            elapsed = time.perf_counter() - started
+
+            stored = StepEvent.objects.filter(tour=tour).count()
+            events = options['requests'] * options['batch']
+            self.stdout.write(json.dumps({
+                'requests': options['requests'],
+                'batch': options['batch'],
+                'events': events,
+                'stored': stored,
+                'seconds': round(elapsed, 3),
+                'requests_per_second': round(options['requests'] / elapsed, 1),
+                'events_per_second': round(events / elapsed, 1),
+            }, indent=2))
+        finally:
+            tour.delete()
@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.activity import flush_activity
+
+
+class Command(BaseCommand):
+    help = 'Bulk-insert buffered activity entries into ActivityLog and refresh user feeds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.ACTIVITY_FLUSH_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_activity()
+            if flushed or not options['loop']:
+                self.stdout.write(f'Flushed {flushed} activities')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.slow_queries import flush_slow_queries
+
+
+class Command(BaseCommand):
+    help = 'Fold buffered slow queries into the slow query log, one row per fingerprint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.SLOW_QUERY_FLUSH_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_slow_queries()
+            if flushed or not options['loop']:
+                self.stdout.write(f'Flushed {flushed} slow queries')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
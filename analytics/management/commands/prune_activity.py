@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.activity import prune_activity
+
+
+class Command(BaseCommand):
+    help = 'Delete ActivityLog entries past the retention period in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ACTIVITY_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        deleted = prune_activity(options['days'], options['batch_size'], options['pause'])
+        self.stdout.write(f'Deleted {deleted} activities older than {options["days"]} days')
@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.rollups import run_rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold new step-progress events into the Analytics completion rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep rolling up every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.ANALYTICS_ROLLUP_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_rollups()
+            if processed or not options['loop']:
+                self.stdout.write(f'Rolled up {processed} events')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+import textwrap
+
+from django.core.management.base import BaseCommand
+
+from analytics.slow_queries import flush_slow_queries, reset, top_offenders
+
+
+class Command(BaseCommand):
+    help = 'Fold buffered slow queries into the slow query log and print the worst offenders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='How many queries to print')
+        parser.add_argument('--order-by', choices=['total', 'count', 'max'], default='total',
+                            help='Rank by total time (default), number of runs or slowest run')
+        parser.add_argument('--no-plan', action='store_true', help='Leave out the EXPLAIN plans')
+        parser.add_argument('--reset', action='store_true', help='Empty the log after printing it')
+
+    def handle(self, *args, **options):
+        flush_slow_queries()
+        offenders = top_offenders(options['order_by'], options['limit'])
+        if not offenders:
+            self.stdout.write('No slow queries recorded')
+        for rank, query in enumerate(offenders, 1):
+            self.stdout.write(
+                f'{rank}. {query.fingerprint}  {query.count}x  total {query.total_ms:.0f}ms  '
+                f'mean {query.total_ms / query.count:.1f}ms  max {query.max_ms:.1f}ms'
+            )
+            self.stdout.write(f'   view: {query.view or "-"}  at {query.location or "-"}  '
+                              f'params {query.params_fingerprint}')
+            self.stdout.write(textwrap.indent(textwrap.shorten(query.sql, 600, placeholder=' ...'), '   '))
+            if query.plan and not options['no_plan']:
+                self.stdout.write(textwrap.indent(query.plan, '   | '))
+        if options['reset']:
+            reset()
@@ -0,0 +1,36 @@
+from django.conf import settings
+
+from .collector import collect
+from .slow_queries import current_request
+
+
+class StepEventCollectorMiddleware:
+    """Answer step-progress beacons before the rest of the middleware stack runs.
+
+    Beacons are anonymous and arrive in high volume, so loading a session,
+    resolving the user and setting up messages for each one is wasted work.
+    Listed near the top of MIDDLEWARE, this short-circuits ANALYTICS_COLLECT_PATH.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.path = settings.ANALYTICS_COLLECT_PATH
+
+    def __call__(self, request):
+        if request.path_info == self.path:
+            return collect(request)
+        return self.get_response(request)
+
+
+class SlowQueryMiddleware:
+    """Let the slow query log (analytics/slow_queries.py) name the view behind each query."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
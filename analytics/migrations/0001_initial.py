@@ -0,0 +1,85 @@
+# Generated by Django 4.2 on 2026-10-18 14:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tours', '0008_recording_event_chunks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TourHourlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('viewers', models.PositiveIntegerField(default=0)),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_stats', to='tours.tour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TourDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('viewers', models.PositiveIntegerField(default=0)),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='tours.tour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Analytics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_views', models.IntegerField(default=0)),
+                ('unique_viewers', models.IntegerField(default=0)),
+                ('avg_completion_rate', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tour', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analytics', to='tours.tour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActivityLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('created', 'Created Tour'), ('updated', 'Updated Tour'), ('published', 'Published Tour'), ('viewed', 'Viewed Tour'), ('deleted', 'Deleted Tour')], max_length=20)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('tour', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activities', to='tours.tour')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activities', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tourhourlystats',
+            index=models.Index(fields=['hour'], name='analytics_t_hour_4fb27f_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tourhourlystats',
+            constraint=models.UniqueConstraint(fields=('tour', 'hour'), name='unique_hourly_stats_per_tour'),
+        ),
+        migrations.AddIndex(
+            model_name='tourdailystats',
+            index=models.Index(fields=['day'], name='analytics_t_day_af7ee0_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tourdailystats',
+            constraint=models.UniqueConstraint(fields=('tour', 'day'), name='unique_daily_stats_per_tour'),
+        ),
+    ]
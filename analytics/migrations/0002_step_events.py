@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 14:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0008_recording_event_chunks'),
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analytics',
+            name='completions',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='starts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StepEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.CharField(max_length=64)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Step shown'), (2, 'Step completed'), (3, 'Tour dismissed')])),
+                ('occurred_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField()),
+                ('step', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='tours.tourstep')),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='step_events', to='tours.tour')),
+            ],
+        ),
+    ]
@@ -0,0 +1,143 @@
+# Generated by Django 4.2 on 2026-10-18 15:10
+
+import hashlib
+import math
+import zlib
+from collections import Counter, defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# A frozen copy of the parts of analytics.hll this migration uses, so later
+# changes to the live module can't change what it writes.
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+_HASH_BITS = 64
+_MAX_RANK = _HASH_BITS - PRECISION + 1
+_ALPHA_INF = 1 / (2 * math.log(2))
+
+
+def _sigma(x):
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    if x in (0, 1):
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+class HyperLogLog:
+    __slots__ = ('registers',)
+
+    def __init__(self):
+        self.registers = bytearray(REGISTERS)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = h >> (_HASH_BITS - PRECISION)
+        rest = h & ((1 << (_HASH_BITS - PRECISION)) - 1)
+        rank = _HASH_BITS - PRECISION - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        histogram = [self.registers.count(rank) for rank in range(_MAX_RANK + 1)]
+        if histogram[0] == REGISTERS:
+            return 0
+        z = REGISTERS * _tau(1 - histogram[_MAX_RANK] / REGISTERS)
+        for rank in range(_MAX_RANK - 1, 0, -1):
+            z = 0.5 * (z + histogram[rank])
+        z += REGISTERS * _sigma(histogram[0] / REGISTERS)
+        return round(_ALPHA_INF * REGISTERS * REGISTERS / z)
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.registers), 6)
+
+
+def sketches_from_tour_views(apps, schema_editor):
+    """Rebuild the view buckets and viewer sketches from the TourView dedupe rows."""
+    Tour = apps.get_model('tours', 'Tour')
+    TourView = apps.get_model('tours', 'TourView')
+    Analytics = apps.get_model('analytics', 'Analytics')
+    TourDailyStats = apps.get_model('analytics', 'TourDailyStats')
+    TourHourlyStats = apps.get_model('analytics', 'TourHourlyStats')
+    RollupWatermark = apps.get_model('analytics', 'RollupWatermark')
+
+    TourDailyStats.objects.all().delete()
+    TourHourlyStats.objects.all().delete()
+    RollupWatermark.objects.filter(name='tour-views').delete()
+
+    tour_ids = TourView.objects.order_by().values_list('tour_id', flat=True).distinct()
+    for tour_id in tour_ids.iterator():
+        overall, daily = HyperLogLog(), defaultdict(HyperLogLog)
+        daily_views, hourly_views = Counter(), Counter()
+        rows = TourView.objects.filter(tour_id=tour_id).values_list('viewer_id', 'ip_address', 'viewed_at')
+        for viewer_id, ip_address, viewed_at in rows.iterator(chunk_size=2000):
+            key = f'u:{viewer_id}' if viewer_id is not None else f'ip:{ip_address}'
+            day = timezone.localtime(viewed_at).date()
+            overall.add(key)
+            daily[day].add(key)
+            daily_views[day] += 1
+            hourly_views[viewed_at.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)] += 1
+
+        TourDailyStats.objects.bulk_create(
+            TourDailyStats(tour_id=tour_id, day=day, views=daily_views[day], viewers=sketch.count(),
+                           sketch=sketch.to_bytes())
+            for day, sketch in daily.items()
+        )
+        TourHourlyStats.objects.bulk_create(
+            TourHourlyStats(tour_id=tour_id, hour=hour, views=views) for hour, views in hourly_views.items()
+        )
+        analytics, _ = Analytics.objects.get_or_create(tour_id=tour_id)
+        analytics.viewer_sketch = overall.to_bytes()
+        analytics.unique_viewers = overall.count()
+        analytics.total_views = Tour.objects.filter(pk=tour_id).values_list('view_count', flat=True).get()
+        analytics.save(update_fields=['viewer_sketch', 'unique_viewers', 'total_views'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0008_recording_event_chunks'),
+        ('analytics', '0002_step_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analytics',
+            name='viewer_sketch',
+            field=models.BinaryField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tourdailystats',
+            name='sketch',
+            field=models.BinaryField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tourdailystats',
+            name='views',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RenameField(
+            model_name='tourhourlystats',
+            old_name='viewers',
+            new_name='views',
+        ),
+        migrations.RunPython(sketches_from_tour_views, migrations.RunPython.noop),
+    ]
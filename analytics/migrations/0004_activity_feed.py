@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 14:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0009_delete_tourview'),
+        ('analytics', '0003_viewer_sketches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitylog',
+            name='tour_title',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='tour',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activities', to='tours.tour'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['user', '-timestamp'], name='analytics_a_user_id_2d95e4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['timestamp'], name='analytics_a_timesta_3100e5_idx'),
+        ),
+    ]
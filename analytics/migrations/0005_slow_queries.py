@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_activity_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=16, unique=True)),
+                ('sql', models.TextField()),
+                ('params_fingerprint', models.CharField(blank=True, max_length=16)),
+                ('view', models.CharField(blank=True, max_length=200)),
+                ('location', models.CharField(blank=True, max_length=300)),
+                ('plan', models.TextField(blank=True)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,17 +1,81 @@
 from django.db import models
 from django.contrib.auth import get_user_model
-from tours.models import Tour
+from django.utils import timezone
+from tours.models import Tour, TourStep
 
 User = get_user_model()
 
 class Analytics(models.Model):
     tour = models.OneToOneField(Tour, on_delete=models.CASCADE, related_name='analytics')
     total_views = models.IntegerField(default=0)
+    # Estimated from viewer_sketch, an all-time HyperLogLog (analytics/hll.py).
     unique_viewers = models.IntegerField(default=0)
+    viewer_sketch = models.BinaryField(null=True, editable=False)
     avg_completion_rate = models.FloatField(default=0.0)
+    # Player sessions that showed the first step / completed the last one.
+    starts = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+
+class RollupWatermark(models.Model):
+    """The last source row folded into the rollups, per rollup stream."""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class TourDailyStats(models.Model):
+    """Views and unique viewers per tour per day (in TIME_ZONE).
+
+    ``sketch`` is the day's HyperLogLog of viewers; sketches merge across days
+    and tours, ``viewers`` is its estimate cached for time-series queries.
+    """
+    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    viewers = models.PositiveIntegerField(default=0)
+    sketch = models.BinaryField(null=True, editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['tour', 'day'], name='unique_daily_stats_per_tour')]
+        indexes = [models.Index(fields=['day'])]
+
+
+class TourHourlyStats(models.Model):
+    """Views per tour per hour (start of the hour, UTC)."""
+    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='hourly_stats')
+    hour = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['tour', 'hour'], name='unique_hourly_stats_per_tour')]
+        indexes = [models.Index(fields=['hour'])]
+
+
+class StepEvent(models.Model):
+    """Append-only step-progress events reported by the tour player."""
+    SHOWN = 1
+    COMPLETED = 2
+    DISMISSED = 3
+    KIND_CHOICES = [
+        (SHOWN, 'Step shown'),
+        (COMPLETED, 'Step completed'),
+        (DISMISSED, 'Tour dismissed'),
+    ]
+
+    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='step_events')
+    # No database constraint: a step deleted while its events are in flight
+    # must not fail the whole batch.
+    step = models.ForeignKey(TourStep, on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+                             related_name='+')
+    session = models.CharField(max_length=64)
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    occurred_at = models.DateTimeField()
+    received_at = models.DateTimeField()
+
+
 class ActivityLog(models.Model):
     ACTION_CHOICES = [
         ('created', 'Created Tour'),
@@ -22,16 +86,21 @@ class ActivityLog(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
-    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='activities', null=True, blank=True)
+    tour = models.ForeignKey(Tour, on_delete=models.SET_NULL, related_name='activities', null=True, blank=True)
+    # Kept so the feed still reads well after the tour is deleted.
+    tour_title = models.CharField(max_length=200, blank=True)
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', '-timestamp']),
+            models.Index(fields=['timestamp']),
+        ]
     
     @property 
     def time_ago(self):
-        from django.utils import timezone
         diff = timezone.now() - self.timestamp
         if diff.days > 0:
             return f"{diff.days} days ago"
@@ -40,4 +109,22 @@ class ActivityLog(models.Model):
             return f"{hours} hours ago"
         else:
             minutes = diff.seconds // 60
-            return f"{minutes} minutes ago"
\ No newline at end of file
+            return f"{minutes} minutes ago"
+
+class SlowQuery(models.Model):
+    """Queries slower than SLOW_QUERY_THRESHOLD_MS, one row per normalized statement (analytics/slow_queries.py)."""
+    fingerprint = models.CharField(max_length=16, unique=True)
+    # Literals and parameters replaced by ?, so no user data is kept.
+    sql = models.TextField()
+    params_fingerprint = models.CharField(max_length=16, blank=True)
+    view = models.CharField(max_length=200, blank=True)
+    location = models.CharField(max_length=300, blank=True)
+    plan = models.TextField(blank=True)
+    count = models.PositiveBigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.fingerprint} ({self.count}x, {self.total_ms:.0f}ms)"
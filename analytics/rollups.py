@@ -0,0 +1,273 @@
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from tours.models import Tour, TourStep
+from tours.stats import invalidate_dashboard_stats
+
+from .hll import HyperLogLog
+from .models import Analytics, RollupWatermark, StepEvent, TourDailyStats, TourHourlyStats
+
+STEP_EVENTS = "step-events"
+GRANULARITIES = {
+    "day": (TourDailyStats, "day", timedelta(days=1), ("views", "viewers")),
+    "hour": (TourHourlyStats, "hour", timedelta(hours=1), ("views",)),
+}
+MAX_POINTS = 1000
+
+
+def hour_bucket(moment):
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment):
+    return timezone.localtime(moment).date()
+
+
+def _next_batch(stream, queryset, fields, batch_size):
+    """Rows of ``queryset`` past ``stream``'s watermark, as ``values_list(*fields)``.
+
+    ``fields`` must start with ``pk`` and end with a server-side timestamp.
+    The batch stops at the first row younger than the settle period, since a
+    transaction holding a lower pk may not have committed yet.
+    """
+    watermark, _ = RollupWatermark.objects.get_or_create(name=stream)
+    rows = list(
+        queryset.filter(pk__gt=watermark.last_id)
+        .order_by("pk")
+        .values_list(*fields)[:batch_size or settings.ANALYTICS_ROLLUP_BATCH_SIZE]
+    )
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYTICS_ROLLUP_SETTLE_SECONDS)
+    for index, row in enumerate(rows):
+        if row[-1] > cutoff:
+            return watermark, rows[:index]
+    return watermark, rows
+
+
+def _claim(watermark, rows):
+    # Only moves if nobody else advanced the watermark since we read it, so
+    # concurrent runners can't fold the same rows twice.
+    return RollupWatermark.objects.filter(name=watermark.name, last_id=watermark.last_id).update(
+        last_id=rows[-1][0], updated_at=timezone.now()
+    )
+
+
+def _process(stream, queryset, fields, apply, batch_size=None):
+    watermark, rows = _next_batch(stream, queryset, fields, batch_size)
+    if not rows:
+        return 0
+    with transaction.atomic():
+        if not _claim(watermark, rows):
+            return 0
+        creators = apply(rows)
+        transaction.on_commit(lambda: invalidate_dashboard_stats(*creators))
+    return len(rows)
+
+
+def rollup_step_events(batch_size=None):
+    """Fold one batch of new StepEvents into the completion counters; returns rows processed."""
+    fields = ("pk", "tour_id", "step_id", "session", "kind", "received_at")
+    return _process(STEP_EVENTS, StepEvent.objects, fields, _apply_step_events, batch_size)
+
+
+def visitor_key(viewer_id, ip_address):
+    """What counts as one viewer: the account if signed in, otherwise the IP."""
+    return f"u:{viewer_id}" if viewer_id is not None else f"ip:{ip_address}"
+
+
+def _locked_rows(model, field, keys):
+    """Rows of a bucket table for ``(tour_id, bucket)`` keys, created if missing and locked."""
+    model.objects.bulk_create(
+        [model(tour_id=tour_id, **{field: bucket}) for tour_id, bucket in keys],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    rows = model.objects.select_for_update().filter(
+        tour_id__in={tour_id for tour_id, _ in keys}, **{f"{field}__in": {bucket for _, bucket in keys}}
+    )
+    return {(row.tour_id, getattr(row, field)): row for row in rows if (row.tour_id, getattr(row, field)) in keys}
+
+
+def record_views(views):
+    """Add flushed views to the hourly/daily buckets, the viewer sketches and Analytics.
+
+    ``views`` is a list of ``(tour_id, visitor_key, viewed_at)`` for existing
+    tours. Call inside a transaction: the rows are locked for the
+    read-merge-write of their sketches.
+    """
+    hourly_hits, daily_hits, tour_hits = Counter(), Counter(), Counter()
+    daily_keys, tour_keys = defaultdict(set), defaultdict(set)
+    for tour_id, key, viewed_at in views:
+        day = (tour_id, day_bucket(viewed_at))
+        hourly_hits[(tour_id, hour_bucket(viewed_at))] += 1
+        daily_hits[day] += 1
+        daily_keys[day].add(key)
+        tour_hits[tour_id] += 1
+        tour_keys[tour_id].add(key)
+
+    hourly = _locked_rows(TourHourlyStats, "hour", hourly_hits.keys())
+    for key, row in hourly.items():
+        row.views += hourly_hits[key]
+    TourHourlyStats.objects.bulk_update(hourly.values(), ["views"], batch_size=500)
+
+    daily = _locked_rows(TourDailyStats, "day", daily_hits.keys())
+    for key, row in daily.items():
+        sketch = HyperLogLog.from_bytes(row.sketch).update(daily_keys[key])
+        row.views += daily_hits[key]
+        row.sketch, row.viewers = sketch.to_bytes(), sketch.count()
+    TourDailyStats.objects.bulk_update(daily.values(), ["views", "viewers", "sketch"], batch_size=500)
+
+    Analytics.objects.bulk_create([Analytics(tour_id=tour_id) for tour_id in tour_hits], ignore_conflicts=True)
+    totals = list(Analytics.objects.select_for_update().filter(tour_id__in=tour_hits))
+    for row in totals:
+        sketch = HyperLogLog.from_bytes(row.viewer_sketch).update(tour_keys[row.tour_id])
+        row.total_views += tour_hits[row.tour_id]
+        row.viewer_sketch, row.unique_viewers = sketch.to_bytes(), sketch.count()
+    Analytics.objects.bulk_update(totals, ["total_views", "unique_viewers", "viewer_sketch"], batch_size=500)
+
+
+def _tours(tour_ids):
+    return dict(Tour.objects.filter(pk__in=tour_ids).values_list("pk", "creator_id"))
+
+
+def _analytics_for(tour_ids):
+    """Analytics rows for ``tour_ids``, with unsaved ones for tours that have none yet."""
+    rows = {a.tour_id: a for a in Analytics.objects.filter(tour_id__in=tour_ids)}
+    for tour_id in tour_ids:
+        rows.setdefault(tour_id, Analytics(tour_id=tour_id))
+    return rows
+
+
+def _save_analytics(rows, fields):
+    Analytics.objects.bulk_create([a for a in rows.values() if a.pk is None], batch_size=500)
+    Analytics.objects.bulk_update([a for a in rows.values() if a.pk is not None], fields, batch_size=500)
+
+
+def _apply_step_events(rows):
+    """Count tour starts and completions per player session.
+
+    A session starts a tour when it is shown the first step and completes it
+    when it completes the last one. Each counts once per session and batch.
+    """
+    tours = _tours({r[1] for r in rows})
+    first, last = {}, {}
+    steps = TourStep.objects.filter(tour_id__in=tours).order_by("tour_id", "rank")
+    for tour_id, step_id in steps.values_list("tour_id", "pk"):
+        first.setdefault(tour_id, step_id)
+        last[tour_id] = step_id
+
+    started, completed = set(), set()
+    for _, tour_id, step_id, session, kind, _ in rows:
+        if tour_id not in first:
+            continue
+        if kind == StepEvent.SHOWN and step_id == first[tour_id]:
+            started.add((tour_id, session))
+        elif kind == StepEvent.COMPLETED and step_id == last[tour_id]:
+            completed.add((tour_id, session))
+    starts = Counter(tour_id for tour_id, _ in started)
+    completions = Counter(tour_id for tour_id, _ in completed)
+    if not (starts or completions):
+        return set()
+
+    analytics = _analytics_for(starts.keys() | completions.keys())
+    for tour_id, row in analytics.items():
+        row.starts += starts[tour_id]
+        row.completions += completions[tour_id]
+        row.avg_completion_rate = min(1.0, row.completions / row.starts) if row.starts else 0.0
+    _save_analytics(analytics, ["starts", "completions", "avg_completion_rate"])
+    return {tours[tour_id] for tour_id in analytics}
+
+
+def run_rollups():
+    """Drain every pending StepEvent; returns the number of rows processed."""
+    total = 0
+    while processed := rollup_step_events():
+        total += processed
+    return total
+
+
+def _bucket_range(granularity, start, end):
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity!r}")
+    now = timezone.now()
+    if granularity == "day":
+        end = end or day_bucket(now)
+        start = start or end - timedelta(days=29)
+    else:
+        end = hour_bucket(end or now)
+        start = hour_bucket(start or end - timedelta(hours=47))
+    if start > end:
+        raise ValueError("start must not be after end")
+    if (end - start) // GRANULARITIES[granularity][2] + 1 > MAX_POINTS:
+        raise ValueError(f"At most {MAX_POINTS} buckets per request")
+    return start, end
+
+
+def _timeseries(tours, granularity, start, end):
+    """The grouped query behind ``timeseries`` and a function filling its rows into the series."""
+    start, end = _bucket_range(granularity, start, end)
+    model, field, step, metrics = GRANULARITIES[granularity]
+    rows = (
+        model.objects.filter(tour__in=tours, **{f"{field}__range": (start, end)})
+        .values(field)
+        .annotate(**{metric: Sum(metric) for metric in metrics})
+        .order_by()
+    )
+
+    def fill(rows):
+        totals = {row[field]: row for row in rows}
+        series, bucket = [], start
+        while bucket <= end:
+            row = totals.get(bucket, {})
+            series.append({"bucket": bucket, **{metric: row.get(metric, 0) for metric in metrics}})
+            bucket += step
+        return series
+
+    return rows, fill
+
+
+def timeseries(tours, granularity="day", start=None, end=None):
+    """Per-bucket totals across ``tours`` (a Tour queryset), with empty buckets filled in.
+
+    Hourly points have ``views``; daily points add ``viewers``, the sum of each
+    tour's unique viewers that day. ``start`` and ``end`` are inclusive dates
+    for ``day`` and datetimes for ``hour``; they default to the last 30 days or
+    the last 48 hours. Raises ValueError for an unknown granularity or a range
+    over MAX_POINTS buckets.
+    """
+    rows, fill = _timeseries(tours, granularity, start, end)
+    return fill(rows)
+
+
+async def atimeseries(tours, granularity="day", start=None, end=None):
+    """Async ``timeseries``."""
+    rows, fill = _timeseries(tours, granularity, start, end)
+    return fill([row async for row in rows])
+
+
+def unique_viewers(tours, start=None, end=None):
+    """Estimated distinct viewers of ``tours`` between two dates, inclusive.
+
+    Merges the daily sketches one at a time, so memory stays constant however
+    long the range; the estimate carries HyperLogLog's ~1.6% standard error.
+    """
+    start, end = _bucket_range("day", start, end)
+    merged = HyperLogLog()
+    sketches = TourDailyStats.objects.filter(tour__in=tours, day__range=(start, end)).values_list("sketch", flat=True)
+    for data in sketches.iterator(chunk_size=200):
+        merged.merge(HyperLogLog.from_bytes(data))
+    return merged.count()
+
+
+def parse_bucket(value, granularity):
+    """A ``from``/``to`` query value as a date (``day``) or aware datetime (``hour``)."""
+    if value in (None, ""):
+        return None
+    if granularity == "day":
+        return date.fromisoformat(value)
+    moment = datetime.fromisoformat(value) if "T" in value else datetime.combine(date.fromisoformat(value), time())
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
@@ -0,0 +1,223 @@
+"""Slow query log.
+
+Every database connection gets an execute wrapper (installed from
+AnalyticsConfig.ready) that times each statement. Statements slower than
+SLOW_QUERY_THRESHOLD_MS are normalized (literals and parameters become ``?``,
+IN lists collapse) and fingerprinted, then buffered in a spool along with a
+fingerprint of their parameters, the URL name of the request and the first
+project frame on the stack. The first time a process sees a fingerprint it
+also captures the plan with the backend's EXPLAIN prefix (``EXPLAIN`` on
+PostgreSQL, ``EXPLAIN QUERY PLAN`` on SQLite), off the request thread.
+
+``flush_slow_queries`` (run by ``manage.py flush_slow_queries --loop``) folds
+the spool into one SlowQuery row per fingerprint with a count and total time;
+``manage.py slow_queries`` prints the worst.
+"""
+
+import hashlib
+import re
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
+
+from tours.spool import Spool
+
+from .models import SlowQuery
+
+# The request being served, for the URL name; set by SlowQueryMiddleware.
+current_request = ContextVar("slow_query_request", default=None)
+# Set while this module runs its own queries, which are never recorded.
+_suspended = ContextVar("slow_query_suspended", default=False)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_LIST = re.compile(r"(\(\?(?:, \?)*\))(?:, \1)+")
+_SPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+# Wrappers around every query or render; the caller is further out.
+_SKIP_PATHS = {
+    str(Path(__file__).resolve()),
+    str(Path(settings.BASE_DIR, "tourcraft", "middleware.py")),
+    str(Path(settings.BASE_DIR, "tourcraft", "timing.py")),
+}
+_explained = set()
+_executor = None
+
+
+def get_spool():
+    return Spool(settings.SLOW_QUERY_BUFFER_DIR, "slow-queries")
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+    return _executor
+
+
+@contextmanager
+def suspended():
+    """Don't record the queries run inside the block."""
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+def normalize(sql):
+    """``sql`` with literals and parameters as ``?`` and lists of them collapsed."""
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    sql = _VALUES_LIST.sub(r"\1, ...", sql)
+    return _IN_LIST.sub("(...)", sql)
+
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _location():
+    """``path:line in function`` of the innermost project frame outside this module and Django."""
+    base = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if path.startswith(base) and "site-packages" not in path and path not in _SKIP_PATHS:
+            return f"{Path(path).relative_to(base)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ""
+
+
+def _view():
+    request = current_request.get()
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else ""
+
+
+def explain(alias, sql, params):
+    """The plan of ``sql`` on database ``alias`` as text, or "" if it can't be explained."""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return ""
+    connection = connections[alias]
+    try:
+        with suspended(), connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            # PostgreSQL returns one line per row; SQLite's detail is the last column.
+            return "\n".join(str(row[-1]) for row in cursor.fetchall())
+    except Exception as exc:  # a plan is a nice-to-have; never fail over it
+        return f"(EXPLAIN failed: {exc})"
+
+
+def _explain_and_record(alias, sql, params, record):
+    try:
+        record[-1] = explain(alias, sql, params)
+        get_spool().append(record)
+    finally:
+        # Worker threads get their own connections; don't leak them.
+        connections.close_all()
+
+
+class SlowQueryWrapper:
+    """Execute wrapper recording statements slower than SLOW_QUERY_THRESHOLD_MS."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - started) * 1000
+        if duration >= settings.SLOW_QUERY_THRESHOLD_MS and not _suspended.get():
+            self.record(sql, params, many, duration)
+        return result
+
+    def record(self, sql, params, many, duration):
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        record = [
+            key, normalized, fingerprint(repr(params)), _view(), _location(),
+            round(duration, 3), int(time.time()), None,
+        ]
+        if many or key in _explained:
+            get_spool().append(record)
+            return
+        if len(_explained) > 10_000:
+            _explained.clear()
+        _explained.add(key)
+        if settings.SLOW_QUERY_EXPLAIN_ASYNC:
+            get_executor().submit(_explain_and_record, self.alias, sql, params, record)
+        else:
+            record[-1] = explain(self.alias, sql, params)
+            get_spool().append(record)
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver: add the wrapper to a newly opened connection once."""
+    if not any(isinstance(wrapper, SlowQueryWrapper) for wrapper in connection.execute_wrappers):
+        # First in the list: context-managed wrappers pushed around a request
+        # pop the last entry, and the connection may open inside one of them.
+        connection.execute_wrappers.insert(0, SlowQueryWrapper(connection.alias))
+
+
+def flush_slow_queries():
+    """Fold buffered slow queries into SlowQuery rows; returns how many were flushed."""
+    with suspended(), get_spool().batch() as records:
+        if records:
+            _apply(records)
+    return len(records)
+
+
+def _apply(records):
+    groups = defaultdict(list)
+    for record in records:
+        groups[record[0]].append(record)
+
+    for key, group in groups.items():
+        latest = max(group, key=lambda record: record[6])
+        first_seen = datetime.fromtimestamp(min(record[6] for record in group), tz=dt_timezone.utc)
+        last_seen = datetime.fromtimestamp(latest[6], tz=dt_timezone.utc)
+        total = sum(record[5] for record in group)
+        slowest = max(record[5] for record in group)
+        plan = next((record[7] for record in reversed(group) if record[7]), None)
+        sample = {
+            "params_fingerprint": latest[2], "view": latest[3][:200], "location": latest[4][:300],
+            "last_seen": last_seen,
+        }
+        if plan:
+            sample["plan"] = plan
+        updated = SlowQuery.objects.filter(fingerprint=key).update(
+            count=F("count") + len(group), total_ms=F("total_ms") + total,
+            max_ms=Greatest("max_ms", Value(slowest, output_field=FloatField())), **sample,
+        )
+        if not updated:
+            SlowQuery.objects.create(
+                fingerprint=key, sql=latest[1], count=len(group), total_ms=total, max_ms=slowest,
+                first_seen=first_seen, **sample,
+            )
+
+
+def top_offenders(order_by="total", limit=20):
+    ordering = {"total": "-total_ms", "count": "-count", "max": "-max_ms"}[order_by]
+    with suspended():
+        return list(SlowQuery.objects.order_by(ordering, "fingerprint")[:limit])
+
+
+def reset():
+    with suspended():
+        SlowQuery.objects.all().delete()
@@ -0,0 +1,418 @@
+import io
+import json
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tours.models import Tour, TourStep
+from tours.stats import get_dashboard_stats
+from tours.tests import in_other_process
+from tours.view_buffer import apply_views
+
+from . import slow_queries
+from .activity import flush_activity, get_feed, log_activity, prune_activity
+from .hll import STANDARD_ERROR, HyperLogLog
+from .models import (
+    ActivityLog, Analytics, RollupWatermark, SlowQuery, StepEvent, TourDailyStats, TourHourlyStats,
+)
+from .rollups import rollup_step_events, run_rollups, timeseries, unique_viewers
+
+User = get_user_model()
+
+
+class HyperLogLogTests(TestCase):
+    def assertClose(self, estimate, exact):
+        # Three standard errors: a deterministic hash makes these stable, not flaky.
+        self.assertLessEqual(abs(estimate - exact), max(1, 3 * STANDARD_ERROR * exact), (estimate, exact))
+
+    def test_estimates_match_exact_counts(self):
+        for exact in (1, 10, 100, 1000, 5000, 10_000, 50_000, 200_000):
+            sketch = HyperLogLog().update(f'ip:10.{n}' for n in range(exact))
+            self.assertClose(sketch.count(), exact)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_duplicates_are_not_counted(self):
+        sketch = HyperLogLog().update(f'u:{n % 700}' for n in range(20_000))
+        self.assertClose(sketch.count(), 700)
+
+    def test_merged_sketches_estimate_the_union(self):
+        # Overlapping synthetic "days": viewers 0-29999, 20000-49999 and 45000-59999.
+        days = [range(0, 30_000), range(20_000, 50_000), range(45_000, 60_000)]
+        sketches = [HyperLogLog().update(days_viewers) for days_viewers in days]
+        exact = len(set().union(*days))
+
+        merged = HyperLogLog.union(sketches)
+        self.assertClose(merged.count(), exact)
+        # Merging is lossless: identical to sketching every viewer directly.
+        self.assertEqual(merged.registers, HyperLogLog().update(v for d in days for v in d).registers)
+
+    def test_serialization_round_trip(self):
+        sketch = HyperLogLog().update(range(1000))
+        self.assertEqual(HyperLogLog.from_bytes(sketch.to_bytes()).registers, sketch.registers)
+        self.assertEqual(HyperLogLog.from_bytes(None).count(), 0)
+
+
+@override_settings(TIME_ZONE='UTC')
+class ViewRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.tour = Tour.objects.create(title='Onboarding', creator=self.user)
+        self.other = Tour.objects.create(title='Billing', creator=self.user)
+
+    def flush(self, *views):
+        apply_views([[str(tour.pk), viewer_id, ip, at.timestamp()] for tour, viewer_id, ip, at in views])
+
+    def test_flush_fills_buckets_and_sketches(self):
+        day1 = datetime(2026, 10, 1, 9, 15, tzinfo=dt_timezone.utc)
+        day2 = datetime(2026, 10, 2, 8, 0, tzinfo=dt_timezone.utc)
+        self.flush(
+            (self.tour, None, '10.0.0.1', day1),
+            (self.tour, None, '10.0.0.1', day1 + timedelta(minutes=30)),
+            (self.tour, self.user.pk, '10.0.0.2', day1),
+            (self.tour, None, '10.0.0.1', day2),
+            (self.other, None, '10.0.0.1', day2),
+        )
+
+        analytics = Analytics.objects.get(tour=self.tour)
+        self.assertEqual((analytics.total_views, analytics.unique_viewers), (4, 2))
+        self.assertEqual(
+            list(TourDailyStats.objects.filter(tour=self.tour).order_by('day').values_list('day', 'views', 'viewers')),
+            [(date(2026, 10, 1), 3, 2), (date(2026, 10, 2), 1, 1)],
+        )
+        self.assertEqual(TourHourlyStats.objects.get(tour=self.tour, hour=day1.replace(minute=0)).views, 3)
+
+        # The same viewer across both days and both tours counts once.
+        self.assertEqual(unique_viewers(Tour.objects.all(), date(2026, 10, 1), date(2026, 10, 2)), 2)
+        self.assertEqual(unique_viewers(Tour.objects.all(), date(2026, 10, 2), date(2026, 10, 2)), 1)
+
+    def test_later_flushes_merge_into_existing_sketches(self):
+        now = timezone.now()
+        self.flush(*((self.tour, None, f'10.0.{n // 250}.{n % 250}', now) for n in range(1000)))
+        self.flush(*((self.tour, None, f'10.0.{n // 250}.{n % 250}', now) for n in range(500, 1500)))
+
+        analytics = Analytics.objects.get(tour=self.tour)
+        self.assertEqual(analytics.total_views, 2000)
+        self.assertLessEqual(abs(analytics.unique_viewers - 1500), 3 * STANDARD_ERROR * 1500)
+        self.assertEqual(TourDailyStats.objects.get(tour=self.tour).viewers, analytics.unique_viewers)
+
+    def test_dashboard_reads_rollups(self):
+        self.assertEqual(get_dashboard_stats(self.user)['unique_viewers'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flush((self.tour, None, '10.0.0.1', timezone.now()))
+        self.assertEqual(get_dashboard_stats(self.user)['unique_viewers'], 1)
+        self.assertEqual(Tour.objects.with_stats().get(pk=self.tour.pk).unique_viewers, 1)
+
+    def test_timeseries_fills_gaps(self):
+        TourDailyStats.objects.create(tour=self.tour, day=date(2026, 10, 1), views=5, viewers=2)
+        TourDailyStats.objects.create(tour=self.other, day=date(2026, 10, 1), views=1, viewers=1)
+        TourDailyStats.objects.create(tour=self.tour, day=date(2026, 10, 3), views=4, viewers=4)
+
+        series = timeseries(Tour.objects.all(), 'day', date(2026, 10, 1), date(2026, 10, 4))
+        self.assertEqual([(point['views'], point['viewers']) for point in series], [(6, 3), (0, 0), (4, 4), (0, 0)])
+        with self.assertRaises(ValueError):
+            timeseries(Tour.objects.all(), 'day', date(2020, 1, 1), date(2026, 1, 1))
+
+    def test_timeseries_api(self):
+        hour = datetime(2026, 10, 1, 9, tzinfo=dt_timezone.utc)
+        self.flush((self.tour, None, '10.0.0.1', hour), (self.tour, None, '10.0.0.2', hour))
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get(f'/api/tours/{self.tour.pk}/timeseries/',
+                              {'granularity': 'hour', 'from': '2026-10-01T08:00', 'to': '2026-10-01T10:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([point['views'] for point in response.data['series']], [0, 2, 0])
+
+        response = client.get('/api/tours/timeseries/', {'from': '2026-09-30', 'to': '2026-10-01'})
+        self.assertEqual(response.data['unique_viewers'], 2)
+        self.assertEqual([point['viewers'] for point in response.data['series']], [0, 2])
+
+        response = client.get('/api/tours/timeseries/', {'from': '2026-10-01', 'to': '2026-09-01'})
+        self.assertEqual(response.status_code, 400)
+
+        stranger = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        client.force_authenticate(stranger)
+        self.assertEqual(client.get(f'/api/tours/{self.tour.pk}/timeseries/').status_code, 404)
+
+
+@override_settings(ANALYTICS_ROLLUP_SETTLE_SECONDS=0)
+class StepEventTests(TestCase):
+    url = '/analytics/collect/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.tour = Tour.objects.create(title='Onboarding', creator=self.user, status='Published')
+        self.steps = [TourStep.objects.create(tour=self.tour, title=f'Step {n}') for n in (1, 2, 3)]
+
+    def beacon(self, session, events, tour=None):
+        body = json.dumps({'tour': str(tour or self.tour.pk), 'session': session, 'events': events})
+        return self.client.post(self.url, body, content_type='text/plain')
+
+    def test_batch_is_stored_with_one_insert(self):
+        now_ms = int(timezone.now().timestamp() * 1000)
+        events = [{'type': 'shown', 'step': step.pk, 't': now_ms} for step in self.steps]
+        self.beacon('warm', events[:1])  # fills the tour cache
+        with self.assertNumQueries(1):
+            response = self.beacon('abc123', events + [{'type': 'bogus', 'step': self.steps[0].pk}])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Access-Control-Allow-Origin'], '*')
+        self.assertEqual(StepEvent.objects.filter(session='abc123').count(), 3)
+
+    def test_bypasses_session_and_auth(self):
+        self.client.force_login(self.user)
+        response = self.beacon('abc123', [{'type': 'dismissed', 'step': None}])
+        self.assertEqual(response.status_code, 204)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(hasattr(response.wsgi_request, 'user'))
+
+    def test_rejects_bad_batches(self):
+        self.assertEqual(self.beacon('abc123', [], tour=uuid.uuid4()).status_code, 404)
+        self.assertEqual(self.beacon('no spaces!', []).status_code, 400)
+        self.assertEqual(self.client.post(self.url, 'not json', content_type='text/plain').status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        with override_settings(ANALYTICS_COLLECT_MAX_EVENTS=2):
+            self.assertEqual(self.beacon('abc123', [{'type': 'shown'}] * 3).status_code, 400)
+        response = self.client.post(self.url, '{}', content_type='text/plain', CONTENT_LENGTH='lots')
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_published_public_tours_accept_events(self):
+        draft = Tour.objects.create(title='Draft', creator=self.user)
+        private = Tour.objects.create(title='Private', creator=self.user, status='Published', privacy='private')
+        for tour in (draft, private):
+            self.assertEqual(self.beacon('abc123', [{'type': 'shown', 'step': None}], tour=tour.pk).status_code, 404)
+        self.assertFalse(StepEvent.objects.exists())
+
+    def test_client_clock_is_clamped(self):
+        self.beacon('abc123', [{'type': 'shown', 'step': self.steps[0].pk, 't': 10_000}])
+        event = StepEvent.objects.get()
+        self.assertEqual(event.occurred_at, event.received_at)
+
+    def test_rollup_feeds_completion_rate(self):
+        first, last = self.steps[0].pk, self.steps[-1].pk
+        self.beacon('a', [{'type': 'shown', 'step': first}, {'type': 'shown', 'step': first},
+                          {'type': 'completed', 'step': last}])
+        self.beacon('b', [{'type': 'shown', 'step': first}, {'type': 'dismissed', 'step': first}])
+        self.beacon('c', [{'type': 'shown', 'step': first}])
+        self.beacon('d', [{'type': 'shown', 'step': first}, {'type': 'completed', 'step': last}])
+
+        run_rollups()
+        analytics = Analytics.objects.get(tour=self.tour)
+        self.assertEqual((analytics.starts, analytics.completions), (4, 2))
+        self.assertEqual(analytics.avg_completion_rate, 0.5)
+        self.assertEqual(run_rollups(), 0)
+
+    def test_concurrent_runner_loses_the_race(self):
+        self.beacon('a', [{'type': 'shown', 'step': self.steps[0].pk}])
+        RollupWatermark.objects.create(name='step-events', last_id=StepEvent.objects.get().pk)
+        # Another runner already moved the watermark past the rows we read.
+        stale = (RollupWatermark(name='step-events', last_id=0), False)
+        with mock.patch.object(RollupWatermark.objects, 'get_or_create', return_value=stale):
+            self.assertEqual(rollup_step_events(), 0)
+        self.assertFalse(Analytics.objects.exists())
+
+    @override_settings(ANALYTICS_ROLLUP_SETTLE_SECONDS=60)
+    def test_recent_events_wait_for_the_settle_period(self):
+        self.beacon('a', [{'type': 'shown', 'step': self.steps[0].pk}])
+        self.assertEqual(run_rollups(), 0)
+
+    def test_rollup_command(self):
+        self.beacon('a', [{'type': 'shown', 'step': self.steps[0].pk}])
+        out = io.StringIO()
+        call_command('rollup_analytics', stdout=out)
+        self.assertIn('Rolled up 1 events', out.getvalue())
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_collector', requests=5, batch=10, stdout=out)
+        result = json.loads(out.getvalue())
+        self.assertEqual(result['stored'], 50 + 10)
+        self.assertFalse(Tour.objects.filter(title='Collector benchmark').exists())
+
+
+class ActivityFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        buffer_override = override_settings(ACTIVITY_BUFFER_DIR=directory.name)
+        buffer_override.enable()
+        self.addCleanup(buffer_override.disable)
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+
+    def create_tour(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Tour.objects.create(creator=self.user, **{'title': 'Onboarding', **kwargs})
+
+    def flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return flush_activity()
+
+    def test_activity_is_buffered_until_flushed(self):
+        tour = self.create_tour()
+        self.assertFalse(ActivityLog.objects.exists())
+        self.assertEqual(self.flush(), 1)
+        log = ActivityLog.objects.get()
+        self.assertEqual((log.action, log.tour_id, log.tour_title), ('created', tour.pk, 'Onboarding'))
+        self.assertEqual(self.flush(), 0)
+
+    def test_rolled_back_activity_is_not_buffered(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            log_activity(self.user.pk, 'viewed')
+        self.assertEqual(self.flush(), 0)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_publish_is_detected_from_the_loaded_status(self):
+        tour = self.create_tour()
+        tour = Tour.objects.get(pk=tour.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            tour.title = 'Renamed'
+            tour.save()
+            tour.status = 'Published'
+            tour.save()
+            tour.save()
+        self.flush()
+        self.assertEqual(
+            [entry['action'] for entry in get_feed(self.user.pk)],
+            ['updated', 'published', 'updated', 'created'],
+        )
+
+    def test_feed_is_capped_newest_first_and_kept_warm(self):
+        with self.settings(ACTIVITY_FEED_SIZE=3):
+            for n in range(5):
+                self.create_tour(title=f'Tour {n}')
+            self.flush()
+            self.assertEqual([e['tour_title'] for e in get_feed(self.user.pk)], ['Tour 4', 'Tour 3', 'Tour 2'])
+
+            self.create_tour(title='Tour 5')
+            self.flush()
+            with self.assertNumQueries(0):
+                feed = get_feed(self.user.pk)
+            self.assertEqual([e['tour_title'] for e in feed], ['Tour 5', 'Tour 4', 'Tour 3'])
+
+    def test_flushes_in_another_process_refresh_this_ones_feed(self):
+        # flush_activity runs in its own process; the dashboard must show what it flushed.
+        self.create_tour(title='First')
+        self.flush()
+        self.assertEqual(len(get_feed(self.user.pk)), 1)
+        self.create_tour(title='Second')
+        in_other_process(self.flush)
+        self.assertEqual([e['tour_title'] for e in get_feed(self.user.pk)], ['Second', 'First'])
+
+    def test_feed_is_rebuilt_on_a_cache_miss(self):
+        self.create_tour()
+        self.flush()
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(get_feed(self.user.pk)), 1)
+
+    def test_deleted_tour_keeps_its_title(self):
+        tour = self.create_tour(title='Gone soon')
+        self.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            tour.delete()
+        self.flush()
+        self.assertFalse(ActivityLog.objects.filter(tour__isnull=False).exists())
+        self.assertEqual(
+            [(e['action'], e['tour_title']) for e in get_feed(self.user.pk)],
+            [('deleted', 'Gone soon'), ('created', 'Gone soon')],
+        )
+
+    def test_entries_for_deleted_users_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            log_activity(self.user.pk + 1000, 'viewed')
+            log_activity(self.user.pk, 'viewed')
+        self.assertEqual(self.flush(), 2)
+        self.assertEqual(ActivityLog.objects.count(), 1)
+
+    def test_prune_deletes_expired_entries_in_batches(self):
+        old = timezone.now() - timedelta(days=100)
+        ActivityLog.objects.bulk_create(
+            [ActivityLog(user=self.user, action='viewed', timestamp=old) for _ in range(5)]
+            + [ActivityLog(user=self.user, action='viewed')]
+        )
+        with mock.patch.object(ActivityLog.objects, 'filter', wraps=ActivityLog.objects.filter) as filter_:
+            self.assertEqual(prune_activity(90, batch_size=2), 5)
+        # Three batches of deletes, each preceded by a lookup, then an empty lookup.
+        self.assertEqual(filter_.call_count, 7)
+        self.assertEqual(ActivityLog.objects.count(), 1)
+
+    def test_commands(self):
+        self.create_tour()
+        out = io.StringIO()
+        call_command('flush_activity', stdout=out)
+        self.assertIn('Flushed 1 activities', out.getvalue())
+        out = io.StringIO()
+        call_command('prune_activity', days=0, pause=0, stdout=out)
+        self.assertIn('Deleted 1 activities', out.getvalue())
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_ASYNC=False,
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        buffer_override = override_settings(SLOW_QUERY_BUFFER_DIR=directory.name)
+        buffer_override.enable()
+        self.addCleanup(buffer_override.disable)
+        slow_queries._explained.clear()
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.client.force_login(self.user)
+
+    def test_normalize(self):
+        self.assertEqual(
+            slow_queries.normalize("SELECT * FROM t WHERE id IN (%s, %s,\n %s) AND name = 'o''brien' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+        self.assertEqual(slow_queries.normalize('INSERT INTO "t2" ("a", "b") VALUES (%s, %s), (%s, %s), (%s, %s)'),
+                         'INSERT INTO "t2" ("a", "b") VALUES (...), ...')
+
+    def test_queries_are_deduplicated_with_view_location_and_plan(self):
+        self.client.get(reverse('tours:saved_tours'))
+        self.client.get(reverse('tours:saved_tours'))
+        slow_queries.flush_slow_queries()
+        query = SlowQuery.objects.get(view='tours:saved_tours', sql__contains='"tours_savedtour"')
+        self.assertEqual(query.count, 2)
+        self.assertIn('WHERE "tours_savedtour"."user_id" = ?', query.sql)
+        self.assertTrue(query.location.startswith('tours/views.py:'), query.location)
+        self.assertTrue(query.location.endswith(' in saved_tours_view'), query.location)
+        self.assertRegex(query.plan, r'SCAN|SEARCH')
+        self.assertGreater(query.total_ms, 0)
+        self.assertGreaterEqual(query.total_ms, query.max_ms)
+        self.assertEqual(SlowQuery.objects.filter(fingerprint=query.fingerprint).count(), 1)
+
+    def test_command_prints_top_offenders(self):
+        self.client.get(reverse('tours:saved_tours'))
+        out = io.StringIO()
+        call_command('slow_queries', '--limit', '50', stdout=out)
+        self.assertIn('view: tours:saved_tours', out.getvalue())
+        self.assertIn('| ', out.getvalue())
+        call_command('slow_queries', '--reset', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('slow_queries', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'No slow queries recorded')
+
+    def test_flush_command_empties_the_buffer(self):
+        self.client.get(reverse('tours:saved_tours'))
+        out = io.StringIO()
+        call_command('flush_slow_queries', stdout=out)
+        self.assertRegex(out.getvalue(), r'^Flushed [1-9]\d* slow queries')
+        self.assertEqual(slow_queries.get_spool().depth(), 0)
+        self.assertTrue(SlowQuery.objects.filter(view='tours:saved_tours').exists())
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=60_000)
+    def test_fast_queries_are_not_recorded(self):
+        slow_queries.flush_slow_queries()  # setUp ran under the class-wide threshold of 0
+        self.client.get(reverse('tours:saved_tours'))
+        self.assertEqual(slow_queries.flush_slow_queries(), 0)
@@ -0,0 +1,27 @@
+"""gunicorn settings, read from the working directory by ``gunicorn tourcraft.wsgi:application``.
+
+Sets up multiprocess metrics (tourcraft/metrics.py): every worker writes its
+samples to memory-mapped files in PROMETHEUS_MULTIPROC_DIR and /metrics adds
+them up. The directory is emptied when the server starts so counts from a
+previous run don't linger.
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+# Before any worker imports prometheus_client, which reads it once.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", str(Path(__file__).resolve().parent / "var" / "metrics")
+)
+
+
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
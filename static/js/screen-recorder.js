@@ -1,7 +1,102 @@
+// Streams MediaRecorder chunks to the server while recording.
+// Each chunk is sent with its byte offset; after a network error the
+// uploader asks the server how much it has and resumes from there.
+class RecordingUploader {
+    constructor(baseURL = '/tours/recordings/') {
+        this.baseURL = baseURL;
+        this.recordingId = null;
+        this.offset = 0;
+        this.queue = [];
+        this.draining = null;
+    }
+
+    getCSRFToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : document.querySelector('[name=csrfmiddlewaretoken]')?.value;
+    }
+
+    async request(url, options = {}) {
+        const response = await fetch(url, {
+            credentials: 'same-origin',
+            ...options,
+            headers: { 'X-CSRFToken': this.getCSRFToken(), ...(options.headers || {}) }
+        });
+        const data = await response.json().catch(() => ({}));
+        return { response, data };
+    }
+
+    async start(title, mimeType) {
+        const { response, data } = await this.request(this.baseURL, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ title, mime_type: mimeType })
+        });
+        if (!response.ok) throw new Error(`Could not start recording upload (${response.status})`);
+        this.recordingId = data.id;
+        this.offset = 0;
+        return data;
+    }
+
+    uploadURL() {
+        return `${this.baseURL}${this.recordingId}/upload/`;
+    }
+
+    enqueue(blob) {
+        this.queue.push(blob);
+        if (!this.draining) {
+            this.draining = this.drain().finally(() => { this.draining = null; });
+        }
+        return this.draining;
+    }
+
+    async drain() {
+        while (this.queue.length) {
+            await this.sendChunk(this.queue[0]);
+            this.queue.shift();  // only drop the chunk once the server has it
+        }
+    }
+
+    async sendChunk(blob) {
+        const chunkStart = this.offset;
+        let attempt = 0;
+        while (this.offset < chunkStart + blob.size) {
+            try {
+                const { response, data } = await this.request(this.uploadURL(), {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Upload-Offset': String(this.offset)
+                    },
+                    body: blob.slice(this.offset - chunkStart)
+                });
+                if (response.ok || response.status === 409) {
+                    // 409 means our offset was stale; the server tells us the real one.
+                    this.offset = data.offset;
+                    attempt = 0;
+                    continue;
+                }
+                throw new Error(`Upload failed (${response.status})`);
+            } catch (error) {
+                attempt += 1;
+                await new Promise(resolve => setTimeout(resolve, Math.min(30000, 500 * 2 ** attempt)));
+                const { response, data } = await this.request(this.uploadURL()).catch(() => ({}));
+                if (response && response.ok) this.offset = data.offset;
+            }
+        }
+    }
+
+    async finish() {
+        while (this.draining) await this.draining;
+        const { response, data } = await this.request(`${this.baseURL}${this.recordingId}/finalize/`, { method: 'POST' });
+        if (!response.ok) throw new Error(`Could not finalize recording (${response.status})`);
+        return data;
+    }
+}
+
 class ScreenRecorder {
     constructor() {
         this.mediaRecorder = null;
-        this.recordedChunks = [];
+        this.uploader = null;
         this.isRecording = false;
         this.stream = null;
         this.recordingStartTime = null;
@@ -21,19 +116,21 @@ class ScreenRecorder {
             });
 
             // Create MediaRecorder
-            this.mediaRecorder = new MediaRecorder(this.stream, {
-                mimeType: 'video/webm;codecs=vp9'
-            });
+            const mimeType = 'video/webm;codecs=vp9';
+            this.mediaRecorder = new MediaRecorder(this.stream, { mimeType });
 
-            // Set up event handlers
+            this.uploader = new RecordingUploader();
+            await this.uploader.start(`Screen recording ${new Date().toLocaleString()}`, mimeType);
+
+            // Chunks go straight to the server instead of piling up in memory
             this.mediaRecorder.ondataavailable = (event) => {
                 if (event.data.size > 0) {
-                    this.recordedChunks.push(event.data);
+                    this.uploader.enqueue(event.data);
                 }
             };
 
             this.mediaRecorder.onstop = () => {
-                this.createRecordingBlob();
+                this.finishUpload();
             };
 
             // Start recording
@@ -66,50 +163,22 @@ class ScreenRecorder {
         }
     }
 
-    createRecordingBlob() {
-        const blob = new Blob(this.recordedChunks, { type: 'video/webm' });
-        const url = URL.createObjectURL(blob);
-        
-        // Create download link
-        const a = document.createElement('a');
-        a.style.display = 'none';
-        a.href = url;
-        a.download = `screen-recording-${Date.now()}.webm`;
-        document.body.appendChild(a);
-        a.click();
-        
-        // Clean up
-        setTimeout(() => {
-            document.body.removeChild(a);
-            window.URL.revokeObjectURL(url);
-        }, 100);
-        
-        // Store recording data for tour
-        this.saveRecordingData(blob);
-    }
+    async finishUpload() {
+        try {
+            const recording = await this.uploader.finish();
 
-    async saveRecordingData(blob) {
-        // Convert blob to base64 for storage
-        const reader = new FileReader();
-        reader.onloadend = () => {
-            const base64data = reader.result;
-            
-            // Store in localStorage for now (in production, send to server)
+            // Trigger event for tour integration
             const recordingData = {
-                id: Date.now(),
+                id: recording.id,
                 timestamp: new Date().toISOString(),
                 duration: this.recordingDuration,
-                data: base64data,
-                size: blob.size
+                size: recording.offset,
+                status: recording.status
             };
-            
-            localStorage.setItem('screenRecording', JSON.stringify(recordingData));
-            
-            // Trigger event for tour integration
-            const event = new CustomEvent('recordingSaved', { detail: recordingData });
-            document.dispatchEvent(event);
-        };
-        reader.readAsDataURL(blob);
+            document.dispatchEvent(new CustomEvent('recordingSaved', { detail: recordingData }));
+        } catch (error) {
+            console.error('Error uploading recording:', error);
+        }
     }
 
     updateRecordingUI(isRecording) {
@@ -162,4 +231,5 @@ window.screenRecorder = new ScreenRecorder();
 // Export for use in other modules
 if (typeof module !== 'undefined' && module.exports) {
     module.exports = ScreenRecorder;
+    module.exports.RecordingUploader = RecordingUploader;
 }
@@ -0,0 +1,61 @@
+// Batched step-progress reporting for the tour player.
+//
+//   const tracker = new StepTracker(tourId);
+//   tracker.shown(stepId); tracker.completed(stepId); tracker.dismissed(stepId);
+//
+// Events are queued and sent with navigator.sendBeacon every few seconds and
+// when the page is hidden, so reporting never delays the player.
+class StepTracker {
+    constructor(tourId, options = {}) {
+        this.tourId = tourId;
+        this.endpoint = options.endpoint || '/analytics/collect/';
+        this.maxBatch = options.maxBatch || 50;
+        this.session = StepTracker.sessionId();
+        this.queue = [];
+        this.timer = setInterval(() => this.flush(), options.interval || 5000);
+
+        const flushOnHide = () => {
+            if (document.visibilityState === 'hidden') this.flush();
+        };
+        document.addEventListener('visibilitychange', flushOnHide);
+        window.addEventListener('pagehide', () => this.flush());
+    }
+
+    static sessionId() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID().replace(/-/g, '');
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    shown(stepId) { this.track('shown', stepId); }
+    completed(stepId) { this.track('completed', stepId); }
+    dismissed(stepId = null) { this.track('dismissed', stepId); this.flush(); }
+
+    track(type, stepId) {
+        this.queue.push({ type, step: stepId, t: Date.now() });
+        if (this.queue.length >= this.maxBatch) this.flush();
+    }
+
+    flush() {
+        while (this.queue.length) {
+            const events = this.queue.splice(0, this.maxBatch);
+            // text/plain keeps the beacon a "simple" request: no CORS preflight.
+            const body = new Blob(
+                [JSON.stringify({ tour: this.tourId, session: this.session, events })],
+                { type: 'text/plain' }
+            );
+            if (!(navigator.sendBeacon && navigator.sendBeacon(this.endpoint, body))) {
+                fetch(this.endpoint, { method: 'POST', body, keepalive: true, credentials: 'omit' }).catch(() => {});
+            }
+        }
+    }
+
+    stop() {
+        clearInterval(this.timer);
+        this.flush();
+    }
+}
+
+// Export for use in other modules
+if (typeof module !== 'undefined' && module.exports) {
+    module.exports = StepTracker;
+}
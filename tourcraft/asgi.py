@@ -2,6 +2,8 @@
 ASGI config for tourcraft project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests resolve against ASGI_URLCONF, which serves the read-heavy endpoints
+from async views (see tourcraft/urls_asgi.py).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -9,8 +11,20 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tourcraft.settings')
 
-application = get_asgi_application()
+
+class AsyncReadPathHandler(ASGIHandler):
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = settings.ASGI_URLCONF
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = AsyncReadPathHandler()
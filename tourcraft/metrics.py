@@ -0,0 +1,92 @@
+"""Prometheus metrics, served at /metrics in the Prometheus text format.
+
+Under gunicorn every worker process records into its own memory-mapped files
+in PROMETHEUS_MULTIPROC_DIR, and a scrape adds up all of them, so the numbers
+cover the whole server whichever worker answers (see gunicorn.conf.py, which
+sets the directory up). Without that variable, as under runserver and in
+tests, the metrics live in the process.
+"""
+
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# Not in prometheus_client's default registry: in multiprocess mode the
+# values are read back from the files instead.
+_metrics = []
+
+
+def _register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+REQUEST_LATENCY = _register(Histogram(
+    "tourcraft_request_duration_seconds", "Time to answer a request, by URL name.",
+    ["view", "method"], registry=None,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+))
+REQUESTS = _register(Counter(
+    "tourcraft_requests", "Requests answered, by URL name and status class.",
+    ["view", "method", "status"], registry=None,
+))
+REQUEST_QUERIES = _register(Histogram(
+    "tourcraft_request_queries", "SQL queries run by a request, by URL name.",
+    ["view"], registry=None,
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+))
+PAYLOAD_CACHE = _register(Counter(
+    "tourcraft_payload_cache", "Tour payload cache lookups (tours/payloads.py).",
+    ["kind", "result"], registry=None,
+))
+
+
+def payload_cache(kind, hit):
+    PAYLOAD_CACHE.labels(kind, "hit" if hit else "miss").inc()
+
+
+class _ProcessCollector:
+    def collect(self):
+        for metric in _metrics:
+            yield from metric.collect()
+
+
+class _BufferCollector:
+    """Records waiting in the spool buffers, read from disk at scrape time."""
+
+    def collect(self):
+        from analytics.activity import get_spool as activity_spool
+        from tours.view_buffer import get_spool as view_spool
+
+        depth = GaugeMetricFamily(
+            "tourcraft_buffer_pending_records", "Records buffered on disk and not flushed yet.", labels=["buffer"]
+        )
+        depth.add_metric(["tour_views"], view_spool().depth())
+        depth.add_metric(["activity"], activity_spool().depth())
+        yield depth
+
+
+def render():
+    """The current metrics in the Prometheus text format."""
+    registry = CollectorRegistry()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_ProcessCollector())
+    registry.register(_BufferCollector())
+    return generate_latest(registry)
+
+
+@never_cache
+@require_safe
+def metrics_view(request):
+    """Metrics for staff users and for scrapers whose address is in METRICS_ALLOWED_IPS"""
+    # REMOTE_ADDR, not X-Forwarded-For: the allowlist must not be spoofable.
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,235 @@
+import cProfile
+import json
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import metrics, timing
+
+logger = logging.getLogger("tourcraft.query_budget")
+profile_logger = logging.getLogger("tourcraft.profile")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Declare the most SQL queries a view may run in one request.
+
+    Works on function views, DRF viewset actions and viewset classes; views
+    without a declared budget get QUERY_BUDGET_DEFAULT. Budgets are enforced
+    by QueryBudgetMiddleware.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def _declared_budget(view_func, method):
+    budget = getattr(view_func, "query_budget", None)
+    # DRF routers hand Django a function with the viewset class and the
+    # method -> action mapping attached; the budget sits on the action or
+    # on the viewset class.
+    cls = getattr(view_func, "cls", None)
+    if budget is None and cls is not None:
+        action = getattr(view_func, "actions", None) or {}
+        handler = getattr(cls, action.get(method.lower(), ""), None)
+        budget = getattr(handler, "query_budget", getattr(cls, "query_budget", None))
+    return budget
+
+
+class QueryCounter:
+    """execute_wrapper that counts the queries run through it and the time they take."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+
+
+@contextmanager
+def counting_queries(request):
+    """The request's QueryCounter, installed by the outermost middleware that asks for one.
+
+    Metrics, Server-Timing and query budgets all need the request's queries;
+    sharing one counter means each query goes through one wrapper, not three.
+    """
+    counter = getattr(request, "query_counter", None)
+    if counter is not None:
+        yield counter
+        return
+    counter = request.query_counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+class QueryBudgetMiddleware:
+    """Count the SQL each request runs and act when it goes over the view's budget.
+
+    QUERY_BUDGET_ACTION is ``"log"`` (a warning naming the view and the
+    counts) or ``"raise"`` (QueryBudgetExceeded, for tests and development).
+    Counting goes through an execute_wrapper, so it works with DEBUG off.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with counting_queries(request) as counter:
+            response = self.get_response(request)
+        budget = getattr(request, "query_budget", None)
+        if budget is not None and counter.count > budget:
+            match = request.resolver_match
+            message = (
+                f"{request.method} {request.path} ({match.view_name if match else 'unresolved'}) "
+                f"ran {counter.count} queries, over its budget of {budget}"
+            )
+            if settings.QUERY_BUDGET_ACTION == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = _declared_budget(view_func, request.method)
+        request.query_budget = budget if budget is not None else settings.QUERY_BUDGET_DEFAULT
+
+
+class ServerTimingMiddleware:
+    """Report where each request's time went in a ``Server-Timing`` header.
+
+    Adds database time and query count, template render time (see
+    tourcraft/timing.py), view time and the total, all in milliseconds.
+    Listed near the top of MIDDLEWARE so the middleware below it is included.
+
+    Sampling mode profiles 1 in PROFILE_SAMPLE_RATE requests, and requests from
+    staff users that send the PROFILE_HEADER header, with cProfile. Each profile
+    is written to PROFILE_DIR as ``.prof`` (open with pstats or snakeviz) next
+    to a ``.json`` file naming the URL, user, status and timings.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SERVER_TIMING:
+            return self.get_response(request)
+        timings = timing.RequestTimings()
+        token = timing.current.set(timings)
+        try:
+            with counting_queries(request) as counter:
+                response = self.get_response(request)
+        finally:
+            timing.current.reset(token)
+            if timings.profiler is not None:
+                timings.profiler.disable()
+        now = time.perf_counter()
+        if timings.view_started is not None:
+            timings.view = now - timings.view_started
+        total = now - timings.started
+
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"',
+            f"tpl;dur={timings.template * 1000:.1f}",
+            f"view;dur={timings.view * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+        if timings.profiler is not None:
+            self.save_profile(request, response, timings.profiler, {
+                "duration_ms": round(total * 1000, 1),
+                "view_ms": round(timings.view * 1000, 1),
+                "template_ms": round(timings.template * 1000, 1),
+                "db_ms": round(counter.duration * 1000, 1),
+                "queries": counter.count,
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = timing.current.get()
+        if timings is None:
+            return None
+        timings.view_started = time.perf_counter()
+        if self.should_profile(request):
+            timings.profiler = cProfile.Profile()
+            timings.profiler.enable()
+        return None
+
+    def should_profile(self, request):
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate and random.randrange(rate) == 0:
+            return True
+        # Checked here rather than in __call__: the user is only known once
+        # AuthenticationMiddleware has run.
+        return settings.PROFILE_HEADER in request.headers and request.user.is_staff
+
+    def save_profile(self, request, response, profiler, timings):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        match = request.resolver_match
+        url_name = match.view_name if match else "unresolved"
+        started = timezone.now()
+        stem = f"{started:%Y%m%dT%H%M%S%f}-{url_name.replace(':', '.')}-{uuid.uuid4().hex[:8]}"
+        profiler.dump_stats(directory / f"{stem}.prof")
+        user = request.user if request.user.is_authenticated else None
+        (directory / f"{stem}.json").write_text(json.dumps({
+            "method": request.method,
+            "path": request.get_full_path(),
+            "url_name": url_name,
+            "user_id": user.pk if user else None,
+            "username": user.get_username() if user else None,
+            "status": response.status_code,
+            "started_at": started.isoformat(),
+            **timings,
+        }, indent=2))
+        profile_logger.info("Profiled %s %s into %s.prof", request.method, request.path, stem)
+        self.prune(directory)
+
+    def prune(self, directory):
+        """Keep the newest PROFILE_MAX_FILES profiles."""
+        profiles = sorted(directory.glob("*.prof"))
+        for old in profiles[:-settings.PROFILE_MAX_FILES] if settings.PROFILE_MAX_FILES else ():
+            old.unlink(missing_ok=True)
+            old.with_suffix(".json").unlink(missing_ok=True)
+
+
+class MetricsMiddleware:
+    """Record each request's latency, status and query count in tourcraft.metrics, by URL name.
+
+    Requests answered before URL resolution (static files, pre-rendered
+    tours, beacons) and 404s are recorded under ``unresolved``.
+    """
+
+    METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with counting_queries(request) as counter:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        # Methods come from the client; keep the label set bounded.
+        method = request.method if request.method in self.METHODS else "other"
+        metrics.REQUEST_LATENCY.labels(view, method).observe(elapsed)
+        metrics.REQUESTS.labels(view, method, f"{response.status_code // 100}xx").inc()
+        metrics.REQUEST_QUERIES.labels(view).observe(counter.count)
+        return response
@@ -0,0 +1,92 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+ORDERING = ("-created_at", "-pk")
+
+
+def encode_cursor(obj):
+    position = [obj.created_at.isoformat(), str(obj.pk)]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, model):
+    """The ``(created_at, pk)`` position in ``token``; raises ValueError if it is malformed."""
+    try:
+        created_at, pk = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return datetime.fromisoformat(created_at), model._meta.pk.to_python(pk)
+    except (TypeError, ValueError, ValidationError) as exc:
+        raise ValueError(f"Invalid cursor: {token!r}") from exc
+
+
+def keyset_page(queryset, cursor, size):
+    """One page of ``queryset``, newest first, and the cursor of the next page (or None).
+
+    Pages are found by seeking past the last row seen on ``(created_at, pk)``
+    rather than by OFFSET, so with an index on those columns every page costs
+    the same as the first, and nothing is counted. ``cursor`` is None for the
+    first page; raises ValueError for a cursor that can't be decoded.
+    """
+    queryset = queryset.order_by(*ORDERING)
+    if cursor:
+        created_at, pk = decode_cursor(cursor, queryset.model)
+        # Equivalent to (created_at, pk) < (cursor), written so the first term
+        # bounds the index range scan.
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(pk__lt=pk), created_at__lte=created_at)
+    rows = list(queryset[: size + 1])
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on ``(created_at, pk)`` for viewsets over models with ``created_at``.
+
+    Responses are ``{"next": <url or null>, "results": [...]}``; ``?page_size=``
+    may lower or raise the page size up to API_MAX_PAGE_SIZE.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, settings.API_PAGE_SIZE))
+        except ValueError:
+            size = settings.API_PAGE_SIZE
+        return max(1, min(size, settings.API_MAX_PAGE_SIZE))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            page, self.next_cursor = keyset_page(
+                queryset, request.query_params.get(self.cursor_query_param), self.get_page_size(request)
+            )
+        except ValueError as exc:
+            raise NotFound(str(exc))
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
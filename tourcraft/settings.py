@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,14 +26,22 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'accounts',  # Add accounts app
     'tours',
+    'analytics',
     # Add any other apps here
 ]
 
 MIDDLEWARE = [
+    'tourcraft.middleware.MetricsMiddleware',  # outermost: latency covers the whole stack
+    'tourcraft.middleware.ServerTimingMiddleware',  # timings cover every middleware below it
+    'tourcraft.middleware.QueryBudgetMiddleware',  # budgets include the queries of every middleware below it
+    'analytics.middleware.SlowQueryMiddleware',  # names the view in slow query records
     'django.middleware.security.SecurityMiddleware',
+    'analytics.middleware.StepEventCollectorMiddleware',  # before sessions/auth: beacons need neither
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Moved up for better performance
+    'tours.middleware.PublishedTourMiddleware',  # pre-rendered public tours, before sessions/auth
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -43,10 +51,12 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'tourcraft.urls'
+# Used instead of ROOT_URLCONF for requests served through tourcraft/asgi.py
+ASGI_URLCONF = 'tourcraft.urls_asgi'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'tourcraft.timing.TimedDjangoTemplates',  # DjangoTemplates, timed for Server-Timing
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -110,6 +120,130 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Static files storage
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# One cache for every gunicorn worker and background command: the commands invalidate and
+# refresh entries the workers serve (dashboard stats, tour payloads, activity feeds), so a
+# per-process cache would keep serving stale data. Set REDIS_URL in production (needs the
+# redis package); without it, a file-based cache under CACHE_DIR is shared on one host.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_DIR', default=str(BASE_DIR / 'var' / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 50_000},
+        }
+    }
+
+# Buffered tour view ingestion (flushed by `manage.py flush_tour_views --loop`)
+TOUR_VIEW_BUFFER_DIR = config('TOUR_VIEW_BUFFER_DIR', default=str(BASE_DIR / 'var' / 'view_buffer'))
+TOUR_VIEW_FLUSH_INTERVAL = config('TOUR_VIEW_FLUSH_INTERVAL', default=10, cast=int)
+
+# Analytics rollups over StepEvent (run by `manage.py rollup_analytics --loop`)
+ANALYTICS_ROLLUP_INTERVAL = config('ANALYTICS_ROLLUP_INTERVAL', default=60, cast=int)
+ANALYTICS_ROLLUP_BATCH_SIZE = 5000
+# Rows younger than this are left for the next run, so a flush transaction that
+# commits late can't land behind the watermark.
+ANALYTICS_ROLLUP_SETTLE_SECONDS = 30
+
+# Step-progress beacons from the tour player (static/js/step-tracker.js)
+ANALYTICS_COLLECT_PATH = '/analytics/collect/'
+ANALYTICS_COLLECT_MAX_EVENTS = 500
+ANALYTICS_COLLECT_MAX_BYTES = 64 * 1024
+ANALYTICS_COLLECT_TOUR_CACHE_TIMEOUT = 60
+
+# Activity log: buffered like tour views (flushed by `manage.py flush_activity --loop`)
+ACTIVITY_BUFFER_DIR = config('ACTIVITY_BUFFER_DIR', default=str(BASE_DIR / 'var' / 'activity_buffer'))
+ACTIVITY_FLUSH_INTERVAL = config('ACTIVITY_FLUSH_INTERVAL', default=10, cast=int)
+ACTIVITY_FEED_SIZE = 20
+ACTIVITY_FEED_CACHE_TIMEOUT = 60 * 60 * 24
+ACTIVITY_RETENTION_DAYS = config('ACTIVITY_RETENTION_DAYS', default=90, cast=int)
+
+# Keyset pagination (tourcraft.pagination)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+DASHBOARD_TOURS_PAGE_SIZE = 12
+
+# Full-text search over tours and their steps (tours.search)
+SEARCH_RESULTS_LIMIT = 20
+SEARCH_AUTOCOMPLETE_LIMIT = 8
+SEARCH_MAX_RESULTS = 100
+
+# Per-user dashboard totals; entries are invalidated by signals, the timeout is a safety net
+DASHBOARD_STATS_CACHE_TIMEOUT = 60 * 60
+
+# Materialized tour playback payloads (tours/payloads.py); rebuilt on every Tour/TourStep change
+TOUR_PAYLOAD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Largest step list accepted by the bulk steps endpoint (tours/steps.py)
+TOUR_MAX_STEPS = 500
+# rebalance_step_ranks respaces tours with a step rank longer than this (tours/ranks.py)
+STEP_RANK_REBALANCE_LENGTH = 8
+STEP_RANK_REBALANCE_INTERVAL = config('STEP_RANK_REBALANCE_INTERVAL', default=3600, cast=int)
+# Uncompressed size limit for an imported tour bundle (tours/bundles.py)
+TOUR_BUNDLE_MAX_SIZE = config('TOUR_BUNDLE_MAX_SIZE', default=1024 * 1024 * 1024, cast=int)
+
+# Responsive WebP variants for screenshots and thumbnails (tours/images.py)
+IMAGE_VARIANT_WIDTHS = (320, 768, 1440)
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = config('IMAGE_VARIANT_WORKERS', default=2, cast=int)
+IMAGE_VARIANTS_ASYNC = True
+
+# Chunked recording uploads are assembled here before moving into media storage
+RECORDING_UPLOAD_DIR = config('RECORDING_UPLOAD_DIR', default=str(BASE_DIR / 'var' / 'recording_uploads'))
+RECORDING_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Recording processing queue (`manage.py process_recordings`)
+RECORDING_JOB_MAX_ATTEMPTS = 5
+RECORDING_JOB_RETRY_DELAY = 30  # seconds, doubled after every failed attempt
+RECORDING_JOB_LEASE = 60 * 30  # a running job older than this is assumed orphaned
+
+# Recording event streams are stored as compressed chunks (tours/recording_events.py)
+RECORDING_CHUNK_SPAN_MS = 10_000
+RECORDING_CHUNK_MAX_EVENTS = 2_000
+RECORDING_DEFAULT_WINDOW_MS = 60_000
+
+# Cache-Control for the public tour JSON used by embeds
+TOUR_PUBLIC_MAX_AGE = 60
+TOUR_PUBLIC_STALE_WHILE_REVALIDATE = 60 * 10
+
+# Pre-rendered HTML+JSON bundles of published public tours (tours/prerender.py), served
+# from disk by tours.middleware.PublishedTourMiddleware or a front proxy
+TOUR_STATIC_ROOT = config('TOUR_STATIC_ROOT', default=str(BASE_DIR / 'var' / 'published_tours'))
+TOUR_STATIC_URL = '/tours/published/'
+TOUR_STATIC_BUILD_INTERVAL = config('TOUR_STATIC_BUILD_INTERVAL', default=300, cast=int)
+
+# SQL queries a request may run (tourcraft/middleware.py); views declare their own
+# with @query_budget. "log" warns on tourcraft.query_budget, "raise" fails the request.
+QUERY_BUDGET_DEFAULT = 20
+QUERY_BUDGET_ACTION = config('QUERY_BUDGET_ACTION', default='log')
+
+# Server-Timing header with db/tpl/view/total times (tourcraft.middleware.ServerTimingMiddleware).
+# PROFILE_SAMPLE_RATE=N profiles 1 in N requests with cProfile (0: off); staff can ask
+# for a profile of any request by sending PROFILE_HEADER. Dumps go to PROFILE_DIR.
+SERVER_TIMING = config('SERVER_TIMING', default='True').lower() in ('true', '1', 'yes', 'on')
+PROFILE_SAMPLE_RATE = config('PROFILE_SAMPLE_RATE', default=0, cast=int)
+PROFILE_HEADER = 'X-Profile'
+PROFILE_DIR = config('PROFILE_DIR', default=str(BASE_DIR / 'var' / 'profiles'))
+PROFILE_MAX_FILES = 500
+
+# Slow query log (analytics/slow_queries.py): statements slower than this are recorded with
+# an EXPLAIN plan, buffered (flushed by `manage.py flush_slow_queries --loop`); `manage.py
+# slow_queries` lists the worst
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=int)
+SLOW_QUERY_BUFFER_DIR = config('SLOW_QUERY_BUFFER_DIR', default=str(BASE_DIR / 'var' / 'slow_queries'))
+SLOW_QUERY_FLUSH_INTERVAL = config('SLOW_QUERY_FLUSH_INTERVAL', default=60, cast=int)
+SLOW_QUERY_EXPLAIN_ASYNC = True
+
+# Clients allowed to scrape /metrics without a staff login (tourcraft/metrics.py). Compared
+# with REMOTE_ADDR, so behind a proxy on the same host leave it empty or use the proxy's rules.
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
 
 # Email Configuration
 # Email configuration
@@ -160,6 +294,12 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        # Query budget warnings and saved profiles (tourcraft/middleware.py)
+        'tourcraft': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 
 }    
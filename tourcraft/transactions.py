@@ -0,0 +1,20 @@
+from django.db import connection, transaction
+
+
+def on_commit_once(key, func):
+    """Run ``func`` after the current transaction commits, once per ``key``.
+
+    Every call registers a callback, but only the first of them to run after
+    the commit calls ``func``; the rest find ``key`` already handled. Saving
+    many rows of one tour therefore rebuilds its derived data once, and a
+    rolled-back callback can never suppress a later one.
+    """
+    pending = connection.__dict__.setdefault("_on_commit_once", set())
+    pending.add(key)
+
+    def run():
+        if key in pending:
+            pending.discard(key)
+            func()
+
+    transaction.on_commit(run)
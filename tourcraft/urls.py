@@ -5,11 +5,16 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from accounts import views as account_views 
+from tourcraft.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape target
     path('accounts/', include(('accounts.urls', 'accounts'), namespace='accounts')),
     path('tours/', include(('tours.urls', 'tours'), namespace='tours')),
+    # Browsable API login; outside the api namespace so DRF's templates can reverse 'rest_framework:login'
+    path('api/auth/', include('rest_framework.urls')),
+    path('api/', include('api.urls')),
     path('', include('django.contrib.auth.urls')),  # Login/logout URLs
 
     # path('password-reset/', auth_views.PasswordResetView.as_view(), name='password_reset'),
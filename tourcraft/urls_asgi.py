@@ -0,0 +1,18 @@
+"""URLconf used by tourcraft/asgi.py.
+
+The read-heavy endpoints resolve to async views that use the async ORM and
+cache APIs; every other URL, and every URL name, is the same as in
+tourcraft.urls.
+"""
+from django.urls import path
+
+from tours import api_views, views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('tours/<uuid:pk>/api/', views.tour_api_data_async),
+    path('tours/<uuid:pk>/public/', views.tour_public_data_async),
+    path('api/tours/dashboard_stats/', api_views.dashboard_stats_async),
+    *sync_urlpatterns,
+]
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Tour, TourStep, Recording, TourView
+from .models import Tour, TourStep, Recording, RecordingJob
+from .search import matching_tour_ids
 
 
 class TourStepInline(admin.TabularInline):
@@ -9,18 +10,42 @@ class TourStepInline(admin.TabularInline):
 
 @admin.register(Tour)
 class TourAdmin(admin.ModelAdmin):
-    list_display = ("title", "creator", "privacy", "status", "view_count", "created_at", "updated_at")
+    list_display = ("title", "creator", "privacy", "status", "view_count", "steps_count", "created_at", "updated_at")
     list_filter = ("privacy", "status", "created_at")
-    search_fields = ("title", "creator__email", "creator__username")
+    list_select_related = ("creator",)
+    # Titles, descriptions and step text are matched through the full-text index.
+    search_fields = ("creator__email", "creator__username")
+    search_help_text = "Words from the tour or its steps, or the creator's email or username."
     inlines = [TourStepInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stats()
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        matches = matching_tour_ids(search_term)
+        if matches is not None:
+            results |= queryset.filter(pk__in=matches)
+        return results, may_have_duplicates
+
+    @admin.display(ordering="annotated_steps_count")
+    def steps_count(self, obj):
+        return obj.steps_count
+
 
 @admin.register(TourStep)
 class TourStepAdmin(admin.ModelAdmin):
-    list_display = ("tour", "step_number", "title", "created_at")
+    list_display = ("tour", "rank", "title", "created_at")
     list_filter = ("created_at",)
     search_fields = ("title", "tour__title")
 
+    def get_search_results(self, request, queryset, search_term):
+        # Narrow to tours the full-text index matches before the substring scan.
+        matches = matching_tour_ids(search_term)
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        return super().get_search_results(request, queryset.filter(tour__in=matches), search_term)
+
 
 @admin.register(Recording)
 class RecordingAdmin(admin.ModelAdmin):
@@ -29,10 +54,9 @@ class RecordingAdmin(admin.ModelAdmin):
     search_fields = ("title", "user__email", "user__username")
 
 
-@admin.register(TourView)
-class TourViewAdmin(admin.ModelAdmin):
-    list_display = ("tour", "viewer", "ip_address", "viewed_at")
-    list_filter = ("viewed_at",)
-    search_fields = ("tour__title", "viewer__email", "ip_address")
+@admin.register(RecordingJob)
+class RecordingJobAdmin(admin.ModelAdmin):
+    list_display = ("recording", "status", "attempts", "run_after", "locked_by", "created_at")
+    list_filter = ("status",)
+    raw_id_fields = ("recording",)
 
- 
@@ -1,38 +1,204 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from analytics.activity import aget_feed, get_feed
+from tourcraft.middleware import query_budget
+from tourcraft.pagination import KeysetPagination
+from analytics.rollups import atimeseries, parse_bucket, timeseries, unique_viewers
+from .bundles import BundleError, export_tour, import_bundle
+from .images import enqueue
 from .models import Tour, TourStep
-from .serializers import TourSerializer, TourStepSerializer
+from . import search as fulltext
+from .serializers import StepItemSerializer, TourSerializer, TourStepSerializer
+from . import steps as tour_steps
+from .stats import aget_dashboard_stats, get_dashboard_stats
 
+@query_budget(16)
 class TourViewSet(viewsets.ModelViewSet):
     serializer_class = TourSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return Tour.objects.filter(creator=self.request.user)
+        return Tour.objects.filter(creator=self.request.user).with_stats()
     
     def perform_create(self, serializer):
         serializer.save(creator=self.request.user)
     
+    def _after(self, request):
+        """The ``after`` step id from the body: None to go first; raises ValueError if malformed."""
+        after = request.data.get('after')
+        if after is None:
+            return None
+        if not str(after).isdigit():
+            raise ValueError('after must be a step id or null')
+        return int(after)
+
     @action(detail=True, methods=['post'])
     def add_step(self, request, pk=None):
+        """Append a step, or insert it right after step ``after`` (null: first) if given"""
         tour = self.get_object()
-        step_data = request.data
-        step_data['tour'] = tour.id
-        
-        serializer = TourStepSerializer(data=step_data)
-        if serializer.is_valid():
-            serializer.save()
+        serializer = TourStepSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if 'after' not in request.data:
+            serializer.save(tour=tour)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            step = tour_steps.insert_step(tour, self._after(request), **serializer.validated_data)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(TourStepSerializer(step).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path=r'steps/(?P<step_id>\d+)/move')
+    def move_step(self, request, pk=None, step_id=None):
+        """Move one step right after step ``after`` (null: first); rewrites only that step's rank"""
+        step = get_object_or_404(TourStep, pk=step_id, tour=self.get_object())
+        try:
+            tour_steps.move_step(step, self._after(request))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(TourStepSerializer(step).data)
+
+    @query_budget(12)
+    @action(detail=True, methods=['get', 'put'])
+    def steps(self, request, pk=None):
+        """The tour's steps in order; PUT the full list to create, update, delete and reorder in one go"""
+        tour = self.get_object()
+        if request.method == 'GET':
+            return Response(TourStepSerializer(tour.steps.numbered().order_by('rank'), many=True).data)
+
+        serializer = StepItemSerializer(data=request.data, many=True, max_length=settings.TOUR_MAX_STEPS)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            steps = tour_steps.replace_steps(tour, serializer.validated_data)
+        except tour_steps.StepListError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(TourStepSerializer(steps, many=True).data)
     
+    @action(detail=True, methods=['post'])
+    def export(self, request, pk=None):
+        """Queue a zip bundle of the tour; it shows up as a SavedTour when written"""
+        tour = self.get_object()
+        enqueue(export_tour, tour.pk, request.user.pk, str(request.data.get('name', ''))[:255])
+        return Response({'detail': 'Export queued.'}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_tour(self, request):
+        """Create a draft tour from an uploaded bundle (multipart field ``bundle``)"""
+        upload = request.FILES.get('bundle')
+        if upload is None:
+            return Response({'detail': 'Upload a bundle file.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            tour = import_bundle(upload, request.user)
+        except BundleError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(TourSerializer(self.get_queryset().get(pk=tour.pk)).data, status=status.HTTP_201_CREATED)
+
+    @query_budget(8)
     @action(detail=False)
     def dashboard_stats(self, request):
         user_tours = self.get_queryset()
         stats = {
-            'total_tours': user_tours.count(),
-            'published_tours': user_tours.filter(status='Published').count(),
-            'total_views': sum(tour.view_count for tour in user_tours),
+            **get_dashboard_stats(request.user),
+            'daily_viewers': timeseries(Tour.objects.filter(creator=request.user)),
+            'recent_activity': get_feed(request.user.pk),
             'recent_tours': TourSerializer(user_tours[:5], many=True).data
         }
-        return Response(stats)
\ No newline at end of file
+        return Response(stats)
+
+    def _timeseries(self, request, tours):
+        granularity = request.query_params.get('granularity', 'day')
+        try:
+            start = parse_bucket(request.query_params.get('from'), granularity)
+            end = parse_bucket(request.query_params.get('to'), granularity)
+            data = {'granularity': granularity, 'series': timeseries(tours, granularity, start, end)}
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if granularity == 'day':
+            # Distinct over the whole range, not the sum of the daily figures.
+            data['unique_viewers'] = unique_viewers(tours, start, end)
+        return Response(data)
+
+    @action(detail=False, url_path='timeseries')
+    def viewers_timeseries(self, request):
+        """Views and viewers over time across all of the user's tours, from the rollup tables"""
+        return self._timeseries(request, Tour.objects.filter(creator=request.user))
+
+    @action(detail=True, url_path='timeseries')
+    def tour_viewers_timeseries(self, request, pk=None):
+        """Views and viewers over time for one tour (?granularity=day|hour&from=...&to=...)"""
+        return self._timeseries(request, Tour.objects.filter(pk=self.get_object().pk))
+
+    def _search_params(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = int(request.query_params.get('limit', 0)) or None
+        except ValueError:
+            limit = None
+        return query, limit
+
+    @query_budget(6)
+    @action(detail=False)
+    def search(self, request):
+        """Ranked full-text search over the user's tours and steps (?q=...&limit=...&prefix=1)"""
+        query, limit = self._search_params(request)
+        if not query:
+            return Response({'detail': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        hits = fulltext.search(query, request.user.pk, limit, prefix=request.query_params.get('prefix') == '1')
+        tours = Tour.objects.in_bulk([hit['tour_id'] for hit in hits])
+        results = [
+            {
+                'id': hit['tour_id'],
+                'title': tours[hit['tour_id']].title,
+                'status': tours[hit['tour_id']].status,
+                'privacy': tours[hit['tour_id']].privacy,
+                'score': hit['score'],
+                'snippet': hit['snippet'],
+            }
+            for hit in hits
+            if hit['tour_id'] in tours
+        ]
+        return Response({'query': query, 'results': results})
+
+    @query_budget(5)
+    @action(detail=False)
+    def autocomplete(self, request):
+        """Titles of the user's tours starting with the words typed so far (?q=...)"""
+        query, limit = self._search_params(request)
+        tour_ids = fulltext.autocomplete(query, request.user.pk, limit) if query else []
+        titles = dict(Tour.objects.filter(pk__in=tour_ids).values_list('pk', 'title'))
+        suggestions = [{'id': tour_id, 'title': titles[tour_id]} for tour_id in tour_ids if tour_id in titles]
+        return Response({'query': query, 'suggestions': suggestions})
+
+
+@query_budget(8)
+async def dashboard_stats_async(request):
+    """Async twin of ``TourViewSet.dashboard_stats`` for the ASGI URLconf (tourcraft/urls_asgi.py).
+
+    DRF views are synchronous, so this is a plain Django view: session auth
+    only, and the same JSON rendering as the API.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return HttpResponse(
+            JSONRenderer().render({'detail': 'Authentication credentials were not provided.'}),
+            status=status.HTTP_403_FORBIDDEN, content_type='application/json',
+        )
+    user_tours = Tour.objects.filter(creator=user)
+    stats = {
+        **await aget_dashboard_stats(user),
+        'daily_viewers': await atimeseries(user_tours),
+        'recent_activity': await aget_feed(user.pk),
+        'recent_tours': TourSerializer([tour async for tour in user_tours.with_stats()[:5]], many=True).data,
+    }
+    return HttpResponse(JSONRenderer().render(stats), content_type='application/json')
@@ -0,0 +1,246 @@
+"""Zip bundles of a whole tour, for SavedTour exports and imports.
+
+A bundle holds ``tour.json`` (the tour's own fields), ``steps.jsonl`` (one
+step per line, in order) and every screenshot, thumbnail and image variant
+under ``media/`` by its storage name. Both directions stream: steps are read
+from and written to the database in batches, and files are copied chunk by
+chunk, so memory use doesn't grow with the size of the tour.
+"""
+
+import io
+import json
+import posixpath
+import shutil
+import tempfile
+import uuid
+import zipfile
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+from PIL import Image
+
+from .images import enqueue, needs_variants, process_step, variant_name
+from .models import SavedTour, Tour, TourStep
+from .payloads import schedule_rebuild
+from .ranks import DIGITS
+from .search import schedule_index
+
+FORMAT = 1
+BATCH_SIZE = 500  # steps per INSERT on import
+CHUNK_SIZE = 100  # rows fetched at a time on export
+TOUR_FIELDS = ("title", "description", "privacy", "status")
+STEP_FIELDS = ("rank", "title", "description", "highlight_area", "screenshot", "screenshot_variants")
+RANK_MAX_LENGTH = TourStep._meta.get_field("rank").max_length
+THUMBNAIL_UPLOAD_TO = Tour._meta.get_field("thumbnail").upload_to
+SCREENSHOT_UPLOAD_TO = TourStep._meta.get_field("screenshot").upload_to
+# Image formats accepted from a bundle, by the format Pillow detects, with the extension they're stored under.
+IMAGE_FORMATS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+class BundleError(ValueError):
+    pass
+
+
+def _rank(value, previous):
+    rank = str(value)
+    valid = rank and set(rank) <= set(DIGITS) and not rank.endswith("0") and len(rank) <= RANK_MAX_LENGTH
+    if not valid or (previous is not None and rank <= previous):
+        raise BundleError(f"Step rank {rank!r} is invalid or out of order.")
+    return rank
+
+
+def _media_names(image_name, variants):
+    if not image_name:
+        return []
+    return [image_name] + [v["name"] for v in (variants or {}).get("variants", [])]
+
+
+def _copy_media(archive, name):
+    if not default_storage.exists(name):
+        return
+    # Images are compressed already; deflating them again only costs time.
+    with default_storage.open(name, "rb") as src, archive.open(f"media/{name}", "w", force_zip64=True) as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def write_bundle(tour, fileobj):
+    """Write ``tour`` as a zip bundle to the binary file ``fileobj``."""
+    steps = TourStep.objects.filter(tour=tour).order_by("rank")
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        meta = {name: getattr(tour, name) for name in TOUR_FIELDS}
+        meta.update(format=FORMAT, thumbnail=tour.thumbnail.name or None, thumbnail_variants=tour.thumbnail_variants)
+        archive.writestr("tour.json", json.dumps(meta))
+
+        with archive.open("steps.jsonl", "w", force_zip64=True) as out:
+            for row in steps.values(*STEP_FIELDS).iterator(chunk_size=CHUNK_SIZE):
+                row["screenshot"] = row["screenshot"] or None
+                out.write(json.dumps(row).encode() + b"\n")
+
+        archive.compression = zipfile.ZIP_STORED
+        for name in _media_names(tour.thumbnail.name, tour.thumbnail_variants):
+            _copy_media(archive, name)
+        media = steps.exclude(screenshot="").exclude(screenshot__isnull=True)
+        for name, variants in media.values_list("screenshot", "screenshot_variants").iterator(chunk_size=CHUNK_SIZE):
+            for member in _media_names(name, variants):
+                _copy_media(archive, member)
+
+
+def export_tour(tour_id, user_id, name=""):
+    """Bundle tour ``tour_id`` into a new SavedTour of ``user_id``; returns it (None if the tour is gone)."""
+    tour = Tour.objects.filter(pk=tour_id).first()
+    if tour is None:
+        return None
+    name = name or tour.title
+    # Spool to a temporary file on disk, then let the storage copy it in chunks.
+    with tempfile.TemporaryFile() as spool:
+        write_bundle(tour, spool)
+        spool.seek(0)
+        saved = SavedTour(user_id=user_id, tour=tour, name=name[:255])
+        saved.file_url.save(f"{slugify(name) or 'tour'}.zip", File(spool), save=True)
+    return saved
+
+
+class _Reader:
+    """Reads media out of an open bundle into storage, once per member."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.members = set(archive.namelist())
+        self.saved = []
+        if sum(info.file_size for info in archive.infolist()) > settings.TOUR_BUNDLE_MAX_SIZE:
+            raise BundleError("The bundle is too large.")
+
+    def _format(self, member):
+        """The Pillow format of image ``member``; raises BundleError for anything else."""
+        if posixpath.splitext(member)[1].lower() not in IMAGE_EXTENSIONS:
+            raise BundleError(f"{member} is not an image.")
+        try:
+            with self.archive.open(member) as src, Image.open(src) as image:
+                image.verify()
+                image_format = image.format
+        except (OSError, SyntaxError, Image.DecompressionBombError) as exc:
+            raise BundleError(f"{member} is not a valid image.") from exc
+        if image_format not in IMAGE_FORMATS:
+            raise BundleError(f"{member} is not a supported image format.")
+        return image_format
+
+    def _save(self, member, name):
+        with self.archive.open(member) as src:
+            stored = default_storage.save(name, File(src, name=name))
+        self.saved.append(stored)
+        return stored
+
+    def discard(self):
+        for name in self.saved:
+            default_storage.delete(name)
+
+    def image(self, name, variants, upload_to):
+        """Store image ``name`` and its variants; returns the new name and variants.
+
+        Archive names are only used to find the members: files are checked
+        with Pillow and stored under ``upload_to`` with a new name, so a bundle
+        can't place anything else, or anywhere else, in media storage.
+        """
+        if not name or f"media/{name}" not in self.members:
+            return "", None
+        member = f"media/{name}"
+        target = f"{upload_to}{uuid.uuid4().hex}{IMAGE_FORMATS[self._format(member)]}"
+        stored = self._save(member, target)
+        if not variants:
+            return stored, None
+        # Variant names are derived from the stored source name.
+        copied = []
+        for variant in variants.get("variants", []):
+            member = f"media/{variant['name']}"
+            if member in self.members and self._format(member) == "WEBP":
+                width = int(variant["width"])
+                copied.append({**variant, "width": width, "name": self._save(member, variant_name(stored, width))})
+        return stored, {**variants, "source": stored, "variants": copied}
+
+
+def _steps(archive):
+    if "steps.jsonl" not in archive.namelist():
+        return
+    with archive.open("steps.jsonl") as raw:
+        for line in io.TextIOWrapper(raw, encoding="utf-8"):
+            if line.strip():
+                yield json.loads(line)
+
+
+def _create_steps(steps):
+    for step in TourStep.objects.bulk_create(steps):
+        # Screenshots the bundle has no variants for get them as if saved one by one.
+        if needs_variants(step.screenshot, step.screenshot_variants):
+            enqueue(process_step, step.pk)
+
+
+def import_bundle(fileobj, user):
+    """Create a new draft tour of ``user`` from the zip bundle in ``fileobj``; returns it.
+
+    Raises BundleError for anything that isn't a bundle this module wrote.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as exc:
+        raise BundleError("Not a zip file.") from exc
+    with archive:
+        reader = _Reader(archive)
+        try:
+            meta = json.loads(archive.read("tour.json"))
+        except (KeyError, ValueError) as exc:
+            raise BundleError("The bundle has no readable tour.json.") from exc
+        if not isinstance(meta, dict) or meta.get("format") != FORMAT:
+            raise BundleError("Unsupported bundle format.")
+
+        try:
+            with transaction.atomic():
+                thumbnail, thumbnail_variants = reader.image(
+                    meta.get("thumbnail"), meta.get("thumbnail_variants"), THUMBNAIL_UPLOAD_TO
+                )
+                tour = Tour.objects.create(
+                    creator=user,
+                    title=str(meta.get("title") or "Imported tour")[:200],
+                    description=str(meta.get("description") or ""),
+                    privacy=meta.get("privacy") if meta.get("privacy") in dict(Tour.PRIVACY_CHOICES) else "public",
+                    status="Draft",
+                    thumbnail=thumbnail,
+                    thumbnail_variants=thumbnail_variants,
+                )
+                batch, count, rank = [], 0, None
+                for item in _steps(archive):
+                    count += 1
+                    if count > settings.TOUR_MAX_STEPS:
+                        raise BundleError(f"A tour can have at most {settings.TOUR_MAX_STEPS} steps.")
+                    rank = _rank(item["rank"], rank)
+                    screenshot, variants = reader.image(
+                        item.get("screenshot"), item.get("screenshot_variants"), SCREENSHOT_UPLOAD_TO
+                    )
+                    batch.append(TourStep(
+                        tour=tour,
+                        rank=rank,
+                        title=str(item.get("title") or "")[:200],
+                        description=str(item.get("description") or ""),
+                        highlight_area=item.get("highlight_area"),
+                        screenshot=screenshot,
+                        screenshot_variants=variants,
+                    ))
+                    if len(batch) == BATCH_SIZE:
+                        _create_steps(batch)
+                        batch = []
+                _create_steps(batch)
+                # bulk_create skips the TourStep signals.
+                schedule_rebuild(tour.pk)
+                schedule_index(tour.pk)
+        except BundleError:
+            reader.discard()
+            raise
+        except (AttributeError, KeyError, TypeError, ValueError, IntegrityError, SuspiciousOperation, zipfile.BadZipFile) as exc:
+            # The rows are rolled back; the files copied so far have to go too.
+            reader.discard()
+            raise BundleError(f"The bundle is damaged: {exc}") from exc
+    return tour
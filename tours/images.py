@@ -0,0 +1,146 @@
+import base64
+import io
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageFilter, ImageOps
+
+from . import payloads
+from .models import Tour, TourStep
+
+PLACEHOLDER_WIDTH = 16
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix="image-variants"
+        )
+    return _executor
+
+
+def variant_name(source_name, width):
+    root, _ = posixpath.splitext(source_name)
+    return f"variants/{root}-{width}w.webp"
+
+
+def _open(name):
+    with default_storage.open(name, "rb") as fh:
+        image = Image.open(fh)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+    return image
+
+
+def _encode_webp(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=settings.IMAGE_VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate_variants(source_name):
+    """Write resized WebP copies of ``source_name`` and describe them.
+
+    Variant file names are derived from the source name, so running this again
+    for the same upload only creates the files that are missing. Images are
+    never upscaled; a source narrower than every configured width gets a single
+    variant at its own width.
+    """
+    image = _open(source_name)
+    widths = sorted({min(width, image.width) for width in settings.IMAGE_VARIANT_WIDTHS})
+
+    variants = []
+    for width in widths:
+        name = variant_name(source_name, width)
+        height = max(1, round(image.height * width / image.width))
+        if not default_storage.exists(name):
+            resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+            default_storage.save(name, ContentFile(_encode_webp(resized)))
+        variants.append({"width": width, "height": height, "name": name})
+
+    tiny = image.resize(
+        (PLACEHOLDER_WIDTH, max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))), Image.Resampling.BILINEAR
+    ).filter(ImageFilter.GaussianBlur(1))
+    placeholder = "data:image/webp;base64," + base64.b64encode(_encode_webp(tiny)).decode()
+
+    return {
+        "source": source_name,
+        "width": image.width,
+        "height": image.height,
+        "placeholder": placeholder,
+        "variants": variants,
+    }
+
+
+def describe_variants(variants):
+    """URLs and a ready-made ``srcset`` for a stored variants description."""
+    if not variants:
+        return None
+    urls = [
+        {"width": v["width"], "height": v["height"], "url": default_storage.url(v["name"])}
+        for v in variants["variants"]
+    ]
+    return {
+        "placeholder": variants["placeholder"],
+        "srcset": ", ".join(f'{v["url"]} {v["width"]}w' for v in urls),
+        "variants": urls,
+    }
+
+
+def needs_variants(image_field, variants):
+    """True when the stored variants don't describe the current upload."""
+    if not image_field:
+        return variants is not None
+    return (variants or {}).get("source") != image_field.name
+
+
+def _refresh(queryset, field_name, variants_name, force):
+    obj = queryset.first()
+    if obj is None:
+        return None
+    image_field = getattr(obj, field_name)
+    if not (force or needs_variants(image_field, getattr(obj, variants_name))):
+        return None
+    variants = generate_variants(image_field.name) if image_field else None
+    # Only write if the image wasn't replaced while we were working.
+    current = queryset.filter(**{field_name: image_field.name}) if image_field else queryset
+    current.update(**{variants_name: variants})
+    return obj
+
+
+def process_step(step_id, force=False):
+    queryset = TourStep.objects.filter(pk=step_id).only("tour_id", "screenshot", "screenshot_variants")
+    step = _refresh(queryset, "screenshot", "screenshot_variants", force)
+    if step is not None:
+        payloads.rebuild_payload(step.tour_id)
+
+
+def process_tour_thumbnail(tour_id, force=False):
+    queryset = Tour.objects.filter(pk=tour_id).only("thumbnail", "thumbnail_variants")
+    if _refresh(queryset, "thumbnail", "thumbnail_variants", force) is not None:
+        payloads.rebuild_payload(tour_id)
+
+
+def _run_in_worker(func, *args):
+    try:
+        func(*args)
+    finally:
+        # Worker threads get their own connections; don't leak them.
+        connections.close_all()
+
+
+def enqueue(func, *args):
+    """Run ``func(*args)`` once the current transaction commits, off the request thread."""
+    if settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_worker, func, *args))
+    else:
+        transaction.on_commit(lambda: func(*args))
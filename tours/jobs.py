@@ -0,0 +1,210 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Recording, RecordingJob
+from .recording_events import chunk_events, load_events, replace_chunks
+
+FRAME_COUNT = 3
+
+
+# CPU-bound work. These run in a process pool, so they must not touch the ORM.
+
+def normalize_events(raw):
+    """Sort events by time, rebase them to start at 0 ms and drop duplicates.
+
+    Accepts a list of event dicts (or ``{"events": [...]}``) whose timestamp is
+    stored under ``t``, ``time`` or ``timestamp``; events without one are dropped.
+    """
+    if isinstance(raw, dict):
+        raw = raw.get("events", [])
+    events = []
+    for event in raw or []:
+        if not isinstance(event, dict):
+            continue
+        t = next((event[key] for key in ("t", "time", "timestamp") if isinstance(event.get(key), (int, float))), None)
+        if t is None:
+            continue
+        event = {k: v for k, v in event.items() if k not in ("time", "timestamp")}
+        event["t"] = t
+        events.append(event)
+    if not events:
+        return []
+    events.sort(key=lambda e: e["t"])
+    start = events[0]["t"]
+    normalized, seen = [], set()
+    for event in events:
+        event["t"] = int(round(event["t"] - start))
+        key = repr(sorted(event.items()))
+        if key not in seen:
+            seen.add(key)
+            normalized.append(event)
+    return normalized
+
+
+def extract_frames(path, count=FRAME_COUNT):
+    """Grab ``count`` evenly spaced JPEG frames with ffmpeg, if it is installed."""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg or not path:
+        return []
+    with tempfile.TemporaryDirectory() as out:
+        subprocess.run(
+            [ffmpeg, "-v", "error", "-i", path, "-vf", "thumbnail,scale=480:-2",
+             "-frames:v", str(count), "-vsync", "vfr", os.path.join(out, "frame%02d.jpg")],
+            check=True, timeout=300, capture_output=True,
+        )
+        frames = []
+        for name in sorted(os.listdir(out)):
+            with open(os.path.join(out, name), "rb") as fh:
+                frames.append(fh.read())
+        return frames
+
+
+def analyse_recording(path, raw_events):
+    """Metadata, re-chunked normalized events and thumbnail frames for one recording."""
+    digest, size = hashlib.sha256(), 0
+    if path:
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                digest.update(chunk)
+                size += len(chunk)
+    events = normalize_events(raw_events)
+    return {
+        "metadata": {
+            "size": size,
+            "sha256": digest.hexdigest() if path else None,
+            "event_count": len(events),
+            "duration_ms": events[-1]["t"] if events else None,
+        },
+        "chunks": chunk_events(events),
+        "frames": extract_frames(path),
+    }
+
+
+# Queue handling.
+
+def enqueue_recording(recording_id):
+    return RecordingJob.objects.create(recording_id=recording_id)
+
+
+def claim_jobs(worker_id, limit):
+    """Atomically take up to ``limit`` due jobs for ``worker_id``.
+
+    ``SKIP LOCKED`` lets workers on PostgreSQL pass each other without waiting;
+    the conditional UPDATE on a per-claim token is what guarantees a job is
+    only handed to one worker, including on SQLite where row locks are no-ops.
+    Jobs whose worker died mid-run are reclaimed once their lease expires,
+    or failed if that was their last attempt: a job that crashes its worker
+    would otherwise be retried forever.
+    """
+    now = timezone.now()
+    expired = Q(status="running", locked_at__lt=now - timedelta(seconds=settings.RECORDING_JOB_LEASE))
+    exhausted = Q(attempts__gte=settings.RECORDING_JOB_MAX_ATTEMPTS)
+    due = Q(status="queued", run_after__lte=now) | (expired & ~exhausted)
+    token = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+    with transaction.atomic():
+        abandoned = dict(
+            RecordingJob.objects.select_for_update(skip_locked=True)
+            .filter(expired & exhausted)
+            .values_list("pk", "recording_id")
+        )
+        if abandoned:
+            failed = RecordingJob.objects.filter(expired & exhausted, pk__in=abandoned)
+            failed.update(status="failed", last_error="The worker stopped during the last attempt.")
+            Recording.objects.filter(pk__in=abandoned.values()).update(status="failed")
+        ids = list(
+            RecordingJob.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by("run_after")
+            .values_list("pk", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        RecordingJob.objects.filter(due, pk__in=ids).update(
+            status="running", locked_by=token, locked_at=now, attempts=F("attempts") + 1
+        )
+    return list(RecordingJob.objects.filter(locked_by=token, status="running").select_related("recording"))
+
+
+@contextmanager
+def local_copy(name):
+    """A filesystem path for a stored file, downloading it if the storage is remote."""
+    if not name:
+        yield None
+        return
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1]) as tmp:
+        with default_storage.open(name, "rb") as src:
+            shutil.copyfileobj(src, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def _owned(job):
+    # A job whose lease expired may have been reclaimed by another worker.
+    return RecordingJob.objects.filter(pk=job.pk, status="running", locked_by=job.locked_by)
+
+
+def complete_job(job, result):
+    frames = []
+    for index, frame in enumerate(result["frames"], start=1):
+        frames.append(default_storage.save(f"recordings/frames/{job.recording_id}-{index}.jpg", ContentFile(frame)))
+    with transaction.atomic():
+        if not _owned(job).update(status="done", last_error=""):
+            return
+        replace_chunks(job.recording_id, result["chunks"])
+        Recording.objects.filter(pk=job.recording_id).update(
+            status="completed",
+            completed_at=timezone.now(),
+            metadata={**result["metadata"], "frames": frames},
+        )
+
+
+def fail_job(job, error):
+    """Retry with exponential backoff, or give up after RECORDING_JOB_MAX_ATTEMPTS."""
+    if job.attempts >= settings.RECORDING_JOB_MAX_ATTEMPTS:
+        with transaction.atomic():
+            if _owned(job).update(status="failed", last_error=error):
+                Recording.objects.filter(pk=job.recording_id).update(status="failed")
+        return
+    delay = settings.RECORDING_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+    _owned(job).update(status="queued", run_after=timezone.now() + timedelta(seconds=delay), last_error=error)
+
+
+def run_jobs(jobs, executor=None):
+    """Process claimed jobs in ``executor`` (a process pool) or inline."""
+    with ExitStack() as stack:
+        running = []
+        for job in jobs:
+            try:
+                # Remote files stay downloaded until every job in the batch is done.
+                path = stack.enter_context(local_copy(job.recording.video.name))
+                args = (path, load_events(job.recording_id))
+            except Exception as exc:
+                fail_job(job, repr(exc))
+                continue
+            running.append((job, executor.submit(analyse_recording, *args) if executor else args))
+        for job, task in running:
+            try:
+                result = task.result() if executor else analyse_recording(*task)
+                complete_job(job, result)
+            except Exception as exc:
+                fail_job(job, repr(exc))
@@ -0,0 +1,125 @@
+import functools
+import json
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+
+from analytics.models import StepEvent, TourDailyStats
+from tours.management.commands.benchmark_serving import run_wsgi, summarize
+from tours.models import Recording, Tour, TourStep
+
+
+def run_http(base_url, path, cookie, concurrency, total):
+    """``total`` GETs of ``path`` on a running server from ``concurrency`` threads."""
+    remaining = iter(range(total))
+    lock = threading.Lock()
+    timings, errors = [], []
+
+    def worker():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            request = urllib.request.Request(base_url + path, headers={'Cookie': cookie, 'Accept-Encoding': 'gzip'})
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+            except urllib.error.URLError as exc:  # HTTPError included
+                errors.append(str(exc))
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(timings, time.perf_counter() - started, len(errors))
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Latency percentiles and throughput of the key endpoints (dashboard, preview, API list and '
+        'detail, dashboard_stats) for one user, as JSON to compare across commits. Run it against a '
+        'database filled by seed_data. Requests go through tourcraft.wsgi in-process, or to a running '
+        'server with --base-url.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to benchmark as (default: the user with the most tours)')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per endpoint first')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--base-url', help='e.g. http://127.0.0.1:8000; the server must use this database')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.all()
+        if options['user']:
+            user = users.filter(username=options['user']).first()
+        else:
+            user = users.annotate(tour_count=Count('tours')).order_by('-tour_count', 'pk').first()
+        tour = Tour.objects.filter(creator=user).order_by('-view_count', 'pk').first() if user else None
+        if tour is None:
+            raise CommandError('No user with tours to benchmark; run seed_data first.')
+
+        client = Client()
+        client.force_login(user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        if options['base_url']:
+            run = functools.partial(run_http, options['base_url'].rstrip('/'))
+        else:
+            from tourcraft.wsgi import application
+            run = functools.partial(run_wsgi, application)
+
+        endpoints = {
+            'dashboard': '/tours/',
+            'preview': f'/tours/{tour.pk}/preview/',
+            'api_list': '/api/tours/',
+            'api_detail': f'/api/tours/{tour.pk}/',
+            'dashboard_stats': '/api/tours/dashboard_stats/',
+        }
+        results = {}
+        for name, path in endpoints.items():
+            if options['warmup']:
+                run(path, cookie, 1, options['warmup'])
+            results[name] = {'path': path, **run(path, cookie, options['concurrency'], options['requests'])}
+            if results[name]['errors']:
+                self.stderr.write(f"{name}: {results[name]['errors']} of {options['requests']} requests failed")
+
+        self.stdout.write(json.dumps({
+            'commit': _commit(),
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'server': options['base_url'] or 'wsgi',
+            'concurrency': options['concurrency'],
+            'user': user.get_username(),
+            'user_tours': Tour.objects.filter(creator=user).count(),
+            'rows': {
+                'users': users.count(),
+                'tours': Tour.objects.count(),
+                'steps': TourStep.objects.count(),
+                'recordings': Recording.objects.count(),
+                'step_events': StepEvent.objects.count(),
+                'daily_stats': TourDailyStats.objects.count(),
+            },
+            'endpoints': results,
+        }, indent=2))
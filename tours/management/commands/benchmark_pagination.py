@@ -0,0 +1,53 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from tourcraft.pagination import encode_cursor, keyset_page
+from tours.models import Tour
+
+
+def _median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 2)
+
+
+class Command(BaseCommand):
+    help = 'Compare keyset and OFFSET pagination of one creator\'s tours at increasing depths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tours', type=int, default=100_000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(
+            username='pagination-benchmark', defaults={'email': 'pagination-benchmark@example.invalid'}
+        )
+        # Tours are kept between runs; only the shortfall is created (without signals).
+        missing = options['tours'] - Tour.objects.filter(creator=user).count()
+        for start in range(0, max(missing, 0), 5000):
+            Tour.objects.bulk_create(
+                Tour(title=f'Benchmark tour {start + n}', creator=user) for n in range(min(5000, missing - start))
+            )
+
+        tours = Tour.objects.filter(creator=user).with_stats()
+        size, total = options['page_size'], Tour.objects.filter(creator=user).count()
+        ordered = tours.order_by('-created_at', '-pk')
+        results = []
+        for depth in sorted({0, 1_000, 10_000, total // 2, total - size}):
+            if depth < 0 or depth >= total:
+                continue
+            # The cursor a client would hold after reading ``depth`` rows.
+            cursor = encode_cursor(ordered[depth - 1]) if depth else None
+            keyset = _median_ms(lambda: keyset_page(tours, cursor, size), options['repeat'])
+            offset = _median_ms(lambda: list(ordered[depth:depth + size + 1]), options['repeat'])
+            results.append({'depth': depth, 'keyset_ms': keyset, 'offset_ms': offset})
+
+        self.stdout.write(json.dumps({'tours': total, 'page_size': size, 'pages': results}, indent=2))
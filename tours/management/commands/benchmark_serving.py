@@ -0,0 +1,172 @@
+import asyncio
+import io
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from tours.models import Tour, TourStep
+from tours.payloads import rebuild_payload
+from tours.ranks import spread
+
+HOST = 'localhost'
+
+
+def _percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(timings, elapsed, errors):
+    """Throughput and latency percentiles of ``timings`` (seconds) taken over ``elapsed`` seconds."""
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+        'p50_ms': round(_percentile(timings, 0.50) * 1000, 2),
+        'p95_ms': round(_percentile(timings, 0.95) * 1000, 2),
+        'p99_ms': round(_percentile(timings, 0.99) * 1000, 2),
+    }
+
+
+def run_wsgi(application, path, cookie, concurrency, total):
+    """``total`` GETs of ``path`` through a WSGI app from ``concurrency`` threads, like gthread workers."""
+    remaining = iter(range(total))
+    lock = threading.Lock()
+    timings, errors = [], []
+
+    def worker():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+                'HTTP_HOST': HOST, 'HTTP_COOKIE': cookie, 'HTTP_ACCEPT_ENCODING': 'gzip',
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+                'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            }
+            status = []
+            started = time.perf_counter()
+            body = application(environ, lambda line, headers, exc_info=None: status.append(line))
+            try:
+                for _ in body:
+                    pass
+            finally:
+                getattr(body, 'close', lambda: None)()
+            timings.append(time.perf_counter() - started)
+            if not status[0].startswith('200'):
+                errors.append(status[0])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(timings, time.perf_counter() - started, len(errors))
+
+
+async def run_asgi(application, path, cookie, concurrency, total):
+    """``total`` GETs of ``path`` through an ASGI app from ``concurrency`` concurrent clients."""
+    remaining = iter(range(total))
+    timings, errors = [], []
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': [(b'host', HOST.encode()), (b'cookie', cookie.encode()), (b'accept-encoding', b'gzip')],
+        'client': ('127.0.0.1', 50000), 'server': (HOST, 80),
+    }
+
+    async def worker():
+        while next(remaining, None) is not None:
+            disconnected = asyncio.Event()
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            started = time.perf_counter()
+            await application(dict(scope), receive, send)
+            timings.append(time.perf_counter() - started)
+            disconnected.set()
+            if status[0] != 200:
+                errors.append(status[0])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(timings, time.perf_counter() - started, len(errors))
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the read-heavy endpoints served by tourcraft.wsgi (sync views, threads) and '
+        'tourcraft.asgi (async views, one event loop) at several concurrency levels. The apps are '
+        'driven in-process, so the numbers leave out the HTTP server and compare the serving models alone.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrency levels')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and level')
+        parser.add_argument('--steps', type=int, default=50, help='Steps in the benchmark tour')
+
+    def handle(self, *args, **options):
+        from tourcraft.asgi import application as asgi_application
+        from tourcraft.wsgi import application as wsgi_application
+
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        user, _ = get_user_model().objects.get_or_create(
+            username='serving-benchmark', defaults={'email': 'serving-benchmark@example.invalid'}
+        )
+        tour = Tour.objects.create(title='Serving benchmark', creator=user, status='Published')
+        try:
+            TourStep.objects.bulk_create(
+                TourStep(tour=tour, rank=rank, title=f'Step {n}', description='Benchmark step ' * 20)
+                for n, rank in enumerate(spread(options['steps']), 1)
+            )
+            rebuild_payload(tour.pk)
+            client = Client()
+            client.force_login(user)
+            cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+            endpoints = {
+                'tour_payload': f'/tours/{tour.pk}/api/',
+                'public_tour': f'/tours/{tour.pk}/public/',
+                'dashboard_stats': '/api/tours/dashboard_stats/',
+            }
+            results = []
+            for name, path in endpoints.items():
+                # Warm caches and lazily-built state outside the measurement.
+                run_wsgi(wsgi_application, path, cookie, 1, 3)
+                asyncio.run(run_asgi(asgi_application, path, cookie, 1, 3))
+                for level in levels:
+                    for server, run in (
+                        ('wsgi', lambda: run_wsgi(wsgi_application, path, cookie, level, options['requests'])),
+                        ('asgi', lambda: asyncio.run(
+                            run_asgi(asgi_application, path, cookie, level, options['requests'])
+                        )),
+                    ):
+                        results.append({'endpoint': name, 'server': server, 'concurrency': level, **run()})
+
+            self.stdout.write(json.dumps({
+                'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+                'steps': options['steps'],
+                'results': results,
+            }, indent=2))
+        finally:
+            tour.delete()
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tours.images import process_step, process_tour_thumbnail
+from tours.models import Tour, TourStep
+
+
+def _run(func, pk, force, close=True):
+    try:
+        func(pk, force=force)
+        return None
+    except Exception as exc:
+        return f'{func.__name__}({pk}): {exc}'
+    finally:
+        if close:
+            connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive WebP variants for existing screenshots and thumbnails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that look up to date')
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_VARIANT_WORKERS)
+
+    def handle(self, *args, **options):
+        force = options['force']
+        jobs = []
+        steps = TourStep.objects.exclude(screenshot='').exclude(screenshot__isnull=True)
+        for pk, name, variants in steps.values_list('pk', 'screenshot', 'screenshot_variants').iterator():
+            if force or (variants or {}).get('source') != name:
+                jobs.append((process_step, pk))
+        tours = Tour.objects.exclude(thumbnail='').exclude(thumbnail__isnull=True)
+        for pk, name, variants in tours.values_list('pk', 'thumbnail', 'thumbnail_variants').iterator():
+            if force or (variants or {}).get('source') != name:
+                jobs.append((process_tour_thumbnail, pk))
+
+        failures = 0
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                errors = list(pool.map(lambda job: _run(*job, force), jobs))
+        else:
+            errors = [_run(func, pk, force, close=False) for func, pk in jobs]
+        for error in filter(None, errors):
+            failures += 1
+            self.stderr.write(error)
+        self.stdout.write(f'Processed {len(jobs) - failures} images ({failures} failed)')
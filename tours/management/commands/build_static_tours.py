@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tours.prerender import build_all
+
+
+class Command(BaseCommand):
+    help = 'Pre-render published public tours into static bundles, rebuilding only the ones that changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild every bundle, changed or not')
+        parser.add_argument('--loop', action='store_true', help='Keep checking every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.TOUR_STATIC_BUILD_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            counts = build_all(force=options['force'])
+            if counts['built'] or counts['removed'] or not options['loop']:
+                self.stdout.write(
+                    f"Built {counts['built']} tours, removed {counts['removed']}, {counts['unchanged']} unchanged"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tours.view_buffer import flush_views
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered tour views into Tour.view_count and the analytics buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.TOUR_VIEW_FLUSH_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_views()
+            if flushed or not options['loop']:
+                self.stdout.write(f'Flushed {flushed} views')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
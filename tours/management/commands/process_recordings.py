@@ -0,0 +1,34 @@
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tours.jobs import claim_jobs, run_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued recordings (metadata, event normalization, thumbnail frames)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Size of the process pool used for CPU-heavy work')
+        parser.add_argument('--once', action='store_true', help='Drain the due jobs once and exit')
+        parser.add_argument('--poll-interval', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        workers = max(1, options['workers'])
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                close_old_connections()
+                jobs = claim_jobs(worker_id, limit=workers)
+                if jobs:
+                    run_jobs(jobs, executor=pool)
+                    self.stdout.write(f'Processed {len(jobs)} recordings')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
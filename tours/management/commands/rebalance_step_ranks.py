@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tours.steps import rebalance, tours_needing_rebalance
+
+
+class Command(BaseCommand):
+    help = 'Respace the step ranks of tours whose ranks have grown long from repeated inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep checking every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.STEP_RANK_REBALANCE_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            tours = tours_needing_rebalance()
+            for tour_id in tours:
+                rebalance(tour_id)
+            if tours or not options['loop']:
+                self.stdout.write(f'Rebalanced {len(tours)} tours')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tours.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Bring every tour\'s full-text search document up to date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_index(options['batch_size'])
+        self.stdout.write(f'Reindexed {written} tours')
@@ -0,0 +1,208 @@
+import itertools
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from analytics.models import StepEvent
+from analytics.rollups import run_rollups
+from analytics.slow_queries import suspended
+from tours.models import Recording, RecordingEventChunk, Tour, TourStep
+from tours.ranks import spread
+from tours.recording_events import chunk_events
+from tours.search import rebuild_index
+from tours.view_buffer import apply_views
+
+WORDS = (
+    'onboarding dashboard billing settings profile invite team report export import integration '
+    'workspace project search filter calendar notification upload template analytics checkout'
+).split()
+EVENT_TYPES = ('move', 'move', 'move', 'scroll', 'click', 'input')
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic users, tours, steps, recordings with event streams, tour '
+        'views and step events for local load testing. Rows are bulk-inserted in batches and every '
+        'run adds to what is there.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--tours', type=int, default=20, help='Tours per user')
+        parser.add_argument('--steps', type=int, default=8, help='Steps per tour')
+        parser.add_argument('--recordings', type=int, default=2, help='Recordings per user')
+        parser.add_argument('--recording-events', type=int, default=2000, help='Events per recording')
+        parser.add_argument('--views', type=int, default=1_000_000,
+                            help='Tour views, folded into view counts and the hourly/daily rollups')
+        parser.add_argument('--step-events', type=int, default=1_000_000, help='Raw StepEvent rows')
+        parser.add_argument('--days', type=int, default=90, help='Spread views and events over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for repeatable data')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Don't rebuild the search index or roll up step events afterwards")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1.')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.span = options['days'] * 86400
+        self.steps = {}
+        self.cum_weights = []
+        self.run = uuid.uuid4().hex[:6]
+        started = time.perf_counter()
+        # Bulk inserts are slow by design here; keep them out of the slow query log.
+        with suspended():
+            users = self.phase('users', self.seed_users, options['users'])
+            tours = self.phase('tours', self.seed_tours, users, options['tours'])
+            self.phase('steps', self.seed_steps, tours, options['steps'])
+            self.phase('recordings', self.seed_recordings, users, options['recordings'],
+                       options['recording_events'])
+            published = [tour.pk for tour in tours if tour.status == 'Published' and tour.privacy == 'public']
+            self.phase('views', self.seed_views, published, users, options['views'], options['days'])
+            self.phase('step events', self.seed_step_events, published, options['step_events'])
+            if not options['skip_derived']:
+                self.phase('search documents', rebuild_index)
+                self.phase('rolled-up step events', run_rollups)
+        self.stdout.write(f'Done in {time.perf_counter() - started:.1f}s')
+
+    def phase(self, name, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        count = result if isinstance(result, int) else len(result)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{name}: {count} in {elapsed:.1f}s ({count / max(elapsed, 1e-6):.0f}/s)')
+        return result
+
+    def when(self):
+        return self.now - timedelta(seconds=self.rng.random() * self.span)
+
+    def title(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words)).capitalize()
+
+    def seed_users(self, count):
+        password = make_password('seed-password')  # hashing once keeps this fast
+        created = []
+        for batch in _batches(range(count), self.batch_size):
+            created += get_user_model().objects.bulk_create(
+                get_user_model()(username=f'seed-{self.run}-{n}', email=f'seed-{self.run}-{n}@example.invalid',
+                                 first_name='Seed', last_name=str(n), password=password)
+                for n in batch
+            )
+        return created
+
+    def seed_tours(self, users, per_user):
+        rows = (
+            Tour(
+                title=self.title(3), description=self.title(12), creator_id=user.pk,
+                status=self.rng.choices(('Published', 'Draft', 'Archived'), (70, 25, 5))[0],
+                privacy=self.rng.choices(('public', 'private'), (80, 20))[0],
+            )
+            for user in users for _ in range(per_user)
+        )
+        created = []
+        for batch in _batches(rows, self.batch_size):
+            created += Tour.objects.bulk_create(batch)
+        return created
+
+    def seed_steps(self, tours, per_tour):
+        ranks = spread(per_tour)
+        rows = (
+            TourStep(
+                tour_id=tour.pk, rank=rank, title=self.title(4), description=self.title(30),
+                highlight_area={
+                    'selector': f'#{self.rng.choice(WORDS)}-{n}',
+                    'x': self.rng.randrange(1200), 'y': self.rng.randrange(800),
+                    'width': self.rng.randrange(40, 400), 'height': self.rng.randrange(20, 200),
+                },
+            )
+            for tour in tours for n, rank in enumerate(ranks)
+        )
+        for batch in _batches(rows, self.batch_size):
+            for step in TourStep.objects.bulk_create(batch):
+                self.steps.setdefault(step.tour_id, []).append(step.pk)
+        return len(tours) * per_tour
+
+    def events(self, count):
+        t = 0
+        for _ in range(count):
+            t += self.rng.randrange(10, 400)
+            yield {'type': self.rng.choice(EVENT_TYPES), 't': t,
+                   'x': self.rng.randrange(1440), 'y': self.rng.randrange(900)}
+
+    def seed_recordings(self, users, per_user, events):
+        recordings = []
+        for batch in _batches((user for user in users for _ in range(per_user)), self.batch_size):
+            recordings += Recording.objects.bulk_create(
+                Recording(user_id=user.pk, title=self.title(3), status='completed', mime_type='video/webm',
+                          completed_at=self.now)
+                for user in batch
+            )
+        chunks = (
+            RecordingEventChunk(recording_id=recording.pk, sequence=sequence, start_ms=start, end_ms=end,
+                                event_count=count, data=data)
+            for recording in recordings
+            for sequence, (start, end, count, data) in enumerate(chunk_events(list(self.events(events))))
+        )
+        for batch in _batches(chunks, self.batch_size):
+            RecordingEventChunk.objects.bulk_create(batch)
+        return recordings
+
+    def popular(self, tour_ids, count):
+        """``count`` tour ids drawn with a long tail: a few tours get most of the traffic."""
+        if len(self.cum_weights) != len(tour_ids):
+            # Built once per list of tours; this runs for every session.
+            self.cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(tour_ids))))
+        return self.rng.choices(tour_ids, cum_weights=self.cum_weights, k=count)
+
+    def seed_views(self, tour_ids, users, count, days):
+        if not tour_ids:
+            return 0
+        # Through the same code as flushed views, so view counts, buckets and
+        # sketches agree. A day at a time, so each bucket row is written about once.
+        for day in range(days):
+            midnight = self.now - timedelta(days=day + 1)
+            for batch in _batches(range(count // days + (day < count % days)), 50_000):
+                apply_views([
+                    [str(tour_id),
+                     self.rng.choice(users).pk if self.rng.random() < 0.3 else None,
+                     f'10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(256)}',
+                     int((midnight + timedelta(seconds=self.rng.random() * 86400)).timestamp())]
+                    for tour_id in self.popular(tour_ids, len(batch))
+                ])
+        return count
+
+    def sessions(self, tour_ids):
+        """Player sessions as StepEvents: steps shown in order, some completed, some dismissed."""
+        while True:
+            tour_id = self.popular(tour_ids, 1)[0]
+            step_ids = self.steps.get(tour_id) or [None]
+            session, at = uuid.uuid4().hex, self.when()
+            reached = self.rng.randrange(1, len(step_ids) + 1)
+            for step_id in step_ids[:reached]:
+                yield StepEvent(tour_id=tour_id, step_id=step_id, session=session, kind=StepEvent.SHOWN,
+                                occurred_at=at, received_at=at)
+                at += timedelta(seconds=self.rng.randrange(2, 40))
+            kind = StepEvent.COMPLETED if reached == len(step_ids) else StepEvent.DISMISSED
+            yield StepEvent(tour_id=tour_id, step_id=step_ids[reached - 1], session=session, kind=kind,
+                            occurred_at=at, received_at=at)
+
+    def seed_step_events(self, tour_ids, count):
+        if not tour_ids:
+            return 0
+        for batch in _batches(itertools.islice(self.sessions(tour_ids), count), self.batch_size):
+            StepEvent.objects.bulk_create(batch)
+        return count
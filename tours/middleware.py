@@ -0,0 +1,24 @@
+from django.conf import settings
+from whitenoise.base import WhiteNoise
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class PublishedTourMiddleware(WhiteNoise):
+    """Serve pre-rendered public tours (tours/prerender.py) straight from disk.
+
+    Bundles are rewritten in place whenever a tour changes, so files are looked
+    up on every request (WhiteNoise's autorefresh mode) instead of being indexed
+    once at startup. Gzip copies, ETags and 304s come from WhiteNoise; anything
+    not on disk falls through to Django's published_tour_view, which builds it.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(None, autorefresh=True, max_age=settings.TOUR_PUBLIC_MAX_AGE, index_file=True)
+        self.get_response = get_response
+        self.add_files(settings.TOUR_STATIC_ROOT, prefix=settings.TOUR_STATIC_URL)
+
+    def __call__(self, request):
+        static_file = self.find_file(request.path_info)
+        if static_file is not None:
+            return WhiteNoiseMiddleware.serve(static_file, request)
+        return self.get_response(request)
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0003_savedtour'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TourPayload',
+            fields=[
+                ('tour', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='tours.tour')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('digest', models.CharField(max_length=40)),
+                ('data', models.BinaryField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0004_tourpayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tour',
+            name='thumbnail_variants',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tourstep',
+            name='screenshot_variants',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
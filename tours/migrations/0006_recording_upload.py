@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0005_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='video',
+            field=models.FileField(blank=True, upload_to='recordings/'),
+        ),
+    ]
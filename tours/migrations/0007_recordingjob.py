@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 13:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0006_recording_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='metadata',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RecordingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recording', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='tours.recording')),
+            ],
+            options={
+                'ordering': ['run_after'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recordingjob',
+            index=models.Index(fields=['status', 'run_after'], name='tours_recor_status_7357f3_idx'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2 on 2026-10-18 14:00
+
+import json
+import zlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+CHUNK_SPAN_MS = 10_000
+CHUNK_MAX_EVENTS = 2_000
+
+
+def _event_time(event):
+    for key in ('t', 'time', 'timestamp'):
+        if isinstance(event.get(key), (int, float)):
+            return int(event[key])
+    return None
+
+
+def move_events_to_chunks(apps, schema_editor):
+    Recording = apps.get_model('tours', 'Recording')
+    RecordingEventChunk = apps.get_model('tours', 'RecordingEventChunk')
+    recordings = Recording.objects.exclude(recording_data__isnull=True).only('pk', 'recording_data')
+    for recording in recordings.iterator(chunk_size=20):
+        raw = recording.recording_data
+        if isinstance(raw, dict):
+            raw = raw.get('events', [])
+        events = []
+        for event in raw if isinstance(raw, list) else []:
+            if isinstance(event, dict) and _event_time(event) is not None:
+                events.append({**event, 't': _event_time(event)})
+        events.sort(key=lambda e: e['t'])
+
+        groups, current = [], []
+        for event in events:
+            if current and (event['t'] - current[0]['t'] >= CHUNK_SPAN_MS or len(current) >= CHUNK_MAX_EVENTS):
+                groups.append(current)
+                current = []
+            current.append(event)
+        if current:
+            groups.append(current)
+        RecordingEventChunk.objects.bulk_create(
+            RecordingEventChunk(
+                recording_id=recording.pk, sequence=i, start_ms=group[0]['t'], end_ms=group[-1]['t'],
+                event_count=len(group),
+                data=zlib.compress(json.dumps(group, separators=(',', ':')).encode(), 6),
+            )
+            for i, group in enumerate(groups)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0007_recordingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordingEventChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('start_ms', models.PositiveBigIntegerField()),
+                ('end_ms', models.PositiveBigIntegerField()),
+                ('event_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('recording', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_chunks', to='tours.recording')),
+            ],
+            options={
+                'ordering': ['recording', 'sequence'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recordingeventchunk',
+            index=models.Index(fields=['recording', 'start_ms'], name='tours_recor_recordi_61768c_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recordingeventchunk',
+            constraint=models.UniqueConstraint(fields=('recording', 'sequence'), name='unique_chunk_per_recording'),
+        ),
+        migrations.RunPython(move_events_to_chunks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='recording',
+            name='recording_data',
+        ),
+    ]
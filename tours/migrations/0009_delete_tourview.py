@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 15:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0008_recording_event_chunks'),
+        # Unique viewers were moved into HyperLogLog sketches before the rows go.
+        ('analytics', '0003_viewer_sketches'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='TourView',
+        ),
+    ]
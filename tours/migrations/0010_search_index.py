@@ -0,0 +1,101 @@
+# Generated by Django 4.2 on 2026-10-18 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE tours_search USING fts5(
+        title, description, steps,
+        content='tours_toursearchdocument', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    # Titles weigh most, then descriptions, then step text.
+    "INSERT INTO tours_search(tours_search, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')",
+    """CREATE TRIGGER tours_search_ai AFTER INSERT ON tours_toursearchdocument BEGIN
+        INSERT INTO tours_search(rowid, title, description, steps)
+        VALUES (new.id, new.title, new.description, new.steps);
+    END""",
+    """CREATE TRIGGER tours_search_ad AFTER DELETE ON tours_toursearchdocument BEGIN
+        INSERT INTO tours_search(tours_search, rowid, title, description, steps)
+        VALUES ('delete', old.id, old.title, old.description, old.steps);
+    END""",
+    """CREATE TRIGGER tours_search_au AFTER UPDATE ON tours_toursearchdocument BEGIN
+        INSERT INTO tours_search(tours_search, rowid, title, description, steps)
+        VALUES ('delete', old.id, old.title, old.description, old.steps);
+        INSERT INTO tours_search(rowid, title, description, steps)
+        VALUES (new.id, new.title, new.description, new.steps);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS tours_search_au",
+    "DROP TRIGGER IF EXISTS tours_search_ad",
+    "DROP TRIGGER IF EXISTS tours_search_ai",
+    "DROP TABLE IF EXISTS tours_search",
+]
+POSTGRESQL_INDEX = [
+    """ALTER TABLE tours_toursearchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A')
+        || setweight(to_tsvector('english', description), 'B')
+        || setweight(to_tsvector('english', steps), 'C')
+    ) STORED""",
+    "CREATE INDEX tours_search_vector_idx ON tours_toursearchdocument USING GIN (search_vector)",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS tours_search_vector_idx",
+    "ALTER TABLE tours_toursearchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def create_index(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_INDEX, "postgresql": POSTGRESQL_INDEX})
+
+
+def drop_index(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_DROP, "postgresql": POSTGRESQL_DROP})
+
+
+def index_existing_tours(apps, schema_editor):
+    Tour = apps.get_model("tours", "Tour")
+    TourStep = apps.get_model("tours", "TourStep")
+    TourSearchDocument = apps.get_model("tours", "TourSearchDocument")
+    tours = Tour.objects.order_by("pk").values_list("pk", "title", "description")
+    batch = []
+    for tour_id, title, description in tours.iterator(chunk_size=500):
+        steps = TourStep.objects.filter(tour_id=tour_id).order_by("step_number").values_list("title", "description")
+        batch.append(TourSearchDocument(
+            tour_id=tour_id,
+            title=title,
+            description=description,
+            steps="\n".join(f"{t}\n{d}".strip() for t, d in steps),
+        ))
+        if len(batch) == 500:
+            TourSearchDocument.objects.bulk_create(batch)
+            batch = []
+    TourSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0009_delete_tourview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TourSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('steps', models.TextField(blank=True)),
+                ('tour', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='tours.tour')),
+            ],
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(index_existing_tours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['creator', '-created_at', '-id'], name='tour_creator_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+import math
+
+from django.db import migrations, models
+
+# A frozen copy of tours.ranks.spread, so later changes to the live module
+# can't change the ranks this migration assigns.
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+
+def spread(count):
+    width = max(1, math.ceil(math.log(count + 1, BASE)))
+    slots = BASE ** width
+    ranks = []
+    for n in range(1, count + 1):
+        value, digits = n * slots // (count + 1), []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        ranks.append("".join(reversed(digits)).rstrip("0"))
+    return ranks
+
+
+def rank_steps(apps, schema_editor):
+    TourStep = apps.get_model("tours", "TourStep")
+    steps = TourStep.objects.order_by("tour_id", "step_number", "pk").values_list("pk", "tour_id")
+    by_tour = {}
+    for pk, tour_id in steps.iterator(chunk_size=2000):
+        by_tour.setdefault(tour_id, []).append(pk)
+    batch = []
+    for pks in by_tour.values():
+        batch += [TourStep(pk=pk, rank=rank) for pk, rank in zip(pks, spread(len(pks)))]
+        if len(batch) >= 1000:
+            TourStep.objects.bulk_update(batch, ["rank"])
+            batch = []
+    TourStep.objects.bulk_update(batch, ["rank"])
+
+
+def number_steps(apps, schema_editor):
+    TourStep = apps.get_model("tours", "TourStep")
+    steps = TourStep.objects.order_by("tour_id", "rank").values_list("pk", "tour_id")
+    batch, previous, number = [], None, 0
+    for pk, tour_id in steps.iterator(chunk_size=2000):
+        number = number + 1 if tour_id == previous else 1
+        previous = tour_id
+        batch.append(TourStep(pk=pk, step_number=number))
+        if len(batch) >= 1000:
+            TourStep.objects.bulk_update(batch, ["step_number"])
+            batch = []
+    TourStep.objects.bulk_update(batch, ["step_number"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0011_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tourstep',
+            name='rank',
+            field=models.CharField(default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='tourstep',
+            name='step_number',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RemoveConstraint(
+            model_name='tourstep',
+            name='unique_step_per_tour',
+        ),
+        migrations.RunPython(rank_steps, number_steps),
+        migrations.RemoveField(
+            model_name='tourstep',
+            name='step_number',
+        ),
+        migrations.AlterModelOptions(
+            name='tourstep',
+            options={'ordering': ['rank']},
+        ),
+        migrations.AddConstraint(
+            model_name='tourstep',
+            constraint=models.UniqueConstraint(fields=('tour', 'rank'), name='unique_step_rank_per_tour'),
+        ),
+    ]
@@ -1,9 +1,27 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.conf import settings
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 import uuid
 
+from .ranks import rank_between
+
+
+class TourQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Annotate step count, latest step time and unique viewers in the same query.
+
+        Unique viewers come from the ``analytics`` app's HyperLogLog estimate.
+        """
+        steps = TourStep.objects.filter(tour=OuterRef("pk")).order_by().values("tour")
+        return self.annotate(
+            annotated_steps_count=Coalesce(Subquery(steps.annotate(n=Count("pk")).values("n")), 0),
+            latest_step_at=Subquery(steps.annotate(latest=Max("created_at")).values("latest")),
+            unique_viewers=Coalesce("analytics__unique_viewers", 0),
+        )
+
 
 class Tour(models.Model):
     PRIVACY_CHOICES = [
@@ -28,22 +46,41 @@ class Tour(models.Model):
     privacy = models.CharField(max_length=10, choices=PRIVACY_CHOICES, default="public")
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="Draft")
     thumbnail = models.ImageField(upload_to="tour_thumbnails/", blank=True, null=True)
+    thumbnail_variants = models.JSONField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     view_count = models.PositiveIntegerField(default=0)
 
+    objects = TourQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["status"]),
             models.Index(fields=["privacy"]),
+            # Keyset pagination of a creator's tours (tourcraft.pagination)
+            models.Index(fields=["creator", "-created_at", "-id"], name="tour_creator_keyset_idx"),
         ]
 
     def __str__(self):
         return f"{self.title} ({self.status})"
 
+    # Status as last read from or written to the database; lets the activity
+    # log tell a publish apart from any other save.
+    loaded_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "status" in field_names:
+            status = values[field_names.index("status")]
+            instance.loaded_status = None if status is models.DEFERRED else status
+        return instance
+
     @property
     def steps_count(self):
+        if hasattr(self, "annotated_steps_count"):
+            return self.annotated_steps_count
         return self.steps.count()
 
     @property
@@ -59,23 +96,64 @@ class Tour(models.Model):
         return self.status == "Published"
 
 
+class TourStepQuerySet(models.QuerySet):
+    def numbered(self):
+        """Annotate each step's 1-based position in its tour, the derived ``step_number``.
+
+        Positions are counted over the rows the query selects, so filter by
+        tour only.
+        """
+        return self.annotate(
+            annotated_step_number=Window(RowNumber(), partition_by=[F("tour_id")], order_by=F("rank").asc())
+        )
+
+
 class TourStep(models.Model):
     tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name="steps")
-    step_number = models.PositiveIntegerField()
+    # Fractional rank (tours/ranks.py): inserting or moving a step rewrites only that step.
+    rank = models.CharField(max_length=64, editable=False)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     screenshot = models.ImageField(upload_to="tour_steps/", blank=True, null=True)
+    screenshot_variants = models.JSONField(blank=True, null=True, editable=False)
     highlight_area = models.JSONField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TourStepQuerySet.as_manager()
+
     class Meta:
-        ordering = ["step_number"]
+        ordering = ["rank"]
         constraints = [
-            models.UniqueConstraint(fields=["tour", "step_number"], name="unique_step_per_tour")
+            models.UniqueConstraint(fields=["tour", "rank"], name="unique_step_rank_per_tour")
         ]
 
     def __str__(self):
-        return f"{self.tour.title} - Step {self.step_number}: {self.title}"
+        # step_number costs a query unless numbered() annotated it; fall back to the rank.
+        number = getattr(self, "annotated_step_number", None)
+        position = f"Step {number}" if number is not None else f"Rank {self.rank}"
+        return f"{self.tour.title} - {position}: {self.title}"
+
+    @property
+    def step_number(self):
+        if hasattr(self, "annotated_step_number"):
+            return self.annotated_step_number
+        return TourStep.objects.filter(tour_id=self.tour_id, rank__lt=self.rank).count() + 1
+
+    def save(self, *args, **kwargs):
+        if self.rank:
+            return super().save(*args, **kwargs)
+        # New steps without a rank go last. A concurrent append may take the
+        # same rank first; the unique constraint catches that and we retry.
+        for attempt in range(3):
+            last = TourStep.objects.filter(tour_id=self.tour_id).order_by("-rank").values_list("rank", flat=True).first()
+            self.rank = rank_between(last, None)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                self.rank = ""
+                if attempt == 2:
+                    raise
 
 
 class SavedTour(models.Model):
@@ -105,7 +183,10 @@ class Recording(models.Model):
     )
     title = models.CharField(max_length=200, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="recording")
-    recording_data = models.JSONField(blank=True, null=True)
+    video = models.FileField(upload_to="recordings/", blank=True)
+    mime_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    metadata = models.JSONField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(blank=True, null=True)
 
@@ -122,22 +203,83 @@ class Recording(models.Model):
         return None
 
 
-class TourView(models.Model):
-    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name="views")
-    viewer = models.ForeignKey(
-        settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
-        null=True,
-        blank=True
-    )
-    ip_address = models.GenericIPAddressField()
-    viewed_at = models.DateTimeField(auto_now_add=True)
+class RecordingEventChunk(models.Model):
+    """A compressed slice of a recording's event stream covering ``start_ms``..``end_ms``."""
+
+    recording = models.ForeignKey(Recording, on_delete=models.CASCADE, related_name="event_chunks")
+    sequence = models.PositiveIntegerField()
+    start_ms = models.PositiveBigIntegerField()
+    end_ms = models.PositiveBigIntegerField()
+    event_count = models.PositiveIntegerField()
+    data = models.BinaryField()  # zlib-compressed compact JSON list of events
 
     class Meta:
+        ordering = ["recording", "sequence"]
         constraints = [
-            models.UniqueConstraint(fields=["tour", "viewer", "ip_address"], name="unique_view_per_user")
+            models.UniqueConstraint(fields=["recording", "sequence"], name="unique_chunk_per_recording")
         ]
-        ordering = ["-viewed_at"]
+        indexes = [
+            models.Index(fields=["recording", "start_ms"]),
+        ]
+
+    def __str__(self):
+        return f"{self.recording_id} events {self.start_ms}-{self.end_ms}ms"
+
+
+class RecordingJob(models.Model):
+    """A unit of background work for ``process_recordings`` workers."""
+
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    recording = models.ForeignKey(Recording, on_delete=models.CASCADE, related_name="jobs")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["run_after"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return f"Job for {self.recording_id} ({self.status}, attempt {self.attempts})"
+
+
+class TourPayload(models.Model):
+    """Precomputed playback JSON for a tour, rebuilt whenever the tour or its steps change."""
+
+    tour = models.OneToOneField(Tour, on_delete=models.CASCADE, primary_key=True, related_name="payload")
+    version = models.PositiveIntegerField(default=1)
+    digest = models.CharField(max_length=40)
+    data = models.BinaryField()  # gzip-compressed compact JSON
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Payload v{self.version} for {self.tour_id}"
+
+
+class TourSearchDocument(models.Model):
+    """The searchable text of a tour and its steps, maintained by ``tours.search``.
+
+    The full-text index itself lives outside the ORM: an FTS5 table kept in
+    sync by triggers on SQLite, a generated ``tsvector`` column with a GIN
+    index on PostgreSQL (see migration 0010).
+    """
+
+    tour = models.OneToOneField(Tour, on_delete=models.CASCADE, related_name="search_document")
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    steps = models.TextField(blank=True)  # every step's title and description, in step order
 
     def __str__(self):
-        return f"View on {self.tour.title} by {self.viewer or self.ip_address}"
\ No newline at end of file
+        return f"Search document for {self.tour_id}"
@@ -0,0 +1,229 @@
+import gzip
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.dispatch import Signal
+
+from tourcraft.metrics import payload_cache
+from tourcraft.transactions import on_commit_once
+
+from . import images
+from .models import Tour, TourPayload
+
+# Sent with ``tour_id`` whenever a tour's stored payload changes or goes away.
+payload_changed = Signal()
+
+
+def _cache_key(tour_id):
+    return f"tours:payload:{tour_id}"
+
+
+def _meta_key(tour_id):
+    return f"tours:payload-meta:{tour_id}"
+
+
+def build_payload(tour):
+    """Playback data for ``tour``: its metadata and every step in order."""
+    return {
+        "tour": {
+            "id": str(tour.pk),
+            "title": tour.title,
+            "description": tour.description,
+            "status": tour.status,
+            "privacy": tour.privacy,
+            "creator_id": tour.creator_id,
+            "updated_at": tour.updated_at,
+            "thumbnail": tour.thumbnail.url if tour.thumbnail else None,
+            "thumbnail_variants": images.describe_variants(tour.thumbnail_variants),
+        },
+        "steps": [
+            {
+                "id": step.id,
+                "step_number": number,
+                "title": step.title,
+                "description": step.description,
+                "screenshot": step.screenshot.url if step.screenshot else None,
+                "screenshot_variants": images.describe_variants(step.screenshot_variants),
+                "highlight_area": step.highlight_area,
+                "recording": None,
+            }
+            for number, step in enumerate(tour.steps.order_by("rank"), 1)
+        ],
+    }
+
+
+def is_public(tour):
+    return tour.status == "Published" and tour.privacy == "public"
+
+
+def _to_entry(payload):
+    return {
+        "version": payload.version,
+        "digest": payload.digest,
+        "built_at": payload.built_at,
+        "body": bytes(payload.data),
+    }
+
+
+def _to_meta(payload, tour):
+    return {
+        "version": payload.version,
+        "digest": payload.digest,
+        "built_at": payload.built_at,
+        "public": is_public(tour),
+        "creator_id": tour.creator_id,
+    }
+
+
+def rebuild_payload(tour_id):
+    """Rebuild and store the payload for ``tour_id``; returns the cache entry or None."""
+    tour = Tour.objects.filter(pk=tour_id).first()
+    if tour is None:
+        cache.delete_many([_cache_key(tour_id), _meta_key(tour_id)])
+        payload_changed.send(sender=TourPayload, tour_id=tour_id)
+        return None
+
+    raw = json.dumps(build_payload(tour), cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    digest = hashlib.sha1(raw).hexdigest()
+
+    payload = TourPayload.objects.filter(tour_id=tour.pk).first()
+    changed = payload is None or payload.digest != digest
+    if changed:
+        body = gzip.compress(raw, mtime=0)
+        if payload is None:
+            try:
+                with transaction.atomic():
+                    payload = TourPayload.objects.create(tour=tour, digest=digest, data=body)
+            except IntegrityError:
+                payload = TourPayload.objects.get(tour_id=tour.pk)
+        if payload.digest != digest:
+            payload.version += 1
+            payload.digest = digest
+            payload.data = body
+            payload.save()
+
+    entry = _to_entry(payload)
+    cache.set_many(
+        {_cache_key(tour_id): entry, _meta_key(tour_id): _to_meta(payload, tour)},
+        settings.TOUR_PAYLOAD_CACHE_TIMEOUT,
+    )
+    if changed:
+        payload_changed.send(sender=TourPayload, tour_id=tour_id)
+    return entry
+
+
+def get_payload_entry(tour_id):
+    """The stored payload for ``tour_id`` with its version, digest and gzip body.
+
+    Served from the cache when possible, otherwise from ``TourPayload``; a tour
+    that was never built is built on first read. Returns None for unknown tours.
+    """
+    key = _cache_key(tour_id)
+    entry = cache.get(key)
+    payload_cache("entry", entry is not None)
+    if entry is not None:
+        return entry
+
+    payload = TourPayload.objects.filter(tour_id=tour_id).first()
+    if payload is None:
+        return rebuild_payload(tour_id)
+    entry = _to_entry(payload)
+    # add() rather than set(): never overwrite a newer payload written by a rebuild.
+    cache.add(key, entry, settings.TOUR_PAYLOAD_CACHE_TIMEOUT)
+    return entry
+
+
+def get_payload_meta(tour_id):
+    """Version, digest and visibility of the stored payload, without its body.
+
+    This is all a conditional request needs, so a 304 never loads the steps.
+    """
+    key = _meta_key(tour_id)
+    meta = cache.get(key)
+    payload_cache("meta", meta is not None)
+    if meta is not None:
+        return meta
+
+    payload = get_stored_payload(tour_id)
+    if payload is None:
+        return None
+    meta = _to_meta(payload, payload.tour)
+    cache.add(key, meta, settings.TOUR_PAYLOAD_CACHE_TIMEOUT)
+    return meta
+
+
+def get_stored_payload(tour_id):
+    """The ``TourPayload`` of ``tour_id`` with its tour, read from the database.
+
+    The gzip body is deferred and loads on first access. A tour that was
+    never built is built first; returns None for unknown tours.
+    """
+    payloads = (
+        TourPayload.objects.filter(tour_id=tour_id)
+        .select_related("tour")
+        .defer("data", "tour__title", "tour__description")
+    )
+    payload = payloads.first()
+    if payload is None:
+        if rebuild_payload(tour_id) is None:
+            return None
+        payload = payloads.first()
+    return payload
+
+
+
+async def aget_payload_entry(tour_id):
+    """Async ``get_payload_entry``; a first build still runs in a thread."""
+    key = _cache_key(tour_id)
+    entry = await cache.aget(key)
+    payload_cache("entry", entry is not None)
+    if entry is not None:
+        return entry
+
+    payload = await TourPayload.objects.filter(tour_id=tour_id).afirst()
+    if payload is None:
+        return await sync_to_async(rebuild_payload)(tour_id)
+    entry = _to_entry(payload)
+    await cache.aadd(key, entry, settings.TOUR_PAYLOAD_CACHE_TIMEOUT)
+    return entry
+
+
+async def aget_payload_meta(tour_id):
+    """Async ``get_payload_meta``."""
+    key = _meta_key(tour_id)
+    meta = await cache.aget(key)
+    payload_cache("meta", meta is not None)
+    if meta is not None:
+        return meta
+
+    payloads = (
+        TourPayload.objects.filter(tour_id=tour_id)
+        .select_related("tour")
+        .defer("data", "tour__title", "tour__description")
+    )
+    payload = await payloads.afirst()
+    if payload is None:
+        if await sync_to_async(rebuild_payload)(tour_id) is None:
+            return None
+        payload = await payloads.afirst()
+    meta = _to_meta(payload, payload.tour)
+    await cache.aadd(key, meta, settings.TOUR_PAYLOAD_CACHE_TIMEOUT)
+    return meta
+
+
+def decode_payload(entry):
+    return json.loads(gzip.decompress(entry["body"]))
+
+
+def get_payload(tour_id):
+    entry = get_payload_entry(tour_id)
+    return decode_payload(entry) if entry is not None else None
+
+
+def schedule_rebuild(tour_id):
+    on_commit_once(("tour-payload", tour_id), lambda: rebuild_payload(tour_id))
@@ -0,0 +1,120 @@
+"""Static copies of published public tours, served without Django.
+
+Each tour gets a directory under TOUR_STATIC_ROOT holding ``index.html`` (a
+standalone player page), ``tour.json`` (its playback payload), gzip copies of
+both, and ``build.json`` with the payload digest it was built from. A bundle is rebuilt only when that digest no longer matches,
+which covers step edits as well as changes to the tour itself.
+PublishedTourMiddleware serves the files; a front proxy can serve the
+directory directly and fall back to Django on a miss, which builds the bundle.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .models import Tour
+from .payloads import get_stored_payload, is_public
+
+BUILT, UNCHANGED, REMOVED = "built", "unchanged", "removed"
+
+
+def bundle_dir(tour_id):
+    return Path(settings.TOUR_STATIC_ROOT) / str(tour_id)
+
+
+def built_digest(tour_id):
+    """Digest of the payload the tour's bundle was built from, or None if there is no bundle."""
+    try:
+        return json.loads((bundle_dir(tour_id) / "build.json").read_bytes())["digest"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write(directory, name, data):
+    # Write beside the target and rename over it, so readers never see half a file.
+    fd, temp = tempfile.mkstemp(dir=directory, prefix=f".{name}.")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+    os.chmod(temp, 0o644)
+    os.replace(temp, directory / name)
+
+
+def remove_tour(tour_id):
+    """Delete the tour's bundle; True if there was one."""
+    directory = bundle_dir(tour_id)
+    if not directory.exists():
+        return False
+    shutil.rmtree(directory, ignore_errors=True)
+    return True
+
+
+def build_tour(tour_id, force=False):
+    """Bring the bundle of ``tour_id`` up to date.
+
+    Returns BUILT or UNCHANGED for published public tours, REMOVED when a tour
+    that is no longer public had a bundle, and None otherwise.
+    """
+    # From the database, not the cache: build_static_tours runs in its own
+    # process, and building from a stale entry would roll the bundle back.
+    payload = get_stored_payload(tour_id)
+    if payload is None or not is_public(payload.tour):
+        return REMOVED if remove_tour(tour_id) else None
+    if not force and built_digest(tour_id) == payload.digest:
+        return UNCHANGED
+
+    body = gzip.decompress(payload.data)
+    decoded = json.loads(body)
+    html = render_to_string("tours/published_tour.html", {"tour": decoded["tour"], "steps": decoded["steps"]})
+    files = {"index.html": html.encode(), "tour.json": body}
+
+    directory = bundle_dir(tour_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, data in files.items():
+        _write(directory, name, data)
+        _write(directory, f"{name}.gz", gzip.compress(data, mtime=0))
+    # Last, so an interrupted build is retried.
+    _write(directory, "build.json", json.dumps({"version": payload.version, "digest": payload.digest}).encode())
+    return BUILT
+
+
+def refresh_tour(tour_id):
+    """Rebuild or drop the tour's bundle if it has one; runs whenever its payload changes.
+
+    Tours without a bundle are left alone: a newly published tour is built by
+    build_static_tours or on its first request, so saving a tour never renders
+    pages nobody has asked for.
+    """
+    if bundle_dir(tour_id).exists():
+        return build_tour(tour_id)
+    return None
+
+
+def build_all(force=False):
+    """Build every published public tour and drop stale bundles; returns counts by outcome."""
+    counts = {BUILT: 0, UNCHANGED: 0, REMOVED: 0}
+    public = Tour.objects.filter(status="Published", privacy="public").order_by("pk")
+    live = set()
+    for tour_id in public.values_list("pk", flat=True).iterator():
+        live.add(str(tour_id))
+        outcome = build_tour(tour_id, force=force)
+        if outcome:
+            counts[outcome] += 1
+
+    root = Path(settings.TOUR_STATIC_ROOT)
+    for directory in root.iterdir() if root.is_dir() else ():
+        if directory.name in live:
+            continue
+        try:
+            tour_id = uuid.UUID(directory.name)
+        except ValueError:
+            continue
+        if build_tour(tour_id) == REMOVED:
+            counts[REMOVED] += 1
+    return counts
@@ -0,0 +1,72 @@
+"""Lexicographic fractional ranks for ordering steps.
+
+A rank is a string of base-36 digits read as a fraction (``"i"`` is 18/36),
+so ranks sort the same as strings and as numbers, and there is always room
+for another rank between two neighbours. Ranks never end in ``"0"``, which
+would make ``"a"`` and ``"a0"`` equal. Only digits and lower-case letters are
+used, so the order is the same under any database collation.
+"""
+
+import math
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+
+def _after(rank):
+    # Appending is the common case: bump the first digit that can be bumped,
+    # so a run of appends only adds a digit every 35 ranks.
+    for n, digit in enumerate(rank):
+        if digit != DIGITS[-1]:
+            return rank[:n] + DIGITS[DIGITS.index(digit) + 1]
+    return rank + DIGITS[1]
+
+
+def _before(rank):
+    for n, digit in enumerate(rank):
+        if DIGITS.index(digit) > 1:
+            return rank[:n] + DIGITS[DIGITS.index(digit) - 1]
+    return _midpoint("", rank)
+
+
+def rank_between(low=None, high=None):
+    """A rank strictly between ``low`` and ``high``; None means no bound on that side."""
+    if low and high is None:
+        return _after(low)
+    if high and low is None:
+        return _before(high)
+    return _midpoint(low or "", high)
+
+
+def _midpoint(low, high):
+    if high is not None and low >= high:
+        raise ValueError(f"{low!r} is not below {high!r}")
+    if high is not None:
+        # Keep the common prefix and split the first digit where they differ.
+        n = 0
+        while n < len(high) and (low[n] if n < len(low) else "0") == high[n]:
+            n += 1
+        if n:
+            return high[:n] + _midpoint(low[n:], high[n:])
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high is not None else BASE
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    if high is not None and len(high) > 1:
+        # Adjacent first digits, but high has more digits: its first digit alone is in between.
+        return high[0]
+    return DIGITS[low_digit] + _midpoint(low[1:], None)
+
+
+def spread(count):
+    """``count`` evenly spaced ranks, as short as possible, in ascending order."""
+    width = max(1, math.ceil(math.log(count + 1, BASE)))
+    slots = BASE ** width
+    ranks = []
+    for n in range(1, count + 1):
+        value, digits = n * slots // (count + 1), []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        ranks.append("".join(reversed(digits)).rstrip("0"))
+    return ranks
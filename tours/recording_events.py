@@ -0,0 +1,139 @@
+import json
+import re
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Recording, RecordingEventChunk
+
+_OFFSET_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*$")
+_UNIT_MS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000}
+
+
+def parse_offset(value):
+    """Milliseconds for a playback offset such as ``30s``, ``1.5m`` or ``4500ms``.
+
+    A bare number is read as seconds. Raises ValueError for anything else.
+    """
+    match = _OFFSET_RE.match(value or "")
+    if not match:
+        raise ValueError(f"Invalid time offset: {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * _UNIT_MS[unit or "s"])
+
+
+def encode_chunk(events):
+    return zlib.compress(json.dumps(events, separators=(",", ":")).encode(), 6)
+
+
+def decode_chunk(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def chunk_events(events, span_ms=None, max_events=None):
+    """Split time-ordered events into ``(start_ms, end_ms, count, data)`` tuples.
+
+    A chunk closes when it covers ``span_ms`` of playback or holds
+    ``max_events`` events, whichever comes first. Pure function, so it can run
+    in a worker process.
+    """
+    span_ms = span_ms or settings.RECORDING_CHUNK_SPAN_MS
+    max_events = max_events or settings.RECORDING_CHUNK_MAX_EVENTS
+    chunks, current = [], []
+    for event in events:
+        if current and (event["t"] - current[0]["t"] >= span_ms or len(current) >= max_events):
+            chunks.append(current)
+            current = []
+        current.append(event)
+    if current:
+        chunks.append(current)
+    return [(c[0]["t"], c[-1]["t"], len(c), encode_chunk(c)) for c in chunks]
+
+
+# Chunk bounds are stored in PositiveBigIntegerFields.
+MAX_EVENT_TIME_MS = 2**63 - 1
+
+
+def _event_time(event):
+    """The event's time in milliseconds, or None if it has none.
+
+    Raises ValueError for negative, non-finite or out-of-range times.
+    """
+    for key in ("t", "time", "timestamp"):
+        value = event.get(key)
+        if isinstance(value, (int, float)):
+            if not 0 <= value <= MAX_EVENT_TIME_MS:  # NaN fails this too
+                raise ValueError(f"Invalid event time: {value!r}")
+            return int(value)
+    return None
+
+
+def append_events(recording_id, events):
+    """Store a batch of raw events as new chunks after the existing ones.
+
+    Raises ValueError, storing nothing, if any event has an invalid time.
+    """
+    events = [
+        {**{k: v for k, v in e.items() if k not in ("time", "timestamp")}, "t": _event_time(e)}
+        for e in events
+        if isinstance(e, dict) and _event_time(e) is not None
+    ]
+    if not events:
+        return 0
+    events.sort(key=lambda e: e["t"])
+    with transaction.atomic():
+        # Serialize appends per recording so sequence numbers don't collide.
+        Recording.objects.select_for_update().only("pk").get(pk=recording_id)
+        last = RecordingEventChunk.objects.filter(recording_id=recording_id).aggregate(last=Max("sequence"))["last"]
+        sequence = 0 if last is None else last + 1
+        RecordingEventChunk.objects.bulk_create(
+            RecordingEventChunk(
+                recording_id=recording_id, sequence=sequence + i,
+                start_ms=start, end_ms=end, event_count=count, data=data,
+            )
+            for i, (start, end, count, data) in enumerate(chunk_events(events))
+        )
+    return len(events)
+
+
+def replace_chunks(recording_id, chunks):
+    """Swap the stored event stream for precomputed ``chunk_events`` output."""
+    with transaction.atomic():
+        RecordingEventChunk.objects.filter(recording_id=recording_id).delete()
+        RecordingEventChunk.objects.bulk_create(
+            RecordingEventChunk(
+                recording_id=recording_id, sequence=i,
+                start_ms=start, end_ms=end, event_count=count, data=data,
+            )
+            for i, (start, end, count, data) in enumerate(chunks)
+        )
+
+
+def load_events(recording_id):
+    """Every stored event in chunk order. Meant for background processing only."""
+    events = []
+    chunks = RecordingEventChunk.objects.filter(recording_id=recording_id).order_by("sequence")
+    for data in chunks.values_list("data", flat=True).iterator(chunk_size=50):
+        events.extend(decode_chunk(data))
+    return events
+
+
+def read_window(recording_id, start_ms, end_ms):
+    """Events with ``start_ms <= t <= end_ms``, reading only the chunks that overlap."""
+    chunks = (
+        RecordingEventChunk.objects.filter(recording_id=recording_id, start_ms__lte=end_ms, end_ms__gte=start_ms)
+        .order_by("sequence")
+        .values_list("data", flat=True)
+    )
+    return [
+        event
+        for data in chunks
+        for event in decode_chunk(data)
+        if start_ms <= event["t"] <= end_ms
+    ]
+
+
+def stream_duration(recording_id):
+    return RecordingEventChunk.objects.filter(recording_id=recording_id).aggregate(end=Max("end_ms"))["end"]
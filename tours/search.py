@@ -0,0 +1,184 @@
+import re
+import uuid
+
+from django.conf import settings
+from django.db import NotSupportedError, connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from tourcraft.transactions import on_commit_once
+
+from .models import Tour, TourSearchDocument, TourStep
+
+FTS_TABLE = "tours_search"  # SQLite only; created by migration 0010
+DOCUMENTS = TourSearchDocument._meta.db_table
+TOURS = Tour._meta.db_table
+MAX_TERMS = 8
+
+# Snippet delimiters: control characters survive HTML escaping untouched and
+# are swapped for <mark> tags afterwards, so tour text can't inject markup.
+_START, _STOP = "\x02", "\x03"
+_WORD = re.compile(r"[^\W_]+")
+
+
+def _document_fields(tour, steps):
+    return {
+        "title": tour.title,
+        "description": tour.description,
+        "steps": "\n".join(f"{title}\n{description}".strip() for title, description in steps),
+    }
+
+
+def index_tours(tour_ids):
+    """Bring the search documents of ``tour_ids`` up to date; returns how many changed.
+
+    Documents of tours that no longer exist go with them (the foreign key
+    cascades), so only live tours are written here. Unchanged documents are
+    left alone so the index isn't churned by saves that don't touch text.
+    """
+    tours = Tour.objects.filter(pk__in=tour_ids).only("title", "description")
+    steps = {}
+    rows = TourStep.objects.filter(tour_id__in=tour_ids).order_by("tour_id", "rank")
+    for tour_id, title, description in rows.values_list("tour_id", "title", "description"):
+        steps.setdefault(tour_id, []).append((title, description))
+    existing = {doc.tour_id: doc for doc in TourSearchDocument.objects.filter(tour_id__in=tour_ids)}
+
+    created, updated = [], []
+    for tour in tours:
+        fields = _document_fields(tour, steps.get(tour.pk, []))
+        doc = existing.get(tour.pk)
+        if doc is None:
+            created.append(TourSearchDocument(tour=tour, **fields))
+        elif any(getattr(doc, name) != value for name, value in fields.items()):
+            for name, value in fields.items():
+                setattr(doc, name, value)
+            updated.append(doc)
+    TourSearchDocument.objects.bulk_create(created, batch_size=500, ignore_conflicts=True)
+    TourSearchDocument.objects.bulk_update(updated, ["title", "description", "steps"], batch_size=500)
+    return len(created) + len(updated)
+
+
+def schedule_index(tour_id):
+    on_commit_once(("tour-search", tour_id), lambda: index_tours([tour_id]))
+
+
+def rebuild_index(batch_size=1000):
+    """Reindex every tour in batches; returns the number of documents written."""
+    written, last = 0, None
+    while True:
+        batch = Tour.objects.order_by("pk")
+        if last is not None:
+            batch = batch.filter(pk__gt=last)
+        ids = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            break
+        written += index_tours(ids)
+        last = ids[-1]
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return written
+
+
+def _terms(query):
+    return [term.lower() for term in _WORD.findall(query)][:MAX_TERMS]
+
+
+def _match_expression(terms, prefix, title_only):
+    """Every term must match; with ``prefix`` the last one may be incomplete."""
+    if connection.vendor == "sqlite":
+        expression = " ".join(f'"{term}"' for term in terms) + ("*" if prefix else "")
+        return f"title : ({expression})" if title_only else expression
+    lexemes = []
+    for n, term in enumerate(terms):
+        suffix = ("*" if prefix and n == len(terms) - 1 else "") + ("A" if title_only else "")
+        lexemes.append(f"{term}:{suffix}" if suffix else term)
+    return " & ".join(lexemes)
+
+
+def _sqlite_search(match, creator_id, limit, snippets):
+    # Rank and limit first, then build snippets for the page of results only.
+    top = (
+        f"SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} "
+        f"JOIN {DOCUMENTS} d ON d.id = {FTS_TABLE}.rowid JOIN {TOURS} t ON t.id = d.tour_id "
+        f"WHERE {FTS_TABLE} MATCH %s AND t.creator_id = %s ORDER BY {FTS_TABLE}.rank LIMIT %s"
+    )
+    snippet = f"snippet({FTS_TABLE}, -1, %s, %s, '…', 16)" if snippets else "''"
+    sql = (
+        f"SELECT d.tour_id, -{FTS_TABLE}.rank, {snippet} FROM {FTS_TABLE} "
+        f"JOIN {DOCUMENTS} d ON d.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid IN ({top}) ORDER BY {FTS_TABLE}.rank"
+    )
+    params = ([_START, _STOP] if snippets else []) + [match, match, creator_id, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _postgresql_search(match, creator_id, limit, snippets):
+    top = (
+        f"SELECT d.id, ts_rank(d.search_vector, q) AS score FROM {DOCUMENTS} d "
+        f"JOIN {TOURS} t ON t.id = d.tour_id, to_tsquery('english', %s) q "
+        f"WHERE d.search_vector @@ q AND t.creator_id = %s ORDER BY score DESC LIMIT %s"
+    )
+    snippet = (
+        "ts_headline('english', concat_ws(' … ', d.title, d.description, d.steps), to_tsquery('english', %s), %s)"
+        if snippets else "''"
+    )
+    options = f"StartSel={_START}, StopSel={_STOP}, MaxWords=20, MinWords=8, MaxFragments=2, FragmentDelimiter=\" … \""
+    sql = f"SELECT d.tour_id, top.score, {snippet} FROM ({top}) top JOIN {DOCUMENTS} d ON d.id = top.id ORDER BY top.score DESC"
+    params = ([match, options] if snippets else []) + [match, creator_id, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search(query, creator_id, limit, prefix, title_only, snippets):
+    terms = _terms(query)
+    if not terms:
+        return []
+    backends = {"sqlite": _sqlite_search, "postgresql": _postgresql_search}
+    if connection.vendor not in backends:
+        raise NotSupportedError(f"Full-text search is not available on {connection.vendor}")
+    rows = backends[connection.vendor](_match_expression(terms, prefix, title_only), creator_id, limit, snippets)
+    return [(uuid.UUID(str(tour_id)), score, snippet) for tour_id, score, snippet in rows]
+
+
+def _highlight(snippet):
+    return escape(snippet).replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def search(query, creator_id, limit=None, prefix=False):
+    """Tours of ``creator_id`` matching every word of ``query``, best first.
+
+    Tour titles weigh most, then descriptions, then step text. Returns dicts
+    with ``tour_id``, ``score`` (higher is better; only comparable within
+    one search) and an HTML-escaped ``snippet`` with matches in <mark> tags.
+    """
+    limit = min(limit or settings.SEARCH_RESULTS_LIMIT, settings.SEARCH_MAX_RESULTS)
+    return [
+        {"tour_id": tour_id, "score": score, "snippet": _highlight(snippet)}
+        for tour_id, score, snippet in _search(query, creator_id, limit, prefix, False, True)
+    ]
+
+
+def autocomplete(query, creator_id, limit=None):
+    """Ids of ``creator_id``'s tours whose titles start with the words typed so far."""
+    limit = min(limit or settings.SEARCH_AUTOCOMPLETE_LIMIT, settings.SEARCH_MAX_RESULTS)
+    return [tour_id for tour_id, _, _ in _search(query, creator_id, limit, True, True, False)]
+
+
+def matching_tour_ids(query):
+    """A subquery of every tour matching ``query``, for filtering querysets; None if it has no words."""
+    terms = _terms(query)
+    if not terms:
+        return None
+    match = _match_expression(terms, True, False)
+    if connection.vendor == "sqlite":
+        sql = (
+            f"SELECT d.tour_id FROM {FTS_TABLE} JOIN {DOCUMENTS} d ON d.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s"
+        )
+    else:
+        sql = f"SELECT tour_id FROM {DOCUMENTS} WHERE search_vector @@ to_tsquery('english', %s)"
+    return RawSQL(sql, [match])
@@ -3,13 +3,33 @@ from rest_framework import serializers
 from .models import Tour, TourStep
 
 class TourSerializer(serializers.ModelSerializer):
+    steps_count = serializers.ReadOnlyField()
+
     class Meta:
         model = Tour
-        fields = ['id', 'title', 'description', 'status', 'creator', 'view_count', 'created_at', 'updated_at']
+        fields = ['id', 'title', 'description', 'status', 'creator', 'view_count', 'steps_count', 'created_at', 'updated_at']
         read_only_fields = ['creator', 'view_count', 'created_at', 'updated_at']
 
 class TourStepSerializer(serializers.ModelSerializer):
+    step_number = serializers.ReadOnlyField()
+
     class Meta:
         model = TourStep
-        fields = ['id', 'tour', 'title', 'content', 'order', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
\ No newline at end of file
+        fields = ['id', 'tour', 'step_number', 'rank', 'title', 'description', 'screenshot', 'highlight_area', 'created_at']
+        read_only_fields = ['tour', 'rank', 'created_at']
+
+
+class StepItemSerializer(serializers.Serializer):
+    """One entry of the full step list sent to ``TourViewSet.steps``.
+
+    Omit ``id`` for a new step; fields left out of an existing step keep their values.
+    """
+    id = serializers.IntegerField(required=False, allow_null=True)
+    title = serializers.CharField(max_length=200, required=False)
+    description = serializers.CharField(required=False, allow_blank=True)
+    highlight_area = serializers.JSONField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        if attrs.get('id') is None and 'title' not in attrs:
+            raise serializers.ValidationError({'title': 'A new step needs a title.'})
+        return attrs
\ No newline at end of file
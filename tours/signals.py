@@ -0,0 +1,60 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from analytics.activity import log_activity
+
+from . import prerender
+from .images import enqueue, needs_variants, process_step, process_tour_thumbnail
+from .models import Tour, TourStep
+from .payloads import payload_changed, schedule_rebuild
+from .search import schedule_index
+from .stats import invalidate_dashboard_stats
+
+
+@receiver(post_save, sender=Tour)
+@receiver(post_delete, sender=Tour)
+def tour_changed(sender, instance, **kwargs):
+    invalidate_dashboard_stats(instance.creator_id)
+    schedule_rebuild(instance.pk)
+    schedule_index(instance.pk)
+
+
+@receiver(post_save, sender=TourStep)
+@receiver(post_delete, sender=TourStep)
+def tour_step_changed(sender, instance, **kwargs):
+    schedule_rebuild(instance.tour_id)
+    schedule_index(instance.tour_id)
+
+
+@receiver(payload_changed)
+def tour_payload_changed(sender, tour_id, **kwargs):
+    prerender.refresh_tour(tour_id)
+
+
+@receiver(post_save, sender=Tour)
+def tour_thumbnail_saved(sender, instance, **kwargs):
+    if needs_variants(instance.thumbnail, instance.thumbnail_variants):
+        enqueue(process_tour_thumbnail, instance.pk)
+
+
+@receiver(post_save, sender=TourStep)
+def tour_step_screenshot_saved(sender, instance, **kwargs):
+    if needs_variants(instance.screenshot, instance.screenshot_variants):
+        enqueue(process_step, instance.pk)
+
+
+@receiver(post_save, sender=Tour)
+def tour_activity_saved(sender, instance, created, **kwargs):
+    if created:
+        action = "created"
+    elif instance.status == "Published" and instance.loaded_status not in (None, "Published"):
+        action = "published"
+    else:
+        action = "updated"
+    instance.loaded_status = instance.status
+    log_activity(instance.creator_id, action, instance.pk, instance.title)
+
+
+@receiver(post_delete, sender=Tour)
+def tour_activity_deleted(sender, instance, **kwargs):
+    log_activity(instance.creator_id, "deleted", instance.pk, instance.title)
@@ -0,0 +1,114 @@
+import fcntl
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Spool:
+    """Append-only JSON-lines buffer shared by every worker process on a host.
+
+    Writers append one line per record to ``<name>.log``. A flusher claims the
+    file by renaming it, so records written while a flush is running land in a
+    fresh file. Claimed files are only removed after they were processed, which
+    means a crash (of a worker or of the flusher) never loses records: leftover
+    ``.claimed`` files are picked up again by the next flush.
+    """
+
+    def __init__(self, directory, name):
+        self.directory = Path(directory)
+        self.name = name
+
+    @property
+    def active_path(self):
+        return self.directory / f"{self.name}.log"
+
+    @property
+    def lock_path(self):
+        return self.directory / f"{self.name}.lock"
+
+    def append(self, record):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        while True:
+            fd = os.open(self.active_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # A flusher may have claimed the file between open() and flock().
+                try:
+                    current = os.stat(self.active_path)
+                except FileNotFoundError:
+                    continue
+                if current.st_ino != os.fstat(fd).st_ino:
+                    continue
+                os.write(fd, line)
+                return
+            finally:
+                os.close(fd)
+
+    def pending_files(self):
+        return sorted(self.directory.glob(f"{self.name}.*.claimed"))
+
+    def depth(self):
+        """Number of records waiting to be flushed."""
+        paths = [self.active_path, *self.pending_files()]
+        total = 0
+        for path in paths:
+            try:
+                with open(path, "rb") as fh:
+                    total += sum(chunk.count(b"\n") for chunk in iter(lambda: fh.read(65536), b""))
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _claim_active(self):
+        claimed = self.directory / f"{self.name}.{uuid.uuid4().hex}.claimed"
+        try:
+            os.rename(self.active_path, claimed)
+        except FileNotFoundError:
+            return
+        # Wait for a writer that was mid-append when the file was renamed.
+        fd = os.open(claimed, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def batch(self):
+        """Claim every pending record and yield them as a list.
+
+        The claimed files are deleted only when the block exits cleanly. If
+        another flusher already holds the spool, an empty list is yielded.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(self.lock_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield []
+                return
+
+            self._claim_active()
+            paths = self.pending_files()
+            records = []
+            for path in paths:
+                with open(path, "rb") as fh:
+                    for line in fh:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            # A torn line from a crashed writer; nothing to recover.
+                            continue
+
+            yield records
+
+            for path in paths:
+                path.unlink(missing_ok=True)
+        finally:
+            os.close(lock_fd)
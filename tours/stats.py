@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Tour
+
+
+def _generation_key(user_id):
+    return f"tours:dashboard-stats-gen:{user_id}"
+
+
+def _stats_key(user_id, generation):
+    return f"tours:dashboard-stats:{user_id}:{generation}"
+
+
+STATS = {
+    "total_tours": Count("pk"),
+    "published_tours": Count("pk", filter=Q(status="Published")),
+    "total_views": Coalesce(Sum("view_count"), 0),
+    "unique_viewers": Coalesce(Sum("analytics__unique_viewers"), 0),
+    "tour_starts": Coalesce(Sum("analytics__starts"), 0),
+    "tour_completions": Coalesce(Sum("analytics__completions"), 0),
+}
+
+
+def compute_dashboard_stats(user_id):
+    return Tour.objects.filter(creator_id=user_id).aggregate(**STATS)
+
+
+def get_dashboard_stats(user):
+    """Tour totals for a creator's dashboard, cached until one of their tours changes."""
+    generation = cache.get_or_set(_generation_key(user.pk), 0, None)
+    key = _stats_key(user.pk, generation)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_dashboard_stats(user.pk)
+        cache.set(key, stats, settings.DASHBOARD_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+async def aget_dashboard_stats(user):
+    """Async ``get_dashboard_stats``."""
+    generation = await cache.aget_or_set(_generation_key(user.pk), 0, None)
+    key = _stats_key(user.pk, generation)
+    stats = await cache.aget(key)
+    if stats is None:
+        stats = await Tour.objects.filter(creator_id=user.pk).aaggregate(**STATS)
+        await cache.aset(key, stats, settings.DASHBOARD_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_dashboard_stats(*user_ids):
+    # Bumping the generation instead of deleting the entry means a request
+    # that computed stats before the change can't write them back afterwards.
+    for user_id in set(user_ids):
+        key = _generation_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
@@ -0,0 +1,212 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import Tour, TourStep
+from .payloads import schedule_rebuild
+from .ranks import rank_between, spread
+from .search import schedule_index
+
+CONTENT_FIELDS = ("title", "description", "highlight_area")
+RANK_MAX_LENGTH = TourStep._meta.get_field("rank").max_length
+
+
+class StepListError(ValueError):
+    pass
+
+
+def _steps_changed(tour_id):
+    # Bulk writes and update() skip the TourStep signals; do their work here.
+    schedule_rebuild(tour_id)
+    schedule_index(tour_id)
+
+
+def _ranks_between(low, high, count):
+    """``count`` ascending ranks strictly between ``low`` and ``high``, split evenly."""
+    if count == 0:
+        return []
+    if high is None:
+        # Appending: consecutive ranks after ``low`` stay short.
+        ranks = []
+        for _ in range(count):
+            low = rank_between(low, None)
+            ranks.append(low)
+        return ranks
+    middle = rank_between(low, high)
+    left = (count - 1) // 2
+    return _ranks_between(low, middle, left) + [middle] + _ranks_between(middle, high, count - 1 - left)
+
+
+def _longest_increasing(ranks):
+    """Indexes of a longest strictly increasing subsequence of ``ranks``."""
+    tails, tail_index, previous = [], [], [None] * len(ranks)
+    for n, rank in enumerate(ranks):
+        at = bisect_left(tails, rank)
+        if at == len(tails):
+            tails.append(rank)
+            tail_index.append(n)
+        else:
+            tails[at], tail_index[at] = rank, n
+        previous[n] = tail_index[at - 1] if at else None
+    kept, n = [], tail_index[-1] if tail_index else None
+    while n is not None:
+        kept.append(n)
+        n = previous[n]
+    return set(kept)
+
+
+def replace_steps(tour, items):
+    """Make ``tour``'s steps exactly ``items``, in list order.
+
+    Each item is a dict of CONTENT_FIELDS, plus ``id`` for an existing step
+    of this tour; steps left out are deleted. The largest set of steps that
+    are already in order keep their ranks, and only the others get new ones,
+    so a reorder writes just the steps that moved. Everything happens in one
+    transaction with a fixed number of queries however many steps there are.
+    Raises StepListError for ids that are repeated or belong to another
+    tour. Returns the steps in their new order, numbered.
+    """
+    ids = [item["id"] for item in items if item.get("id") is not None]
+    if len(ids) != len(set(ids)):
+        raise StepListError("A step id appears more than once.")
+
+    with transaction.atomic():
+        # Serialise concurrent saves of the same tour.
+        Tour.objects.select_for_update().only("pk").get(pk=tour.pk)
+        existing = {step.pk: step for step in TourStep.objects.filter(tour=tour)}
+        unknown = set(ids) - existing.keys()
+        if unknown:
+            raise StepListError(f"Steps {sorted(unknown)} do not belong to this tour.")
+
+        removed = existing.keys() - set(ids)
+        if removed:
+            TourStep.objects.filter(pk__in=removed).delete()
+
+        steps = [existing.get(item.get("id")) or TourStep(tour=tour) for item in items]
+        in_list = [n for n, step in enumerate(steps) if step.pk is not None]
+        kept = {in_list[n] for n in _longest_increasing([steps[n].rank for n in in_list])}
+
+        # Give every other step a rank between the kept steps around it.
+        old_ranks = {}
+
+        def rank_gap(gap, low, high):
+            for step, rank in zip(gap, _ranks_between(low, high, len(gap))):
+                if step.pk is not None:
+                    old_ranks[step.pk] = step.rank
+                step.rank = rank
+
+        low, gap = None, []
+        for n, step in enumerate(steps):
+            if n in kept:
+                rank_gap(gap, low, step.rank)
+                low, gap = step.rank, []
+            else:
+                gap.append(step)
+        rank_gap(gap, low, None)
+
+        created, updated = [], []
+        for step, item in zip(steps, items):
+            changed = step.pk in old_ranks
+            for field in CONTENT_FIELDS:
+                if field in item and getattr(step, field) != item[field]:
+                    setattr(step, field, item[field])
+                    changed = True
+            if step.pk is None:
+                created.append(step)
+            elif changed:
+                updated.append(step)
+
+        # A new rank may still be held by another step that moves. Then park
+        # every moving step outside the digit alphabet first so the final
+        # UPDATE can't collide with an old rank mid-statement.
+        moved = {pk: rank for pk, rank in old_ranks.items() if existing[pk].rank != rank}
+        if any(existing[pk].rank in moved.values() for pk in moved):
+            parked = [TourStep(pk=pk, rank=f"~{pk}") for pk in moved]
+            TourStep.objects.bulk_update(parked, ["rank"], batch_size=500)
+        TourStep.objects.bulk_update(updated, ["rank", *CONTENT_FIELDS], batch_size=500)
+        TourStep.objects.bulk_create(created, batch_size=500)
+
+        if removed or created or updated:
+            Tour.objects.filter(pk=tour.pk).update(updated_at=timezone.now())
+            _steps_changed(tour.pk)
+    for number, step in enumerate(steps, 1):
+        step.annotated_step_number = number
+    return steps
+
+
+def _neighbour_ranks(tour_id, after, exclude=None):
+    """Ranks of the step ``after`` (None for the start) and of the step following it."""
+    steps = TourStep.objects.filter(tour_id=tour_id)
+    if exclude is not None:
+        steps = steps.exclude(pk=exclude)
+    low = None
+    if after is not None:
+        low = steps.filter(pk=after).values_list("rank", flat=True).first()
+        if low is None:
+            raise StepListError(f"Step {after} does not belong to this tour.")
+        steps = steps.filter(rank__gt=low)
+    return low, steps.order_by("rank").values_list("rank", flat=True).first()
+
+
+def _place(tour_id, after, write, exclude=None):
+    """Find a free rank just after step ``after`` and ``write(rank)`` it, retrying on a race."""
+    for attempt in range(3):
+        rank = rank_between(*_neighbour_ranks(tour_id, after, exclude))
+        if len(rank) > RANK_MAX_LENGTH:
+            rebalance(tour_id)
+            continue
+        try:
+            with transaction.atomic():
+                return write(rank)
+        except IntegrityError:
+            # Someone took the same gap first; look at the neighbours again.
+            if attempt == 2:
+                raise
+    raise StepListError("Could not find a free rank for the step.")
+
+
+def insert_step(tour, after=None, **fields):
+    """Create a step right after step id ``after`` (None: first), writing only that row."""
+    def write(rank):
+        return TourStep.objects.create(tour=tour, rank=rank, **fields)
+
+    return _place(tour.pk, after, write)
+
+
+def move_step(step, after=None):
+    """Move ``step`` right after step id ``after`` (None: first), updating only its rank."""
+    if after == step.pk:
+        return step
+
+    def write(rank):
+        TourStep.objects.filter(pk=step.pk).update(rank=rank)
+        step.rank = rank
+
+    _place(step.tour_id, after, write, exclude=step.pk)
+    _steps_changed(step.tour_id)
+    return step
+
+
+def rebalance(tour_id):
+    """Respace ``tour_id``'s step ranks evenly so they are short again; keeps the order."""
+    with transaction.atomic():
+        if not Tour.objects.select_for_update().filter(pk=tour_id).exists():
+            return 0
+        steps = list(TourStep.objects.filter(tour_id=tour_id).order_by("rank").only("pk", "rank"))
+        ranks = spread(len(steps))
+        # Park every step outside the digit alphabet first so the final ranks
+        # can't collide with old ones mid-statement.
+        TourStep.objects.bulk_update([TourStep(pk=s.pk, rank=f"~{s.pk}") for s in steps], ["rank"], batch_size=500)
+        for step, rank in zip(steps, ranks):
+            step.rank = rank
+        TourStep.objects.bulk_update(steps, ["rank"], batch_size=500)
+    return len(steps)
+
+
+def tours_needing_rebalance():
+    """Ids of tours with a step rank longer than STEP_RANK_REBALANCE_LENGTH."""
+    long_ranks = TourStep.objects.annotate(length=Length("rank")).filter(length__gt=settings.STEP_RANK_REBALANCE_LENGTH)
+    return list(long_ranks.order_by().values_list("tour_id", flat=True).distinct())
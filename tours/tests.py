@@ -1,3 +1,1645 @@
-from django.test import TestCase
+import fcntl
+import gzip
+import io
+import itertools
+import json
+import multiprocessing
+import pstats
+import re
+import tempfile
+import tracemalloc
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, resolve, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+from prometheus_client.parser import text_string_to_metric_families
+from rest_framework.test import APIClient
+
+from analytics.models import ActivityLog, Analytics, StepEvent, TourDailyStats
+
+from .bundles import BundleError, export_tour, import_bundle, write_bundle
+from . import payloads, prerender, views
+from .api_views import TourViewSet
+from .jobs import claim_jobs, normalize_events, run_jobs
+from .models import (
+    Recording, RecordingEventChunk, RecordingJob, SavedTour, Tour, TourPayload, TourSearchDocument, TourStep,
+)
+from .payloads import get_payload, get_payload_entry, rebuild_payload
+from tourcraft import metrics
+from tourcraft.middleware import QueryBudgetExceeded, QueryCounter, _declared_budget
+from tourcraft.pagination import keyset_page
+
+from . import steps as tour_steps
+from .ranks import rank_between, spread
+from .search import autocomplete, matching_tour_ids, rebuild_index, search
+from .recording_events import append_events, chunk_events, load_events, parse_offset, read_window
+from .stats import compute_dashboard_stats, get_dashboard_stats, invalidate_dashboard_stats
+from .uploads import UploadClosed, append_chunk, finalize_upload, part_path
+from .view_buffer import flush_views, get_spool, record_view
+
+User = get_user_model()
+
+# Templates use {% static %}; the manifest storage needs collectstatic first.
+plain_static = override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+
+
+def use_temp_dir(testcase, setting):
+    """Point ``setting`` at a temporary directory for the duration of the test."""
+    directory = tempfile.TemporaryDirectory()
+    testcase.addCleanup(directory.cleanup)
+    settings_override = override_settings(**{setting: directory.name})
+    settings_override.enable()
+    testcase.addCleanup(settings_override.disable)
+    return directory.name
+
+
+def in_other_process(func, *args):
+    """Run ``func`` in a forked process, as the background commands run beside the web workers."""
+    process = multiprocessing.get_context('fork').Process(target=func, args=args)
+    process.start()
+    process.join()
+    assert process.exitcode == 0, process.exitcode
+
+
+@plain_static
+class ViewBufferTests(TestCase):
+    def setUp(self):
+        use_temp_dir(self, 'TOUR_VIEW_BUFFER_DIR')
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'pass12345')
+        self.tour = Tour.objects.create(title='Onboarding', creator=self.user, status='Published')
+        cache.clear()
+
+    def test_views_are_buffered_until_flush(self):
+        record_view(self.tour.pk, '10.0.0.1')
+        self.assertFalse(Analytics.objects.exists())
+        self.assertEqual(flush_views(), 1)
+        self.tour.refresh_from_db()
+        self.assertEqual(self.tour.view_count, 1)
+        self.assertEqual(Analytics.objects.get(tour=self.tour).unique_viewers, 1)
+
+    def test_flush_dedupes_viewers_but_counts_every_view(self):
+        for _ in range(3):
+            record_view(self.tour.pk, '10.0.0.1')
+            record_view(self.tour.pk, '10.0.0.2', self.viewer.pk)
+        flush_views()
+        record_view(self.tour.pk, '10.0.0.1')
+        record_view(self.tour.pk, '10.0.0.2', self.viewer.pk)
+        flush_views()
+
+        self.tour.refresh_from_db()
+        self.assertEqual(self.tour.view_count, 8)
+        analytics = Analytics.objects.get(tour=self.tour)
+        self.assertEqual((analytics.total_views, analytics.unique_viewers), (8, 2))
+
+    def test_claimed_batch_survives_a_failed_flush(self):
+        record_view(self.tour.pk, '10.0.0.1')
+        spool = get_spool()
+        with self.assertRaises(RuntimeError):
+            with spool.batch() as records:
+                self.assertEqual(len(records), 1)
+                raise RuntimeError('worker killed mid-flush')
+
+        # Views recorded after the crash and the orphaned batch are both flushed.
+        record_view(self.tour.pk, '10.0.0.2')
+        self.assertEqual(flush_views(), 2)
+        self.tour.refresh_from_db()
+        self.assertEqual(self.tour.view_count, 2)
+        self.assertEqual(spool.depth(), 0)
+
+    def test_views_for_deleted_tours_are_dropped(self):
+        other = Tour.objects.create(title='Gone', creator=self.user)
+        record_view(other.pk, '10.0.0.1')
+        other.delete()
+        record_view(self.tour.pk, '10.0.0.1')
+        flush_views()
+        self.assertEqual(list(Analytics.objects.values_list('tour_id', flat=True)), [self.tour.pk])
+
+    def test_preview_records_a_view(self):
+        self.client.get(reverse('tours:tour_preview', args=[self.tour.pk]))
+        self.assertEqual(get_spool().depth(), 1)
+
+    def test_preview_hides_unpublished_or_private_tours_from_others(self):
+        draft = Tour.objects.create(title='Draft', creator=self.user, privacy='private')
+        url = reverse('tours:tour_preview', args=[draft.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.viewer)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(get_spool().depth(), 0)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('tours:tour_preview', args=[self.tour.pk])).status_code, 200)
+
+    def test_flush_invalidates_dashboard_stats(self):
+        self.assertEqual(get_dashboard_stats(self.user)['total_views'], 0)
+        record_view(self.tour.pk, '10.0.0.1')
+        with self.captureOnCommitCallbacks(execute=True):
+            flush_views()
+        self.assertEqual(get_dashboard_stats(self.user)['total_views'], 1)
+
+
+@plain_static
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        Tour.objects.create(title='Draft', creator=self.user, view_count=5)
+        Tour.objects.create(title='Live', creator=self.user, status='Published', view_count=1200)
+
+    def test_stats_come_from_one_aggregate_query(self):
+        with self.assertNumQueries(1):
+            stats = compute_dashboard_stats(self.user.pk)
+        self.assertEqual(stats, {'total_tours': 2, 'published_tours': 1, 'total_views': 1205, 'unique_viewers': 0,
+                                 'tour_starts': 0, 'tour_completions': 0})
+
+    def test_cached_stats_are_invalidated_by_tour_changes(self):
+        get_dashboard_stats(self.user)
+        with self.assertNumQueries(0):
+            get_dashboard_stats(self.user)
+
+        Tour.objects.create(title='Another', creator=self.user, status='Published')
+        self.assertEqual(get_dashboard_stats(self.user), compute_dashboard_stats(self.user.pk))
+        self.assertEqual(get_dashboard_stats(self.user)['published_tours'], 2)
+
+        Tour.objects.filter(title='Live').get().delete()
+        self.assertEqual(get_dashboard_stats(self.user), compute_dashboard_stats(self.user.pk))
+
+    def test_invalidation_reaches_other_processes(self):
+        # flush_tour_views invalidates from its own process; the web workers must see it.
+        get_dashboard_stats(self.user)
+        Tour.objects.filter(creator=self.user).update(view_count=0)
+        in_other_process(invalidate_dashboard_stats, self.user.pk)
+        self.assertEqual(get_dashboard_stats(self.user)['total_views'], 0)
+
+    def test_empty_dashboard(self):
+        other = User.objects.create_user('new', 'new@example.com', 'pass12345')
+        self.assertEqual(get_dashboard_stats(other), {
+            'total_tours': 0, 'published_tours': 0, 'total_views': 0, 'unique_viewers': 0,
+            'tour_starts': 0, 'tour_completions': 0,
+        })
+
+    def test_dashboard_stats_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/tours/dashboard_stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_views'], 1205)
+
+
+class TourQuerySetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def make_tours(self, username, count):
+        user = User.objects.create_user(username, f'{username}@example.com', 'pass12345')
+        tours = Tour.objects.bulk_create(Tour(title=f'Tour {i}', creator=user) for i in range(count))
+        TourStep.objects.bulk_create(
+            TourStep(tour=tour, rank=rank, title=f'Step {n}') for tour in tours for n, rank in ((1, 'a'), (2, 'b'))
+        )
+        return user
+
+    def list_queries(self, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tours/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(tour['steps_count'] == 2 for tour in response.data['results']))
+        return len(queries)
+
+    def test_list_query_count_does_not_grow_with_tours(self):
+        small = self.list_queries(self.make_tours('small', 10))
+        large = self.list_queries(self.make_tours('large', 1000))
+        self.assertEqual(small, large)
+
+    def test_with_stats_annotations(self):
+        user = self.make_tours('creator', 1)
+        tour = Tour.objects.filter(creator=user).with_stats().get()
+        Analytics.objects.create(tour=tour, unique_viewers=1)
+        tour = Tour.objects.with_stats().get(pk=tour.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(tour.steps_count, 2)
+            self.assertEqual(tour.unique_viewers, 1)
+            self.assertIsNotNone(tour.latest_step_at)
+
+    def test_steps_count_without_annotation(self):
+        user = self.make_tours('creator', 1)
+        self.assertEqual(Tour.objects.get(creator=user).steps_count, 2)
+
+
+@plain_static
+class TourPayloadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour = Tour.objects.create(title='Onboarding', creator=self.user, status='Published')
+            for n in (1, 2, 3):
+                TourStep.objects.create(tour=self.tour, title=f'Step {n}',
+                                        highlight_area={'x': n, 'y': 0, 'width': 10, 'height': 10})
+
+    def test_payload_is_built_on_change(self):
+        payload = get_payload(self.tour.pk)
+        self.assertEqual(payload['tour']['title'], 'Onboarding')
+        self.assertEqual([step['step_number'] for step in payload['steps']], [1, 2, 3])
+        self.assertEqual(payload['steps'][0]['highlight_area']['x'], 1)
+
+    def test_reads_do_not_touch_the_database(self):
+        get_payload(self.tour.pk)
+        with self.assertNumQueries(0):
+            get_payload(self.tour.pk)
+
+    def test_cache_miss_is_one_query(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(get_payload(self.tour.pk)['steps']), 3)
+
+    def test_step_changes_bump_the_version(self):
+        version = get_payload_entry(self.tour.pk)['version']
+        step = self.tour.steps.get(title='Step 2')
+        step.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            step.save()
+        entry = get_payload_entry(self.tour.pk)
+        self.assertEqual(entry['version'], version + 1)
+        self.assertEqual(get_payload(self.tour.pk)['steps'][1]['title'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            step.delete()
+        self.assertEqual(len(get_payload(self.tour.pk)['steps']), 2)
+
+    def test_unchanged_save_keeps_the_version(self):
+        version = TourPayload.objects.get(tour=self.tour).version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour.steps.get(title='Step 1').save()
+        self.assertEqual(TourPayload.objects.get(tour=self.tour).version, version)
+
+    def test_deleted_tour_has_no_payload(self):
+        tour_id = self.tour.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour.delete()
+        self.assertIsNone(get_payload(tour_id))
+
+    def test_preview_renders_from_payload(self):
+        use_temp_dir(self, 'TOUR_VIEW_BUFFER_DIR')
+        response = self.client.get(reverse('tours:tour_preview', args=[self.tour.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['steps']), 3)
+
+
+class PublicTourDataTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour = Tour.objects.create(title='Public', creator=self.user, status='Published')
+            TourStep.objects.create(tour=self.tour, title='Welcome')
+        self.url = reverse('tours:tour_public_data', args=[self.tour.pk])
+
+    def test_gzip_body_with_validators(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('stale-while-revalidate', response['Cache-Control'])
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        payload = json.loads(gzip.decompress(response.content))
+        self.assertEqual(payload['steps'][0]['title'], 'Welcome')
+
+    def test_identity_body(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.json()['tour']['title'], 'Public')
+
+    def test_not_modified_without_loading_steps(self):
+        etag = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_with_steps(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            TourStep.objects.create(tour=self.tour, title='Next')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_private_and_draft_tours_are_hidden(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour.privacy = 'private'
+            self.tour.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            draft = Tour.objects.create(title='Draft', creator=self.user)
+        self.assertEqual(self.client.get(reverse('tours:tour_public_data', args=[draft.pk])).status_code, 404)
+
+    def test_rebuilds_in_other_processes_reach_this_one(self):
+        # Edits are saved by whichever worker handled them; every worker must serve the result.
+        self.assertEqual(self.client.get(self.url).json()['steps'][0]['title'], 'Welcome')
+        TourStep.objects.filter(tour=self.tour).update(title='Edited')
+        in_other_process(rebuild_payload, self.tour.pk)
+        self.assertEqual(self.client.get(self.url).json()['steps'][0]['title'], 'Edited')
+
+        Tour.objects.filter(pk=self.tour.pk).update(privacy='private')
+        in_other_process(rebuild_payload, self.tour.pk)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_owner_api_data(self):
+        url = reverse('tours:tour_api_data', args=[self.tour.pk])
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+
+def png_upload(name='shot.png', size=(2000, 1000)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (30, 120, 200)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_temp_dir(self, 'MEDIA_ROOT')
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.tour = Tour.objects.create(title='Screens', creator=self.user, status='Published')
+
+    def test_upload_generates_variants_and_payload_lists_them(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            step = TourStep.objects.create(tour=self.tour, title='One', screenshot=png_upload())
+        step.refresh_from_db()
+        widths = [v['width'] for v in step.screenshot_variants['variants']]
+        self.assertEqual(widths, [320, 768, 1440])
+        self.assertTrue(step.screenshot_variants['placeholder'].startswith('data:image/webp;base64,'))
+        for variant in step.screenshot_variants['variants']:
+            with default_storage.open(variant['name']) as fh:
+                self.assertEqual(Image.open(fh).size[0], variant['width'])
+
+        described = get_payload(self.tour.pk)['steps'][0]['screenshot_variants']
+        self.assertEqual(len(described['variants']), 3)
+        self.assertIn(' 768w', described['srcset'])
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            step = TourStep.objects.create(tour=self.tour, title='One',
+                                           screenshot=png_upload(size=(500, 300)))
+        step.refresh_from_db()
+        self.assertEqual([v['width'] for v in step.screenshot_variants['variants']], [320, 500])
+
+    def test_thumbnail_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour.thumbnail = png_upload('thumb.png', (800, 450))
+            self.tour.save()
+        self.tour.refresh_from_db()
+        self.assertEqual(self.tour.thumbnail_variants['source'], self.tour.thumbnail.name)
+
+    def test_backfill_is_idempotent(self):
+        step = TourStep.objects.create(tour=self.tour, title='One', screenshot=png_upload())
+        TourStep.objects.filter(pk=step.pk).update(screenshot_variants=None)
+
+        call_command('build_image_variants', workers=1, stdout=io.StringIO())
+        step.refresh_from_db()
+        first = step.screenshot_variants
+        self.assertIsNotNone(first)
+
+        out = io.StringIO()
+        call_command('build_image_variants', workers=1, stdout=out)
+        self.assertIn('Processed 0 images', out.getvalue())
+        step.refresh_from_db()
+        self.assertEqual(step.screenshot_variants, first)
+
+
+class RecordingUploadTests(TestCase):
+    def setUp(self):
+        use_temp_dir(self, 'MEDIA_ROOT')
+        use_temp_dir(self, 'RECORDING_UPLOAD_DIR')
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('tours:recording_create'), {'title': 'Demo', 'mime_type': 'video/webm'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.recording = Recording.objects.get(pk=response.json()['id'])
+        self.upload_url = reverse('tours:recording_upload', args=[self.recording.pk])
+
+    def patch(self, data, offset):
+        return self.client.patch(self.upload_url, data, content_type='application/octet-stream',
+                                 HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunks_are_appended_and_finalized(self):
+        self.assertEqual(self.patch(b'a' * 10, 0).json()['offset'], 10)
+        self.assertEqual(self.patch(b'b' * 5, 10).json()['offset'], 15)
+
+        response = self.client.post(reverse('tours:recording_finalize', args=[self.recording.pk]))
+        self.assertEqual(response.json()['status'], 'processing')
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.size, 15)
+        with self.recording.video.open('rb') as fh:
+            self.assertEqual(fh.read(), b'a' * 10 + b'b' * 5)
+        self.assertEqual(self.recording.jobs.get().status, 'queued')
+
+    def test_resume_after_dropped_chunk(self):
+        self.patch(b'a' * 10, 0)
+        # The client believes its next chunk failed and retries from a stale offset.
+        response = self.patch(b'b' * 5, 4)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '10')
+        self.assertEqual(self.client.get(self.upload_url).json()['offset'], 10)
+        self.assertEqual(self.patch(b'b' * 5, 10).status_code, 200)
+
+    def test_finalized_recordings_reject_chunks(self):
+        self.patch(b'a', 0)
+        self.client.post(reverse('tours:recording_finalize', args=[self.recording.pk]))
+        self.assertEqual(self.patch(b'b', 1).status_code, 409)
+        self.assertEqual(self.client.post(reverse('tours:recording_finalize', args=[self.recording.pk])).status_code, 409)
+
+    def test_chunks_for_a_stale_recording_are_rejected_after_finalize(self):
+        self.patch(b'a' * 10, 0)
+        finalize_upload(self.recording.pk)  # self.recording still says 'recording'
+        with self.assertRaises(UploadClosed):
+            append_chunk(self.recording, io.BytesIO(b'b' * 5), 10)
+        self.assertFalse(part_path(self.recording.pk).exists())
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.size, 10)
+
+    def test_finalize_waits_for_the_chunk_being_written(self):
+        self.patch(b'a' * 10, 0)
+        with mock.patch('tours.uploads.fcntl.flock', wraps=fcntl.flock) as flock:
+            finalize_upload(self.recording.pk)
+        flock.assert_called_once_with(mock.ANY, fcntl.LOCK_EX)
+
+    def test_malformed_headers_are_told_apart(self):
+        response = self.client.patch(self.upload_url, b'a', content_type='application/octet-stream')
+        self.assertEqual(response.json()['error'], 'Upload-Offset header is required')
+        response = self.client.patch(self.upload_url, b'a', content_type='application/octet-stream',
+                                     HTTP_UPLOAD_OFFSET='0', CONTENT_LENGTH='one')
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'Invalid Content-Length header'))
+
+    def test_other_users_cannot_upload(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        self.client.force_login(other)
+        self.assertEqual(self.patch(b'a', 0).status_code, 404)
+
+
+@override_settings(RECORDING_JOB_MAX_ATTEMPTS=2, RECORDING_JOB_RETRY_DELAY=30)
+class RecordingJobTests(TestCase):
+    def setUp(self):
+        use_temp_dir(self, 'MEDIA_ROOT')
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.recording = Recording.objects.create(
+            user=self.user, status='processing', video=SimpleUploadedFile('clip.webm', b'webm-bytes'),
+        )
+        append_events(self.recording.pk, [{'type': 'click', 'timestamp': 5000}, {'type': 'scroll', 'timestamp': 1000},
+                                          {'type': 'scroll', 'timestamp': 1000}])
+        self.job = RecordingJob.objects.create(recording=self.recording)
+
+    def test_worker_completes_recording(self):
+        run_jobs(claim_jobs('test', limit=5))
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.status, 'completed')
+        self.assertIsNotNone(self.recording.completed_at)
+        self.assertEqual(self.recording.metadata['size'], len(b'webm-bytes'))
+        self.assertEqual(self.recording.metadata['duration_ms'], 4000)
+        self.assertEqual(load_events(self.recording.pk), [{'type': 'scroll', 't': 0}, {'type': 'click', 't': 4000}])
+        self.assertEqual(RecordingJob.objects.get().status, 'done')
+
+    def test_command_runs_jobs_in_a_process_pool(self):
+        call_command('process_recordings', once=True, workers=2, stdout=io.StringIO())
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.status, 'completed')
+
+    def test_jobs_are_claimed_once(self):
+        self.assertEqual(len(claim_jobs('a', limit=5)), 1)
+        self.assertEqual(claim_jobs('b', limit=5), [])
+
+    def test_failures_back_off_then_fail(self):
+        self.recording.video.storage.delete(self.recording.video.name)
+
+        run_jobs(claim_jobs('test', limit=5))
+        job = RecordingJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(claim_jobs('test', limit=5), [])  # not due yet
+
+        RecordingJob.objects.update(run_after=timezone.now())
+        run_jobs(claim_jobs('test', limit=5))
+        self.assertEqual(RecordingJob.objects.get().status, 'failed')
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.status, 'failed')
+
+    def test_orphaned_jobs_are_reclaimed_after_the_lease(self):
+        claim_jobs('crashed', limit=5)
+        self.assertEqual(claim_jobs('other', limit=5), [])
+        RecordingJob.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(claim_jobs('other', limit=5)), 1)
+
+    def test_orphans_on_their_last_attempt_fail(self):
+        # A job that keeps crashing its worker must not be reclaimed forever.
+        RecordingJob.objects.update(status='running', attempts=settings.RECORDING_JOB_MAX_ATTEMPTS,
+                                    locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_jobs('other', limit=5), [])
+        self.assertEqual(RecordingJob.objects.get().status, 'failed')
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.status, 'failed')
+
+    def test_setup_errors_fail_only_their_job(self):
+        other = Recording.objects.create(user=self.user, status='processing',
+                                         video=SimpleUploadedFile('other.webm', b'more-bytes'))
+        RecordingJob.objects.create(recording=other)
+        def unreadable(recording_id):
+            if recording_id == self.recording.pk:
+                raise OSError('unreadable')
+            return load_events(recording_id)
+
+        with mock.patch('tours.jobs.load_events', side_effect=unreadable):
+            run_jobs(claim_jobs('test', limit=5))
+        job = RecordingJob.objects.get(recording=self.recording)
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('unreadable', job.last_error)
+        self.assertEqual(RecordingJob.objects.get(recording=other).status, 'done')
+
+    def test_normalize_events_accepts_wrapped_lists(self):
+        self.assertEqual(normalize_events({'events': [{'t': 10}, {'time': 25}, {'x': 1}]}), [{'t': 0}, {'t': 15}])
+
+
+@override_settings(RECORDING_CHUNK_SPAN_MS=10_000, RECORDING_CHUNK_MAX_EVENTS=50)
+class RecordingEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.client.force_login(self.user)
+        self.recording = Recording.objects.create(user=self.user)
+        self.url = reverse('tours:recording_events', args=[self.recording.pk])
+
+    def test_parse_offset(self):
+        self.assertEqual(parse_offset('30s'), 30_000)
+        self.assertEqual(parse_offset('1.5m'), 90_000)
+        self.assertEqual(parse_offset('4500ms'), 4500)
+        self.assertEqual(parse_offset('2'), 2000)
+        with self.assertRaises(ValueError):
+            parse_offset('soon')
+
+    def test_chunks_split_on_span_and_size(self):
+        events = [{'t': t} for t in range(0, 30_000, 100)]
+        chunks = chunk_events(events)
+        self.assertEqual(sum(count for _, _, count, _ in chunks), len(events))
+        self.assertTrue(all(count <= 50 for _, _, count, _ in chunks))
+        self.assertEqual(chunks[0][:2], (0, 4900))
+
+    def test_window_reads_only_overlapping_chunks(self):
+        append_events(self.recording.pk, [{'type': 'move', 't': t} for t in range(0, 120_000, 1000)])
+        self.assertEqual(self.recording.event_chunks.count(), 12)
+
+        with CaptureQueriesContext(connection) as queries:
+            events = read_window(self.recording.pk, 30_000, 45_000)
+        self.assertEqual([e['t'] for e in events], list(range(30_000, 46_000, 1000)))
+        self.assertEqual(len(queries), 1)
+
+    def test_events_endpoint(self):
+        response = self.client.post(self.url, [{'type': 'click', 'time': t} for t in (500, 31_000, 44_000, 70_000)],
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'stored': 4})
+
+        data = self.client.get(self.url, {'from': '30s', 'to': '45s'}).json()
+        self.assertEqual([e['t'] for e in data['events']], [31_000, 44_000])
+        self.assertEqual((data['duration_ms'], data['next_from_ms']), (70_000, 45_001))
+        self.assertEqual(len(self.client.get(self.url).json()['events']), 3)  # default 60s window
+        self.assertEqual(self.client.get(self.url, {'from': 'later'}).status_code, 400)
+
+    def test_invalid_event_times_are_rejected(self):
+        for bad in (-5, 2**63, float('nan')):
+            with self.assertRaises(ValueError):
+                append_events(self.recording.pk, [{'t': 100}, {'t': bad}])
+        response = self.client.post(self.url, [{'type': 'click', 't': 100}, {'type': 'scroll', 't': -5}],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RecordingEventChunk.objects.filter(recording=self.recording).exists())
+
+    def test_events_are_owner_only_and_closed_after_recording(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        self.client.force_login(self.user)
+        Recording.objects.filter(pk=self.recording.pk).update(status='processing')
+        response = self.client.post(self.url, [{'t': 1}], content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+
+@plain_static
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.billing = Tour.objects.create(title='Billing setup', description='Invoices and payments', creator=self.user)
+            self.onboarding = Tour.objects.create(title='Onboarding', description='First steps', creator=self.user)
+            TourStep.objects.create(tour=self.onboarding, title='Open settings',
+                                    description='Configure <b>billing</b> details')
+            self.foreign = Tour.objects.create(title='Billing for others', creator=self.other)
+
+    def ids(self, hits):
+        return [hit['tour_id'] for hit in hits]
+
+    def test_title_matches_rank_above_step_matches(self):
+        self.assertEqual(self.ids(search('billing', self.user.pk)), [self.billing.pk, self.onboarding.pk])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.ids(search('billing invoices', self.user.pk)), [self.billing.pk])
+        self.assertEqual(search('!!!', self.user.pk), [])
+
+    def test_words_are_stemmed(self):
+        self.assertEqual(self.ids(search('configured', self.user.pk)), [self.onboarding.pk])
+
+    def test_snippets_are_escaped_and_highlighted(self):
+        snippet = search('configure', self.user.pk)[0]['snippet']
+        self.assertIn('<mark>Configure</mark> &lt;b&gt;billing&lt;/b&gt;', snippet)
+
+    def test_autocomplete_matches_title_prefixes(self):
+        self.assertEqual(autocomplete('bil', self.user.pk), [self.billing.pk])
+        self.assertEqual(autocomplete('billing se', self.user.pk), [self.billing.pk])
+        self.assertEqual(autocomplete('sett', self.user.pk), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        step = self.onboarding.steps.get()
+        step.description = 'Nothing to see'
+        with self.captureOnCommitCallbacks(execute=True):
+            step.save()
+        self.assertEqual(self.ids(search('billing', self.user.pk)), [self.billing.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.billing.delete()
+        self.assertEqual(search('billing', self.user.pk), [])
+        self.assertFalse(TourSearchDocument.objects.filter(tour_id=self.billing.pk).exists())
+
+    def test_rebuild_restores_missing_documents(self):
+        TourSearchDocument.objects.all().delete()
+        self.assertEqual(search('billing', self.user.pk), [])
+        self.assertEqual(rebuild_index(batch_size=2), 3)
+        self.assertEqual(len(search('billing', self.user.pk)), 2)
+        self.assertEqual(rebuild_index(), 0)
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/tours/search/', {'q': 'billing'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['title'] for r in results], ['Billing setup', 'Onboarding'])
+        self.assertGreater(results[0]['score'], results[1]['score'])
+        self.assertEqual(client.get('/api/tours/search/').status_code, 400)
+
+        response = client.get('/api/tours/autocomplete/', {'q': 'onb'})
+        self.assertEqual(response.json()['suggestions'], [{'id': str(self.onboarding.pk), 'title': 'Onboarding'}])
+
+    def test_admin_search_uses_the_index(self):
+        self.assertEqual(
+            set(Tour.objects.filter(pk__in=matching_tour_ids('invoic')).values_list('pk', flat=True)),
+            {self.billing.pk},
+        )
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/tours/tour/', {'q': 'billing'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get('/admin/tours/tour/', {'q': 'other@example'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get('/admin/tours/tourstep/', {'q': 'settings'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+@plain_static
+@override_settings(API_PAGE_SIZE=10, DASHBOARD_TOURS_PAGE_SIZE=10)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        Tour.objects.bulk_create(Tour(title=f'Tour {n}', creator=self.user) for n in range(25))
+        # Ties on created_at are broken by pk.
+        Tour.objects.filter(title__in=['Tour 3', 'Tour 4', 'Tour 5']).update(created_at=timezone.now())
+        self.expected = list(Tour.objects.filter(creator=self.user).order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def test_pages_cover_every_tour_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Tour.objects.filter(creator=self.user), cursor, 10)
+            seen += [tour.pk for tour in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            keyset_page(Tour.objects.all(), 'not-a-cursor', 10)
+
+    def test_api_follows_next_links_without_counting(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        seen, url = [], '/api/tours/'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('COUNT(*)' in q['sql'] or ' OFFSET ' in q['sql'] for q in queries))
+            seen += [tour['id'] for tour in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [str(pk) for pk in self.expected])
+        self.assertEqual(len(client.get('/api/tours/', {'page_size': 5}).data['results']), 5)
+        self.assertEqual(client.get('/api/tours/', {'cursor': 'bogus'}).status_code, 404)
+
+    def test_dashboard_renders_first_page_and_fragments_continue(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('tours:tours_list'))
+        self.assertEqual([tour.pk for tour in response.context['tours']], self.expected[:10])
+
+        seen, cursor = self.expected[:10], response.context['next_cursor']
+        while cursor:
+            response = self.client.get(reverse('tours:dashboard_tours'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            seen += [tour.pk for tour in response.context['tours']]
+            cursor = response.context['next_cursor']
+        self.assertEqual(seen, self.expected)
+        self.assertNotContains(response, 'tour-page-sentinel')
+        self.assertEqual(self.client.get(reverse('tours:dashboard_tours'), {'cursor': 'bogus'}).status_code, 400)
+
+
+class BulkStepsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.tour = Tour.objects.create(title='Onboarding', creator=self.user)
+        self.steps = TourStep.objects.bulk_create(
+            TourStep(tour=self.tour, rank=rank, title=f'Step {n}') for n, rank in enumerate(spread(4), 1)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/tours/{self.tour.pk}/steps/'
+
+    def put(self, items):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put(self.url, items, format='json')
+
+    def titles(self):
+        return [(step.step_number, step.title) for step in self.tour.steps.numbered().order_by('rank')]
+
+    def test_create_update_delete_and_reorder_at_once(self):
+        s1, s2, s3, s4 = self.steps
+        response = self.put([
+            {'id': s4.pk, 'title': 'Step 4'},
+            {'title': 'New', 'description': 'Fresh', 'highlight_area': {'x': 1}},
+            {'id': s1.pk, 'title': 'First, renamed'},
+            {'id': s2.pk, 'title': 'Step 2'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([step['step_number'] for step in response.data], [1, 2, 3, 4])
+        self.assertEqual(self.titles(), [(1, 'Step 4'), (2, 'New'), (3, 'First, renamed'), (4, 'Step 2')])
+        self.assertFalse(TourStep.objects.filter(pk=s3.pk).exists())
+        self.assertEqual(self.tour.steps.get(title='New').highlight_area, {'x': 1})
+        self.assertEqual(get_payload(self.tour.pk)['steps'][1]['title'], 'New')
+
+    def test_swapping_neighbours_respects_the_unique_constraint(self):
+        s1, s2, s3, s4 = self.steps
+        self.put([{'id': s2.pk, 'title': 'Step 2'}, {'id': s1.pk, 'title': 'Step 1'},
+                  {'id': s4.pk, 'title': 'Step 4'}, {'id': s3.pk, 'title': 'Step 3'}])
+        self.assertEqual(self.titles(), [(1, 'Step 2'), (2, 'Step 1'), (3, 'Step 4'), (4, 'Step 3')])
+
+    def test_every_reorder_respects_the_unique_constraint(self):
+        for count in range(1, 6):
+            for order in itertools.permutations(range(count)):
+                TourStep.objects.filter(tour=self.tour).delete()
+                steps = TourStep.objects.bulk_create(
+                    TourStep(tour=self.tour, rank=rank, title=f'Step {n}') for n, rank in enumerate(spread(count))
+                )
+                response = self.put([{'id': steps[n].pk, 'title': steps[n].title} for n in order])
+                self.assertEqual(response.status_code, 200, order)
+                self.assertEqual([title for _, title in self.titles()], [f'Step {n}' for n in order])
+
+    def test_bulk_saves_touch_the_tour(self):
+        Tour.objects.filter(pk=self.tour.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        self.put([{'id': step.pk, 'title': step.title} for step in reversed(self.steps)])
+        self.tour.refresh_from_db()
+        self.assertLess(timezone.now() - self.tour.updated_at, timedelta(minutes=1))
+
+    def test_query_count_does_not_grow_with_steps(self):
+        items = [{'title': f'Step {n}', 'description': 'x' * 50} for n in range(200)]
+        self.put(items)
+        items = [{'id': step['id'], 'title': step['title'].upper()} for step in reversed(self.client.get(self.url).data)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.put(items)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 20)
+        self.assertEqual(self.titles()[0], (1, 'STEP 199'))
+
+    def test_existing_steps_keep_fields_left_out(self):
+        s1, s2, s3, s4 = self.steps
+        response = self.put([{'id': s2.pk}, {'id': s1.pk, 'description': 'Moved'}, {'id': s3.pk}, {'id': s4.pk}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.titles(), [(1, 'Step 2'), (2, 'Step 1'), (3, 'Step 3'), (4, 'Step 4')])
+        self.assertEqual(TourStep.objects.get(pk=s1.pk).description, 'Moved')
+
+    def test_rejects_foreign_and_repeated_ids(self):
+        other = Tour.objects.create(title='Other', creator=self.user)
+        foreign = TourStep.objects.create(tour=other, title='Elsewhere')
+        self.assertEqual(self.put([{'id': foreign.pk, 'title': 'Stolen'}]).status_code, 400)
+        self.assertEqual(self.put([{'id': self.steps[0].pk, 'title': 'A'}, {'id': self.steps[0].pk, 'title': 'B'}]).status_code, 400)
+        self.assertEqual(self.put([{'description': 'no title'}]).status_code, 400)
+        self.assertEqual(self.titles(), [(n, f'Step {n}') for n in range(1, 5)])
+
+    def test_search_index_follows_bulk_saves(self):
+        self.put([{'title': 'Configure invoices'}])
+        self.assertEqual([hit['tour_id'] for hit in search('invoices', self.user.pk)], [self.tour.pk])
+
+    def test_add_step_appends(self):
+        response = self.client.post(f'/api/tours/{self.tour.pk}/add_step/', {'title': 'Last'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['step_number'], 5)
+
+
+class StepRankTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.tour = Tour.objects.create(title='Onboarding', creator=self.user)
+        self.steps = [TourStep.objects.create(tour=self.tour, title=f'Step {n}') for n in range(1, 5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def order(self):
+        return list(self.tour.steps.order_by('rank').values_list('title', flat=True))
+
+    def step_writes(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith(('INSERT INTO "tours_tourstep"', 'UPDATE "tours_tourstep"'))]
+
+    def test_rank_between_keeps_order(self):
+        ranks = []
+        for n in range(500):
+            at = (n * 7919) % (len(ranks) + 1)
+            rank = rank_between(ranks[at - 1] if at else None, ranks[at] if at < len(ranks) else None)
+            ranks.insert(at, rank)
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), 500)
+        self.assertFalse(any(rank.endswith('0') for rank in ranks))
+        self.assertEqual(spread(3), sorted(spread(3)))
+
+    def test_appends_number_steps(self):
+        self.assertEqual([step.step_number for step in self.tour.steps.numbered()], [1, 2, 3, 4])
+        self.assertEqual(self.steps[2].step_number, 3)
+
+    def test_move_writes_one_row(self):
+        url = f'/api/tours/{self.tour.pk}/steps/{self.steps[3].pk}/move/'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'after': self.steps[0].pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['step_number'], 2)
+        self.assertEqual(len(self.step_writes(queries)), 1)
+        self.assertEqual(self.order(), ['Step 1', 'Step 4', 'Step 2', 'Step 3'])
+
+        self.client.post(f'/api/tours/{self.tour.pk}/steps/{self.steps[2].pk}/move/', {'after': None}, format='json')
+        self.assertEqual(self.order(), ['Step 3', 'Step 1', 'Step 4', 'Step 2'])
+        response = self.client.post(url, {'after': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_insert_after_writes_one_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/tours/{self.tour.pk}/add_step/',
+                                        {'title': 'Between', 'after': self.steps[1].pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['step_number'], 3)
+        self.assertEqual(len(self.step_writes(queries)), 1)
+        self.assertEqual(self.order(), ['Step 1', 'Step 2', 'Between', 'Step 3', 'Step 4'])
+
+    def test_insert_retries_when_a_concurrent_insert_takes_the_rank(self):
+        original = tour_steps._neighbour_ranks
+        calls = []
+
+        def racing(*args, **kwargs):
+            neighbours = original(*args, **kwargs)
+            if not calls:
+                # Another request takes the same gap between our read and our write.
+                TourStep.objects.create(tour=self.tour, rank=rank_between(*neighbours), title='Racer')
+            calls.append(args)
+            return neighbours
+
+        with mock.patch.object(tour_steps, '_neighbour_ranks', racing):
+            tour_steps.insert_step(self.tour, after=self.steps[0].pk, title='Mine')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.order(), ['Step 1', 'Mine', 'Racer', 'Step 2', 'Step 3', 'Step 4'])
+
+    def test_str_does_not_count_steps(self):
+        step = TourStep.objects.select_related('tour').get(pk=self.steps[1].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(step), f'Onboarding - Rank {step.rank}: Step 2')
+        numbered = list(self.tour.steps.numbered().select_related('tour'))
+        self.assertEqual(str(numbered[1]), 'Onboarding - Step 2: Step 2')
+
+    def test_reorder_rewrites_only_moved_steps(self):
+        s1, s2, s3, s4 = self.steps
+        items = [{'id': step.pk, 'title': step.title} for step in (s2, s3, s4, s1)]
+        with CaptureQueriesContext(connection) as queries:
+            tour_steps.replace_steps(self.tour, items)
+        updates = self.step_writes(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0].count('WHEN'), 4)  # one step: a CASE branch per written column
+        self.assertEqual(self.order(), ['Step 2', 'Step 3', 'Step 4', 'Step 1'])
+
+    def test_rebalance_shortens_ranks_and_keeps_order(self):
+        for n in range(60):
+            tour_steps.insert_step(self.tour, after=self.steps[0].pk, title=f'Crowded {n}')
+        order = self.order()
+        self.assertEqual(tour_steps.tours_needing_rebalance(), [self.tour.pk])
+        out = io.StringIO()
+        call_command('rebalance_step_ranks', stdout=out)
+        self.assertIn('Rebalanced 1 tours', out.getvalue())
+        self.assertEqual(self.order(), order)
+        self.assertTrue(all(len(rank) <= 2 for rank in self.tour.steps.values_list('rank', flat=True)))
+        self.assertEqual(tour_steps.tours_needing_rebalance(), [])
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class TourBundleTests(TestCase):
+    def setUp(self):
+        use_temp_dir(self, 'MEDIA_ROOT')
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.tour = Tour.objects.create(title='Onboarding', description='Welcome', creator=self.user,
+                                        status='Published', privacy='private')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shot = TourStep.objects.create(tour=self.tour, title='Shot', screenshot=png_upload(size=(800, 400)),
+                                                highlight_area={'x': 10, 'y': 20})
+        self.shot.refresh_from_db()
+        TourStep.objects.create(tour=self.tour, title='Plain', description='Second')
+
+    def bundle(self):
+        buffer = io.BytesIO()
+        write_bundle(self.tour, buffer)
+        buffer.seek(0)
+        return buffer
+
+    def test_round_trip(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = import_bundle(self.bundle(), self.user)
+        self.assertEqual((copy.title, copy.description, copy.privacy, copy.status),
+                         ('Onboarding', 'Welcome', 'private', 'Draft'))
+        steps = list(copy.steps.order_by('rank'))
+        self.assertEqual([(s.title, s.description, s.highlight_area) for s in steps],
+                         [('Shot', '', {'x': 10, 'y': 20}), ('Plain', 'Second', None)])
+        self.assertEqual([s.rank for s in steps], list(self.tour.steps.values_list('rank', flat=True)))
+
+        # The original files still exist, so the copies get new names, and so do their variants.
+        imported = steps[0]
+        self.assertNotEqual(imported.screenshot.name, self.shot.screenshot.name)
+        self.assertTrue(imported.screenshot.name.startswith('tour_steps/'))
+        self.assertEqual(imported.screenshot_variants['source'], imported.screenshot.name)
+        self.assertEqual([v['width'] for v in imported.screenshot_variants['variants']], [320, 768, 800])
+        for variant in imported.screenshot_variants['variants']:
+            self.assertTrue(default_storage.exists(variant['name']))
+        self.assertEqual(get_payload(copy.pk)['steps'][1]['title'], 'Plain')
+
+    def test_export_creates_saved_tour_and_downloads(self):
+        self.client.force_login(self.user)
+        api = APIClient()
+        api.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.post(f'/api/tours/{self.tour.pk}/export/', {'name': 'Backup'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        saved = SavedTour.objects.get(user=self.user)
+        self.assertEqual(saved.name, 'Backup')
+
+        response = self.client.get(reverse('tours:saved_tour_download', args=[saved.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('attachment; filename="backup', response['Content-Disposition'])
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIn(f'media/{self.shot.screenshot.name}', archive.namelist())
+
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('tours:saved_tour_download', args=[saved.pk])).status_code, 404)
+
+    def test_import_endpoint_rejects_bad_bundles(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        upload = SimpleUploadedFile('tour.zip', self.bundle().getvalue(), content_type='application/zip')
+        response = api.post('/api/tours/import/', {'bundle': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['steps_count'], 2)
+
+        garbage = SimpleUploadedFile('tour.zip', b'not a zip', content_type='application/zip')
+        self.assertEqual(api.post('/api/tours/import/', {'bundle': garbage}, format='multipart').status_code, 400)
+
+    def test_damaged_bundle_leaves_nothing_behind(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive, zipfile.ZipFile(self.bundle()) as original:
+            for info in original.infolist():
+                data = original.read(info)
+                if info.filename == 'steps.jsonl':
+                    data += data  # every rank twice: out of order
+                archive.writestr(info, data)
+        files = sorted(default_storage.listdir('tour_steps')[1])
+        tours = Tour.objects.count()
+        with self.assertRaises(BundleError):
+            import_bundle(buffer, self.user)
+        self.assertEqual(Tour.objects.count(), tours)
+        self.assertEqual(sorted(default_storage.listdir('tour_steps')[1]), files)
+
+    def rewritten_bundle(self, name, data):
+        """The bundle with the first step's screenshot replaced by ``data`` stored as ``name``."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive, zipfile.ZipFile(self.bundle()) as original:
+            for info in original.infolist():
+                content = original.read(info)
+                if info.filename == 'steps.jsonl':
+                    steps = [json.loads(line) for line in content.splitlines()]
+                    steps[0].update(screenshot=name, screenshot_variants=None)
+                    content = b''.join(json.dumps(step).encode() + b'\n' for step in steps)
+                if not info.filename.startswith('media/'):
+                    archive.writestr(info, content)
+            archive.writestr(f'media/{name}', data)
+        buffer.seek(0)
+        return buffer
+
+    def test_only_images_are_imported_and_only_under_upload_to(self):
+        html = b'<html><script>alert(1)</script></html>'
+        for name, data in [('pages/evil.html', html), ('tour_steps/evil.png', html),
+                           ('tour_steps/evil.svg', b'<svg xmlns="http://www.w3.org/2000/svg"/>')]:
+            with self.subTest(name=name), self.assertRaises(BundleError):
+                import_bundle(self.rewritten_bundle(name, data), self.user)
+        self.assertFalse(default_storage.exists('pages'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = import_bundle(self.rewritten_bundle('elsewhere/shot.gif', png_upload().read()), self.user)
+        # Stored by its real format under the field's upload_to, whatever the archive called it.
+        name = copy.steps.order_by('rank').first().screenshot.name
+        self.assertRegex(name, r'^tour_steps/[0-9a-f]{32}\.png$')
+        self.assertFalse(default_storage.exists('elsewhere'))
+
+    def test_screenshots_without_variants_get_them_after_import(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = import_bundle(self.rewritten_bundle('tour_steps/bare.png', png_upload().read()), self.user)
+        step = copy.steps.order_by('rank').first()
+        self.assertEqual(step.screenshot_variants['source'], step.screenshot.name)
+        for variant in step.screenshot_variants['variants']:
+            self.assertTrue(default_storage.exists(variant['name']))
+        self.assertIsNotNone(get_payload(copy.pk)['steps'][0]['screenshot_variants'])
+
+    def test_export_memory_does_not_grow_with_the_tour(self):
+        TourStep.objects.bulk_create(
+            TourStep(tour=self.tour, rank=rank, title=f'Step {n}', description='x' * 2000)
+            for n, rank in enumerate(spread(500), 1)
+        )
+        big = default_storage.save('tour_steps/big.png', ContentFile(b'\0' * (4 * 1024 * 1024)))
+        TourStep.objects.filter(pk=self.shot.pk).update(screenshot=big, screenshot_variants=None)
+
+        tracemalloc.start()
+        try:
+            saved = export_tour(self.tour.pk, self.user.pk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # ~1 MB of step text and a 4 MB file went through; neither is held whole.
+        self.assertLess(peak, 1024 * 1024)
+        with zipfile.ZipFile(saved.file_url.open('rb')) as archive:
+            self.assertEqual(sum(1 for _ in archive.open('steps.jsonl')), 502)
+            self.assertEqual(archive.getinfo(f'media/{big}').file_size, 4 * 1024 * 1024)
+
+
+class PrerenderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = use_temp_dir(self, 'TOUR_STATIC_ROOT')
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour = Tour.objects.create(title='Public', creator=self.user, status='Published')
+            self.step = TourStep.objects.create(tour=self.tour, title='First step')
+            self.private = Tour.objects.create(title='Secret', creator=self.user, status='Published',
+                                               privacy='private')
+        self.url = reverse('tours:tour_published', args=[self.tour.pk])
+
+    def build(self, *args):
+        out = io.StringIO()
+        call_command('build_static_tours', *args, stdout=out)
+        return out.getvalue().strip()
+
+    def test_command_builds_public_tours_once(self):
+        self.assertEqual(self.build(), 'Built 1 tours, removed 0, 0 unchanged')
+        self.assertEqual(self.build(), 'Built 0 tours, removed 0, 1 unchanged')
+        self.assertEqual(self.build('--force'), 'Built 1 tours, removed 0, 0 unchanged')
+        directory = prerender.bundle_dir(self.tour.pk)
+        self.assertIn('First step', (directory / 'index.html').read_text())
+        self.assertEqual(json.loads((directory / 'tour.json').read_bytes()), json.loads(
+            json.dumps(get_payload(self.tour.pk))))
+        self.assertFalse(prerender.bundle_dir(self.private.pk).exists())
+
+    def test_changes_rebuild_or_remove_existing_bundles(self):
+        self.build()
+        # Step edits don't touch the tour's updated_at; the payload digest still changes.
+        with self.captureOnCommitCallbacks(execute=True):
+            tour_steps.replace_steps(self.tour, [{'id': self.step.pk, 'title': 'Renamed step'}])
+        index = prerender.bundle_dir(self.tour.pk) / 'index.html'
+        self.assertIn('Renamed step', index.read_text())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour.status = 'Draft'
+            self.tour.save()
+        self.assertFalse(index.exists())
+
+    def test_builds_ignore_stale_cache_entries(self):
+        self.build()
+        pk = self.tour.pk
+        stale = {payloads._cache_key(pk): get_payload_entry(pk), payloads._meta_key(pk): payloads.get_payload_meta(pk)}
+        with self.captureOnCommitCallbacks(execute=True):
+            tour_steps.replace_steps(self.tour, [{'id': self.step.pk, 'title': 'Renamed step'}])
+        # What a process holding the entries from before the edit would read.
+        cache.set_many(stale)
+        self.assertEqual(self.build(), 'Built 0 tours, removed 0, 1 unchanged')
+        self.assertIn('Renamed step', (prerender.bundle_dir(pk) / 'index.html').read_text())
+
+    def test_bundles_are_served_without_queries(self):
+        self.build()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'First step', gzip.decompress(b''.join(response.streaming_content)))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_misses_are_built_by_django(self):
+        response = self.client.get(reverse('tours:tour_published_json', args=[self.tour.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['steps'][0]['title'], 'First step')
+        self.assertTrue((prerender.bundle_dir(self.tour.pk) / 'index.html').exists())
+        self.assertEqual(self.client.get(reverse('tours:tour_published', args=[self.private.pk])).status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='tourcraft.urls_asgi')
+class AsyncReadPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour = Tour.objects.create(title='Public', creator=self.user, status='Published')
+            TourStep.objects.create(tour=self.tour, title='Welcome')
+        self.async_client = AsyncClient()
+
+    def test_asgi_application_uses_async_urlconf(self):
+        from tourcraft.asgi import application
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'headers': []}
+        request, _ = application.create_request(scope, io.BytesIO())
+        self.assertEqual(request.urlconf, 'tourcraft.urls_asgi')
+
+    async def test_public_data_matches_sync_view(self):
+        url = reverse('tours:tour_public_data', args=[self.tour.pk])
+        with override_settings(ROOT_URLCONF='tourcraft.urls'):
+            expected = await sync_to_async(self.client.get)(url, HTTP_ACCEPT_ENCODING='gzip')
+        response = await self.async_client.get(url, headers={'accept-encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], expected['ETag'])
+        self.assertEqual(response['Cache-Control'], expected['Cache-Control'])
+
+        response = await self.async_client.get(
+            url, headers={'accept-encoding': 'gzip', 'if-none-match': expected['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((await self.async_client.post(url)).status_code, 405)
+
+    async def test_owner_api_data(self):
+        url = reverse('tours:tour_api_data', args=[self.tour.pk])
+        self.assertEqual((await self.async_client.get(url)).status_code, 302)
+        other = await User.objects.acreate(username='other', email='other@example.com')
+        await sync_to_async(self.async_client.force_login)(other)
+        self.assertEqual((await self.async_client.get(url)).status_code, 404)
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['steps'][0]['title'], 'Welcome')
+
+    async def test_dashboard_stats_match_api(self):
+        self.assertEqual((await self.async_client.get('/api/tours/dashboard_stats/')).status_code, 403)
+        api = APIClient()
+        await sync_to_async(api.force_login)(self.user)
+        with override_settings(ROOT_URLCONF='tourcraft.urls'):
+            expected = (await sync_to_async(api.get)('/api/tours/dashboard_stats/')).json()
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get('/api/tours/dashboard_stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected)
+
+
+@plain_static
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.tour = Tour.objects.create(title='Budgeted', creator=self.user, status='Published')
+        self.client.force_login(self.user)
+
+    def test_declared_budgets(self):
+        self.assertEqual(_declared_budget(views.tour_api_data, 'GET'), 12)
+        detail = resolve(f'/api/tours/{self.tour.pk}/steps/').func
+        self.assertEqual(_declared_budget(detail, 'GET'), 12)
+        self.assertEqual(_declared_budget(resolve('/api/tours/').func, 'POST'), TourViewSet.query_budget)
+        self.assertIsNone(_declared_budget(resolve('/accounts/signup/').func, 'GET'))
+
+    @override_settings(QUERY_BUDGET_DEFAULT=1, QUERY_BUDGET_ACTION='log')
+    def test_over_budget_requests_are_logged(self):
+        with self.assertLogs('tourcraft.query_budget', 'WARNING') as logs:
+            response = self.client.get(reverse('tours:saved_tours'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/tours/saved/ (tours:saved_tours) ran', logs.output[0])
+        self.assertIn('over its budget of 1', logs.output[0])
+
+    @override_settings(QUERY_BUDGET_DEFAULT=1, QUERY_BUDGET_ACTION='raise')
+    def test_over_budget_requests_fail_in_raise_mode(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('tours:saved_tours'))
+
+
+# (url name, method, path, data, expected status); paths and data are built
+# from the objects made by QueryCountRegressionTests.targets().
+def _recording_events():
+    return [{'type': 'click', 't': t} for t in range(0, 5000, 500)]
+
+
+QUERY_COUNT_CASES = [
+    ('tours:tours_list', 'get', lambda t: '/tours/', None, 200),
+    ('tours:dashboard_tours', 'get', lambda t: '/tours/page/', None, 200),
+    ('tours:saved_tours', 'get', lambda t: '/tours/saved/', None, 200),
+    ('tours:saved_tour_download', 'get', lambda t: f'/tours/saved/{t["saved"].pk}/download/', None, 200),
+    ('tours:tour_create', 'get', lambda t: '/tours/create/', None, 200),
+    ('tours:tour_create', 'post', lambda t: '/tours/create/', lambda t: {'title': 'New tour'}, 302),
+    ('tours:enhanced_tour_create', 'get', lambda t: '/tours/create/enhanced/', None, 200),
+    ('tours:step_create', 'get', lambda t: f'/tours/{t["tour"].pk}/steps/create/', None, 200),
+    ('tours:step_create', 'post', lambda t: f'/tours/{t["tour"].pk}/steps/create/',
+     lambda t: {'title': 'Added', 'content': 'Text'}, 302),
+    ('tours:step_edit', 'get', lambda t: f'/tours/{t["tour"].pk}/steps/{t["step"].pk}/edit/', None, 200),
+    ('tours:step_edit', 'post', lambda t: f'/tours/{t["tour"].pk}/steps/{t["step"].pk}/edit/',
+     lambda t: {'title': 'Edited', 'content': 'Text'}, 302),
+    ('tours:step_delete', 'get', lambda t: f'/tours/{t["tour"].pk}/steps/{t["step"].pk}/delete/', None, 200),
+    ('tours:step_delete', 'post', lambda t: f'/tours/{t["tour"].pk}/steps/{t["step"].pk}/delete/', None, 302),
+    ('tours:tour_preview', 'get', lambda t: f'/tours/{t["tour"].pk}/preview/', None, 200),
+    ('tours:tour_delete', 'get', lambda t: f'/tours/{t["tour"].pk}/delete/', None, 200),
+    ('tours:tour_delete', 'post', lambda t: f'/tours/{t["tour"].pk}/delete/', None, 302),
+    ('tours:recording_create', 'post', lambda t: '/tours/recordings/', lambda t: {'title': 'Screen'}, 200),
+    ('tours:recording_upload', 'get', lambda t: f'/tours/recordings/{t["recording"].pk}/upload/', None, 200),
+    ('tours:recording_upload', 'patch', lambda t: f'/tours/recordings/{t["recording"].pk}/upload/',
+     lambda t: b'x' * 1024, 200),
+    ('tours:recording_finalize', 'post', lambda t: f'/tours/recordings/{t["recording"].pk}/finalize/', None, 200),
+    ('tours:recording_events', 'get', lambda t: f'/tours/recordings/{t["recording"].pk}/events/', None, 200),
+    ('tours:recording_events', 'post', lambda t: f'/tours/recordings/{t["recording"].pk}/events/',
+     lambda t: _recording_events(), 201),
+    ('tours:tour_api_data', 'get', lambda t: f'/tours/{t["tour"].pk}/api/', None, 200),
+    ('tours:tour_public_data', 'get', lambda t: f'/tours/{t["tour"].pk}/public/', None, 200),
+    ('tours:tour_published', 'get', lambda t: f'/tours/published/{t["tour"].pk}/', None, 200),
+    ('tours:tour_published_json', 'get', lambda t: f'/tours/published/{t["tour"].pk}/tour.json', None, 200),
+
+    ('accounts:login', 'get', lambda t: '/accounts/', None, 200),
+    ('accounts:login', 'post', lambda t: '/accounts/',
+     lambda t: {'username': 'creator', 'password': 'pass12345'}, 302),
+    ('accounts:login_alt', 'get', lambda t: '/accounts/login/', None, 200),
+    ('accounts:signup', 'get', lambda t: '/accounts/signup/', None, 200),
+    ('accounts:signup', 'post', lambda t: '/accounts/signup/', lambda t: {
+        'username': f'new{t["n"]}', 'email': f'new{t["n"]}@example.com',
+        'password': 'pass12345', 'confirm_password': 'pass12345',
+    }, 302),
+    ('accounts:logout', 'get', lambda t: '/accounts/logout/', None, 302),
+    ('accounts:password_reset', 'get', lambda t: '/accounts/password-reset/', None, 200),
+    ('accounts:password_reset', 'post', lambda t: '/accounts/password-reset/',
+     lambda t: {'email': 'creator@example.com'}, 302),
+    ('accounts:password_reset_done', 'get', lambda t: '/accounts/password-reset/done/', None, 200),
+    ('accounts:password_reset_confirm', 'get', lambda t: f'/accounts/reset/{t["uid"]}/{t["token"]}/', None, 302),
+    ('accounts:password_reset_complete', 'get', lambda t: '/accounts/reset/done/', None, 200),
+
+    ('api:api-root', 'get', lambda t: '/api/', None, 200),
+    ('api:tour-list', 'get', lambda t: '/api/tours/', None, 200),
+    ('api:tour-list', 'post', lambda t: '/api/tours/', lambda t: {'title': 'From the API'}, 201),
+    ('api:tour-detail', 'get', lambda t: f'/api/tours/{t["tour"].pk}/', None, 200),
+    ('api:tour-detail', 'patch', lambda t: f'/api/tours/{t["tour"].pk}/', lambda t: {'title': 'Renamed'}, 200),
+    ('api:tour-detail', 'delete', lambda t: f'/api/tours/{t["tour"].pk}/', None, 204),
+    ('api:tour-add-step', 'post', lambda t: f'/api/tours/{t["tour"].pk}/add_step/',
+     lambda t: {'title': 'Inserted', 'after': t['step'].pk}, 201),
+    ('api:tour-move-step', 'post', lambda t: f'/api/tours/{t["tour"].pk}/steps/{t["step"].pk}/move/',
+     lambda t: {'after': None}, 200),
+    ('api:tour-steps', 'get', lambda t: f'/api/tours/{t["tour"].pk}/steps/', None, 200),
+    ('api:tour-steps', 'put', lambda t: f'/api/tours/{t["tour"].pk}/steps/',
+     lambda t: [{'id': step.pk, 'title': f'Kept {step.pk}'} for step in t['steps']] + [{'title': 'Appended'}], 200),
+    ('api:tour-export', 'post', lambda t: f'/api/tours/{t["tour"].pk}/export/', None, 202),
+    ('api:tour-import-tour', 'post', lambda t: '/api/tours/import/', lambda t: {'bundle': t['bundle']}, 201),
+    ('api:tour-dashboard-stats', 'get', lambda t: '/api/tours/dashboard_stats/', None, 200),
+    ('api:tour-viewers-timeseries', 'get', lambda t: '/api/tours/timeseries/', None, 200),
+    ('api:tour-tour-viewers-timeseries', 'get', lambda t: f'/api/tours/{t["tour"].pk}/timeseries/', None, 200),
+    ('api:tour-search', 'get', lambda t: '/api/tours/search/?q=step', None, 200),
+    ('api:tour-autocomplete', 'get', lambda t: '/api/tours/autocomplete/?q=see', None, 200),
+    ('api:user-list', 'get', lambda t: '/api/users/', None, 200),
+    ('api:user-detail', 'get', lambda t: f'/api/users/{t["user"].pk}/', None, 200),
+    ('rest_framework:login', 'get', lambda t: '/api/auth/login/', None, 200),
+    ('rest_framework:logout', 'post', lambda t: '/api/auth/logout/', None, 200),
+]
+
+# Views that answer without a session user.
+ANONYMOUS_URL_NAMES = {
+    'tours:tour_public_data', 'tours:tour_published', 'tours:tour_published_json',
+    'accounts:login', 'accounts:login_alt', 'accounts:signup', 'accounts:password_reset',
+    'accounts:password_reset_done', 'accounts:password_reset_confirm', 'accounts:password_reset_complete',
+    'rest_framework:login',
+}
+
+
+def _url_names(patterns, namespace):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _url_names(pattern.url_patterns, pattern.namespace or namespace)
+        elif pattern.name:
+            yield f'{namespace}:{pattern.name}'
+
+
+@plain_static
+@override_settings(QUERY_BUDGET_ACTION='raise', IMAGE_VARIANTS_ASYNC=False)
+class QueryCountRegressionTests(TestCase):
+    """Every URL runs the same number of queries on a small and a much larger dataset.
+
+    Catches N+1 patterns before production data does. The budget middleware
+    runs in raise mode, so each request also has to stay within its budget.
+    """
+
+    def setUp(self):
+        for setting in ('MEDIA_ROOT', 'TOUR_STATIC_ROOT', 'TOUR_VIEW_BUFFER_DIR', 'ACTIVITY_BUFFER_DIR',
+                        'RECORDING_UPLOAD_DIR'):
+            use_temp_dir(self, setting)
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.numbers = iter(range(1_000_000))
+        self.seed(self.user, tours=2, steps=3, viewers=2)
+
+    def seed(self, creator, tours, steps, viewers):
+        """Tours with steps, analytics, activity, recordings and saved exports for ``creator``."""
+        now = timezone.now()
+        made = Tour.objects.bulk_create(
+            Tour(title=f'Seeded tour {next(self.numbers)}', description='Seeded', creator=creator,
+                 status='Published', privacy='public')
+            for _ in range(tours)
+        )
+        TourStep.objects.bulk_create(
+            TourStep(tour=tour, rank=rank, title=f'Seeded step {n}', description='Seeded step text',
+                     highlight_area={'x': n, 'y': n, 'width': 100, 'height': 40})
+            for tour in made for n, rank in enumerate(spread(steps))
+        )
+        Analytics.objects.bulk_create(Analytics(tour=tour, total_views=viewers) for tour in made)
+        TourDailyStats.objects.bulk_create(
+            TourDailyStats(tour=tour, day=(now - timedelta(days=day)).date(), views=viewers, viewers=viewers)
+            for tour in made for day in range(7)
+        )
+        StepEvent.objects.bulk_create(
+            StepEvent(tour=tour, session=f'session-{viewer}', kind=StepEvent.SHOWN, occurred_at=now, received_at=now)
+            for tour in made for viewer in range(viewers)
+        )
+        ActivityLog.objects.bulk_create(
+            ActivityLog(user=creator, tour=tour, tour_title=tour.title, action='created') for tour in made
+        )
+        recordings = Recording.objects.bulk_create(Recording(user=creator, title='Seeded') for _ in range(tours))
+        for recording in recordings[:3]:
+            append_events(recording.pk, _recording_events())
+        for tour in made[:3]:
+            SavedTour.objects.create(user=creator, tour=tour, name=tour.title,
+                                     file_url=ContentFile(b'bundle', name='seeded.zip'))
+        rebuild_index()
+
+    def grow(self):
+        for n in range(5):
+            other = User.objects.create_user(f'other{n}', f'other{n}@example.com', 'pass12345')
+            self.seed(other, tours=5, steps=5, viewers=5)
+        self.seed(self.user, tours=40, steps=12, viewers=25)
+
+    def targets(self):
+        """Fresh objects for one request, made the same way on both datasets."""
+        n = next(self.numbers)
+        tour = Tour.objects.create(title=f'Target tour {n}', description='Measured', creator=self.user,
+                                   status='Published', privacy='public')
+        steps = [TourStep.objects.create(tour=tour, title=f'Target step {i}', highlight_area={'x': i, 'y': i})
+                 for i in range(3)]
+        saved = SavedTour.objects.create(user=self.user, tour=tour, name=tour.title,
+                                         file_url=ContentFile(b'bundle', name='target.zip'))
+        bundle = io.BytesIO()
+        write_bundle(tour, bundle)
+        bundle.seek(0)
+        bundle.name = 'target.zip'
+        return {
+            'n': n, 'user': self.user, 'tour': tour, 'step': steps[0], 'steps': steps, 'saved': saved,
+            'recording': Recording.objects.create(user=self.user, title=f'Target recording {n}'),
+            'bundle': bundle,
+            'uid': urlsafe_base64_encode(force_bytes(self.user.pk)),
+            'token': default_token_generator.make_token(self.user),
+        }
+
+    def query_count(self, case):
+        name, method, path, data, expected_status = case
+        targets = self.targets()
+        cache.clear()
+        client = APIClient()
+        if name not in ANONYMOUS_URL_NAMES:
+            client.force_login(self.user)
+        kwargs = {}
+        if data is not None:
+            body = data(targets)
+            if isinstance(body, bytes):
+                kwargs = {'data': body, 'content_type': 'application/offset+octet-stream', 'HTTP_UPLOAD_OFFSET': '0'}
+            elif name.startswith(('api:', 'tours:recording')) and 'bundle' not in body:
+                kwargs = {'data': body, 'format': 'json'}
+            else:
+                kwargs = {'data': body}
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path(targets), **kwargs)
+        self.assertEqual(response.status_code, expected_status, f'{method.upper()} {name}')
+        return len(queries)
+
+    def test_every_url_is_covered(self):
+        covered = {case[0] for case in QUERY_COUNT_CASES}
+        for urlconf, namespace in (('tours.urls', 'tours'), ('accounts.urls', 'accounts'), ('api.urls', 'api')):
+            names = set(_url_names(get_resolver(urlconf).url_patterns, namespace))
+            self.assertFalse(names - covered, f'{urlconf} has URLs without a query count case')
+
+    def test_query_counts_do_not_grow_with_data(self):
+        small = [self.query_count(case) for case in QUERY_COUNT_CASES]
+        self.grow()
+        for case, expected in zip(QUERY_COUNT_CASES, small):
+            with self.subTest(f'{case[1].upper()} {case[0]}'):
+                self.assertEqual(self.query_count(case), expected)
+
+
+@plain_static
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.profiles = use_temp_dir(self, 'PROFILE_DIR')
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+        self.client.force_login(self.user)
+
+    def metrics(self, response):
+        return {part.split(';')[0].strip(): part for part in response['Server-Timing'].split(',')}
+
+    def test_header_breaks_down_request_time(self):
+        response = self.client.get(reverse('tours:saved_tours'))
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {'db', 'tpl', 'view', 'total'})
+        self.assertRegex(metrics['db'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertNotEqual(metrics['tpl'], 'tpl;dur=0.0')
+        self.assertEqual(list(Path(self.profiles).iterdir()), [])
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampled_requests_are_profiled(self):
+        response = self.client.get(reverse('tours:saved_tours') + '?page=2')
+        [profile] = Path(self.profiles).glob('*.prof')
+        self.assertIn('saved_tours_view', ''.join(str(key) for key in pstats.Stats(str(profile)).stats))
+        sidecar = json.loads(profile.with_suffix('.json').read_text())
+        self.assertEqual((sidecar['path'], sidecar['url_name'], sidecar['user_id'], sidecar['status']),
+                         ('/tours/saved/?page=2', 'tours:saved_tours', self.user.pk, response.status_code))
+        self.assertGreater(sidecar['queries'], 0)
+
+    @override_settings(PROFILE_MAX_FILES=2)
+    def test_profile_header_is_for_staff_only(self):
+        self.client.get(reverse('tours:saved_tours'), HTTP_X_PROFILE='1')
+        self.assertEqual(list(Path(self.profiles).glob('*.prof')), [])
+        self.user.is_staff = True
+        self.user.save()
+        for _ in range(3):
+            self.client.get(reverse('tours:saved_tours'), HTTP_X_PROFILE='1')
+        self.assertEqual(len(list(Path(self.profiles).glob('*.prof'))), 2)
+        self.assertEqual(len(list(Path(self.profiles).glob('*.json'))), 2)
+
+
+def _sample(name, **labels):
+    """Current value of one sample from /metrics' registry, 0 when absent."""
+    for family in text_string_to_metric_families(metrics.render().decode()):
+        for sample in family.samples:
+            if sample.name == name and all(sample.labels.get(k) == v for k, v in labels.items()):
+                return sample.value
+    return 0
+
+
+@plain_static
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_temp_dir(self, 'TOUR_VIEW_BUFFER_DIR')
+        use_temp_dir(self, 'ACTIVITY_BUFFER_DIR')
+        self.user = User.objects.create_user('creator', 'creator@example.com', 'pass12345')
+
+    def test_endpoint_is_for_staff_and_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'tourcraft_request_duration_seconds', response.content)
+
+    def test_queries_are_counted_once_per_request(self):
+        # Metrics, Server-Timing and the query budget share the outermost counter.
+        self.client.force_login(self.user)
+        with mock.patch('tourcraft.middleware.QueryCounter', wraps=QueryCounter) as counter:
+            response = self.client.get(reverse('tours:saved_tours'))
+        self.assertEqual(counter.call_count, 1)
+        queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing'])[1])
+        self.assertGreater(queries, 0)
+
+    def test_requests_are_recorded_by_url_name(self):
+        labels = {'view': 'tours:saved_tours', 'method': 'GET'}
+        before = _sample('tourcraft_request_duration_seconds_count', **labels)
+        ok_before = _sample('tourcraft_requests_total', status='2xx', **labels)
+        self.client.force_login(self.user)
+        self.client.get(reverse('tours:saved_tours'))
+        self.assertEqual(_sample('tourcraft_request_duration_seconds_count', **labels), before + 1)
+        self.assertEqual(_sample('tourcraft_requests_total', status='2xx', **labels), ok_before + 1)
+        self.assertGreater(_sample('tourcraft_request_queries_sum', view='tours:saved_tours'), 0)
+
+    def test_payload_cache_and_buffer_depth(self):
+        tour = Tour.objects.create(title='Measured', creator=self.user, status='Published')
+        hits = _sample('tourcraft_payload_cache_total', kind='entry', result='hit')
+        misses = _sample('tourcraft_payload_cache_total', kind='entry', result='miss')
+        get_payload_entry(tour.pk)
+        get_payload_entry(tour.pk)
+        self.assertEqual(_sample('tourcraft_payload_cache_total', kind='entry', result='miss'), misses + 1)
+        self.assertEqual(_sample('tourcraft_payload_cache_total', kind='entry', result='hit'), hits + 1)
+
+        record_view(tour.pk, '10.0.0.1')
+        record_view(tour.pk, '10.0.0.2')
+        self.assertEqual(_sample('tourcraft_buffer_pending_records', buffer='tour_views'), 2)
+        flush_views()
+        self.assertEqual(_sample('tourcraft_buffer_pending_records', buffer='tour_views'), 0)
+
+
+@plain_static
+class SeedDataTests(TransactionTestCase):
+    # The benchmark serves requests from worker threads, which only see committed rows.
+
+    def setUp(self):
+        cache.clear()
+        use_temp_dir(self, 'TOUR_VIEW_BUFFER_DIR')
+        use_temp_dir(self, 'ACTIVITY_BUFFER_DIR')
+
+    def seed(self):
+        call_command(
+            'seed_data', users=3, tours=4, steps=3, recordings=1, recording_events=50, views=500,
+            step_events=200, days=3, seed=7, stdout=io.StringIO(),
+        )
+
+    def test_seeds_consistent_volumes(self):
+        self.seed()
+        self.assertEqual(User.objects.count(), 3)
+        self.assertEqual(Tour.objects.count(), 12)
+        self.assertEqual(TourStep.objects.count(), 36)
+        self.assertTrue(all({'x', 'y', 'width', 'height'} <= set(step.highlight_area)
+                            for step in TourStep.objects.all()))
+        recording = Recording.objects.first()
+        self.assertEqual(Recording.objects.filter(status='completed').count(), 3)
+        self.assertEqual(len(load_events(recording.pk)), 50)
+        # Views go through the flush path: counts, buckets and Analytics agree.
+        self.assertEqual(sum(Tour.objects.values_list('view_count', flat=True)), 500)
+        self.assertEqual(sum(TourDailyStats.objects.values_list('views', flat=True)), 500)
+        self.assertEqual(sum(Analytics.objects.values_list('total_views', flat=True)), 500)
+        self.assertEqual(StepEvent.objects.count(), 200)
+        self.assertFalse(StepEvent.objects.exclude(
+            tour__status='Published', tour__privacy='public', step__tour=F('tour')).exists())
+
+        self.seed()  # runs add to what is there
+        self.assertEqual(User.objects.count(), 6)
+
+    def test_rejects_an_empty_day_range(self):
+        with self.assertRaisesMessage(CommandError, '--days must be at least 1.'):
+            call_command('seed_data', users=1, days=0, stdout=io.StringIO())
+        self.assertFalse(User.objects.exists())
+
+    def test_benchmark_reports_percentiles_per_endpoint(self):
+        self.seed()
+        out = io.StringIO()
+        call_command('benchmark_endpoints', requests=4, warmup=1, stdout=out, stderr=io.StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['rows']['tours'], 12)
+        self.assertEqual(set(report['endpoints']), {'dashboard', 'preview', 'api_list', 'api_detail', 'dashboard_stats'})
+        for result in report['endpoints'].values():
+            self.assertEqual((result['requests'], result['errors']), (4, 0), result)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
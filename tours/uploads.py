@@ -0,0 +1,105 @@
+import fcntl
+import mimetypes
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .jobs import enqueue_recording
+from .models import Recording
+
+READ_SIZE = 64 * 1024
+
+
+class OffsetMismatch(Exception):
+    """The client's Upload-Offset doesn't match what the server has stored."""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected upload offset {offset}")
+        self.offset = offset
+
+
+class UploadClosed(Exception):
+    """The recording is no longer accepting chunks."""
+
+
+class _PartFile(File):
+    # Lets FileSystemStorage move the finished upload into place instead of copying it.
+    def temporary_file_path(self):
+        return self.name
+
+
+def part_path(recording_id):
+    return Path(settings.RECORDING_UPLOAD_DIR) / f"{recording_id}.part"
+
+
+def current_offset(recording_id):
+    try:
+        return part_path(recording_id).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+@contextmanager
+def _locked_part(recording_id, mode):
+    """The part file opened in ``mode`` under an exclusive lock, or None if it doesn't exist.
+
+    Appends and finalize take this lock before the recording's row lock, so a
+    chunk is either written before the file is moved or rejected after.
+    """
+    try:
+        fh = open(part_path(recording_id), mode)
+    except FileNotFoundError:
+        yield None
+        return
+    with fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        yield fh
+
+
+def append_chunk(recording, stream, offset):
+    """Append everything readable from ``stream`` at ``offset``; return the new offset.
+
+    The body is copied to disk in small reads, so Django never holds a whole
+    chunk in memory. If the connection drops halfway, whatever arrived is kept
+    and the client resumes from the offset reported by ``current_offset``.
+    """
+    part_path(recording.pk).parent.mkdir(parents=True, exist_ok=True)
+    with _locked_part(recording.pk, "ab") as fh, transaction.atomic():
+        # ``recording`` may be stale: finalize could have run since it was loaded.
+        status = Recording.objects.select_for_update().values_list("status", flat=True).get(pk=recording.pk)
+        stored = fh.seek(0, os.SEEK_END)
+        if status != "recording":
+            if not stored:
+                part_path(recording.pk).unlink(missing_ok=True)  # created by the open above
+            raise UploadClosed()
+        if stored != offset:
+            raise OffsetMismatch(stored)
+        while True:
+            chunk = stream.read(READ_SIZE)
+            if not chunk:
+                break
+            fh.write(chunk)
+        fh.flush()
+        return fh.tell()
+
+
+def finalize_upload(recording_id):
+    """Move the uploaded file into storage and hand the recording to processing."""
+    with _locked_part(recording_id, "rb") as fh, transaction.atomic():
+        recording = Recording.objects.select_for_update().get(pk=recording_id)
+        if recording.status != "recording":
+            raise UploadClosed()
+        extension = mimetypes.guess_extension((recording.mime_type or "video/webm").split(";")[0]) or ".webm"
+        if fh is not None:
+            path = part_path(recording.pk)
+            recording.size = os.fstat(fh.fileno()).st_size
+            recording.video.save(f"{recording.pk}{extension}", _PartFile(fh, name=str(path)), save=False)
+            path.unlink(missing_ok=True)
+        recording.status = "processing"
+        recording.save(update_fields=["video", "size", "status"])
+        enqueue_recording(recording.pk)
+    return recording
@@ -6,20 +6,36 @@ app_name = 'tours'
 
 urlpatterns = [
     path('', views.dashboard_view, name='tours_list'),   # ✅ Dashboard as main
+    path('page/', views.dashboard_tours_view, name='dashboard_tours'),
     path('saved/', views.saved_tours_view, name='saved_tours'),
+    path('saved/<int:pk>/download/', views.saved_tour_download_view, name='saved_tour_download'),
     
     # Tour creation
     path('create/', views.tour_create_view, name='tour_create'),  # ✅ Added basic create
     path('create/enhanced/', views.EnhancedTourCreateView, name='enhanced_tour_create'),
     
     # Steps related
-    path('<int:tour_pk>/steps/create/', views.step_create_view, name='steps_create'),
-    path('<int:tour_pk>/steps/<int:step_pk>/edit/', views.step_edit_view, name='step_edit'),
-    path('<int:tour_pk>/steps/<int:step_pk>/delete/', views.step_delete_view, name='step_delete'),
+    path('<uuid:tour_pk>/steps/create/', views.step_create_view, name='step_create'),
+    path('<uuid:tour_pk>/steps/<int:step_pk>/edit/', views.step_edit_view, name='step_edit'),
+    path('<uuid:tour_pk>/steps/<int:step_pk>/delete/', views.step_delete_view, name='step_delete'),
     
+    # Preview
+    path('<uuid:pk>/preview/', views.tour_preview_enhanced_v2_view, name='tour_preview'),
+
     # Delete whole tour
-    path('<int:pk>/delete/', views.tour_delete_view, name='tour_delete'),
+    path('<uuid:pk>/delete/', views.tour_delete_view, name='tour_delete'),
     
+    # Recordings (chunked, resumable uploads from screen-recorder.js)
+    path('recordings/', views.recording_create_view, name='recording_create'),
+    path('recordings/<uuid:pk>/upload/', views.recording_upload_view, name='recording_upload'),
+    path('recordings/<uuid:pk>/finalize/', views.recording_finalize_view, name='recording_finalize'),
+    path('recordings/<uuid:pk>/events/', views.recording_events_view, name='recording_events'),
+
     # API
-    path('<int:pk>/api/', views.tour_api_data, name='tour_api_data'),
+    path('<uuid:pk>/api/', views.tour_api_data, name='tour_api_data'),
+    path('<uuid:pk>/public/', views.tour_public_data, name='tour_public_data'),
+
+    # Pre-rendered public tours; only reached when the file isn't on disk yet
+    path('published/<uuid:pk>/', views.published_tour_view, name='tour_published'),
+    path('published/<uuid:pk>/tour.json', views.published_tour_view, {'name': 'tour.json'}, name='tour_published_json'),
 ]
\ No newline at end of file
@@ -0,0 +1,57 @@
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from analytics.rollups import record_views, visitor_key
+
+from .models import Tour
+from .spool import Spool
+from .stats import invalidate_dashboard_stats
+
+
+def get_spool():
+    return Spool(settings.TOUR_VIEW_BUFFER_DIR, "tour-views")
+
+
+def record_view(tour_id, ip_address, viewer_id=None):
+    """Buffer a single tour view. The database is not touched."""
+    get_spool().append([str(tour_id), viewer_id, ip_address, int(time.time())])
+
+
+def flush_views():
+    """Write every buffered view to the database and return how many were flushed."""
+    with get_spool().batch() as records:
+        if records:
+            apply_views(records)
+    return len(records)
+
+
+def apply_views(records):
+    """Persist a batch of ``[tour_id, viewer_id, ip_address, timestamp]`` records.
+
+    Every record bumps ``Tour.view_count`` and the view buckets; unique viewers
+    are tracked in HyperLogLog sketches (see ``analytics.rollups.record_views``)
+    instead of one row per viewer.
+    """
+    now = time.time()
+    views = []
+    for tour_id, viewer_id, ip, *rest in records:
+        viewed_at = datetime.fromtimestamp(rest[0] if rest else now, tz=dt_timezone.utc)
+        views.append((uuid.UUID(tour_id), visitor_key(viewer_id, ip), viewed_at))
+
+    creators = dict(Tour.objects.filter(pk__in={v[0] for v in views}).values_list("pk", "creator_id"))
+    views = [v for v in views if v[0] in creators]
+    if not views:
+        return
+
+    hits = Counter(tour_id for tour_id, _, _ in views)
+    with transaction.atomic():
+        for tour_id, count in hits.items():
+            Tour.objects.filter(pk=tour_id).update(view_count=F("view_count") + count)
+        record_views(views)
+        transaction.on_commit(lambda: invalidate_dashboard_stats(*(creators[tour_id] for tour_id in hits)))
@@ -1,49 +1,86 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.http import HttpResponse
 from .models import Tour, TourStep, Recording
-# from analytics.models import ActivityLog
+import calendar
+import gzip
 import json
+import re
 import uuid
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse
 from django.core.paginator import Paginator
 from django.utils import timezone
 from .models import SavedTour, Tour
 from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_http_methods, require_POST, require_safe
+from analytics.activity import get_feed, log_activity
+from tourcraft.middleware import query_budget
+from tourcraft.pagination import keyset_page
+from .payloads import aget_payload_entry, aget_payload_meta, get_payload, get_payload_entry, get_payload_meta
+from . import prerender
+from .recording_events import append_events, parse_offset, read_window, stream_duration
+from .uploads import OffsetMismatch, UploadClosed, append_chunk, current_offset, finalize_upload
+from .stats import get_dashboard_stats
+from .view_buffer import record_view
 
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
 
+_GZIP_RE = re.compile(r'\bgzip\b')
+_BR_RE = re.compile(r'\bbr\b')
 
 
+def _client_ip(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR')
 
 
+
+
+
+
+@query_budget(8)
 @login_required
 def dashboard_view(request):
-    # Get user's tours
-    tours = Tour.objects.filter(creator=request.user)
+    # First page of the user's tours; the rest load from dashboard_tours_view
+    tours, next_cursor = keyset_page(
+        Tour.objects.filter(creator=request.user).with_stats(), None, settings.DASHBOARD_TOURS_PAGE_SIZE
+    )
     
     # Get stats
-    total_tours = tours.count()
-    total_views = sum(tour.view_count for tour in tours)
-    published_tours = tours.filter(status='Published').count()
+    totals = get_dashboard_stats(request.user)
+    total_tours = totals['total_tours']
+    total_views = totals['total_views']
+    published_tours = totals['published_tours']
     
-    # Get recent activities - temporarily disabled
-    # recent_activities = ActivityLog.objects.filter(user=request.user)[:5]
-    recent_activities = []  # Empty list for now
+    # Precomputed feed, kept current by flush_activity
+    recent_activities = get_feed(request.user.pk)[:5]
     
-    recent_tours = tours.order_by('-created_at')[:5]
+    recent_tours = tours[:5]
 
     # Mock data for template compatibility
     stats = {
         'tours': total_tours,
         'views': f"{total_views/1000:.1f}k" if total_views > 1000 else str(total_views),
-        'conversion': 87,  # Mock data
+        'conversion': round(100 * totals['tour_completions'] / totals['tour_starts']) if totals['tour_starts'] else 0,
         'avg_time': '3.2m'  # Mock data
     }
     
     context = {
         'tours': tours,
+        'next_cursor': next_cursor,
         'stats': stats,
         'recent': recent_activities,
         'published_tours': published_tours,
@@ -52,6 +89,22 @@ def dashboard_view(request):
     return render(request, 'tours/preview_enhanced_v2.html', context)
 
 
+@query_budget(5)
+@login_required
+@require_safe
+def dashboard_tours_view(request):
+    """The next page of the dashboard's tour list, as an HTML fragment for infinite scroll"""
+    try:
+        tours, next_cursor = keyset_page(
+            Tour.objects.filter(creator=request.user).with_stats(),
+            request.GET.get('cursor'),
+            settings.DASHBOARD_TOURS_PAGE_SIZE,
+        )
+    except ValueError:
+        return HttpResponse('Invalid cursor', status=400)
+    return render(request, 'tours/_tour_cards.html', {'tours': tours, 'next_cursor': next_cursor})
+
+
 
 
 @login_required
@@ -62,7 +115,7 @@ def tour_delete_view(request, pk):
         tour_title = tour.title
         tour.delete()
         messages.success(request, f'Tour "{tour_title}" deleted successfully!')
-        return redirect('tours_list')
+        return redirect('tours:tours_list')
     
     context = {
         'tour': tour,
@@ -76,30 +129,20 @@ def step_create_view(request, tour_pk):
     tour = get_object_or_404(Tour, id=tour_pk, creator=request.user)
     
     if request.method == 'POST':
-        title = request.POST.get('title')
-        content = request.POST.get('content')
-        element_selector = request.POST.get('element_selector')
-        step_type = request.POST.get('step_type', 'tooltip')
-        
-        # Get next order number
-        max_order = tour.steps.aggregate(max_order=Count('order'))['max_order'] or 0
-        
-        step = TourStep.objects.create(
+        # Appended after the current last step (see TourStep.save)
+        TourStep.objects.create(
             tour=tour,
-            title=title,
-            content=content,
-            element_selector=element_selector,
-            step_type=step_type,
-            order=max_order + 1
+            title=request.POST.get('title', ''),
+            description=request.POST.get('content', ''),
         )
         
         messages.success(request, 'Step added successfully!')
-        return redirect('tour_steps', pk=tour.id)
+        return redirect('tours:tour_preview', pk=tour.id)
     
     context = {
         'tour': tour,
     }
-    return render(request, 'tours/step_create.html', context)
+    return render(request, 'tours/steps_create.html', context)
 
 @login_required
 def step_edit_view(request, tour_pk, step_pk):
@@ -108,13 +151,11 @@ def step_edit_view(request, tour_pk, step_pk):
     
     if request.method == 'POST':
         step.title = request.POST.get('title', step.title)
-        step.content = request.POST.get('content', step.content)
-        step.element_selector = request.POST.get('element_selector', step.element_selector)
-        step.step_type = request.POST.get('step_type', step.step_type)
+        step.description = request.POST.get('content', step.description)
         step.save()
         
         messages.success(request, 'Step updated successfully!')
-        return redirect('tour_steps', pk=tour.id)
+        return redirect('tours:tour_preview', pk=tour.id)
     
     context = {
         'tour': tour,
@@ -130,7 +171,7 @@ def step_delete_view(request, tour_pk, step_pk):
     if request.method == 'POST':
         step.delete()
         messages.success(request, 'Step deleted successfully!')
-        return redirect('tour_steps', pk=tour.id)
+        return redirect('tours:tour_preview', pk=tour.id)
     
     context = {
         'tour': tour,
@@ -140,56 +181,169 @@ def step_delete_view(request, tour_pk, step_pk):
 
 
 
+def _preferred_encoding(request):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if brotli is not None and _BR_RE.search(accepted):
+        return 'br'
+    if _GZIP_RE.search(accepted):
+        return 'gzip'
+    return None
+
+
+def _payload_validators(entry, encoding):
+    suffix = f'-{encoding}' if encoding else ''
+    etag = f'"{entry["version"]}-{entry["digest"]}{suffix}"'
+    return etag, calendar.timegm(entry['built_at'].utctimetuple())
+
+
+def _payload_not_modified(request, meta):
+    """A 304 if the client's copy of the payload in ``meta`` is current, else None.
+
+    The ETag is the payload version plus the digest of its JSON, which covers
+    the tour's updated_at and every step, so this never loads the payload body.
+    """
+    etag, last_modified = _payload_validators(meta, _preferred_encoding(request))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _payload_body_response(request, entry):
+    if entry is None:
+        raise Http404("No Tour matches the given query.")
+    encoding = _preferred_encoding(request)
+    body = entry['body']
+    if encoding != 'gzip':
+        body = gzip.decompress(body)
+        if encoding == 'br':
+            body = brotli.compress(body)
+    response = HttpResponse(body, content_type='application/json')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    etag, last_modified = _payload_validators(entry, encoding)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _finish_payload_response(response, cache_control):
+    response['Cache-Control'] = cache_control
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def _payload_response(request, tour_id, meta, cache_control):
+    """JSON response for a stored tour payload, honouring If-None-Match/If-Modified-Since"""
+    response = _payload_not_modified(request, meta)
+    if response is None:
+        response = _payload_body_response(request, get_payload_entry(tour_id))
+    return _finish_payload_response(response, cache_control)
+
+
+async def _apayload_response(request, tour_id, meta, cache_control):
+    response = _payload_not_modified(request, meta)
+    if response is None:
+        response = _payload_body_response(request, await aget_payload_entry(tour_id))
+    return _finish_payload_response(response, cache_control)
+
+
 # API endpoint for tour data (for JavaScript integration)
+@query_budget(12)
 @login_required
+@require_safe
 def tour_api_data(request, pk):
-    tour = get_object_or_404(Tour, id=pk, creator=request.user)
-    steps = tour.steps.all().order_by('order')
-    
-    tour_data = {
-        'id': tour.id,
-        'title': tour.title,
-        'description': tour.description,
-        'steps': [
-            {
-                'id': step.id,
-                'title': step.title,
-                'content': step.content,
-                'element_selector': step.element_selector,
-                'step_type': step.step_type,
-                'order': step.order,
-            }
-            for step in steps
-        ]
-    }
-    
-    return JsonResponse(tour_data)
+    meta = get_payload_meta(pk)
+    if meta is None or meta['creator_id'] != request.user.pk:
+        raise Http404("No Tour matches the given query.")
+    return _payload_response(request, pk, meta, 'private, no-cache')
+
+
+@query_budget(10)
+@require_safe
+def tour_public_data(request, pk):
+    """Playback JSON for published public tours, cacheable by browsers and proxies"""
+    meta = get_payload_meta(pk)
+    if meta is None or not meta['public']:
+        raise Http404("No Tour matches the given query.")
+    response = _payload_response(
+        request, pk, meta,
+        f'public, max-age={settings.TOUR_PUBLIC_MAX_AGE}, '
+        f'stale-while-revalidate={settings.TOUR_PUBLIC_STALE_WHILE_REVALIDATE}',
+    )
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+# Async twins of the read-heavy endpoints above, routed by tourcraft/urls_asgi.py
+# when serving through tourcraft/asgi.py. Django 4.2's view decorators aren't
+# async-aware, so method and login checks are done inline.
 
+async def _auser(request):
+    # request.auser() only arrives in Django 5.0.
+    return await sync_to_async(get_user)(request)
 
 
+@query_budget(12)
+async def tour_api_data_async(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    user = await _auser(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    meta = await aget_payload_meta(pk)
+    if meta is None or meta['creator_id'] != user.pk:
+        raise Http404("No Tour matches the given query.")
+    return await _apayload_response(request, pk, meta, 'private, no-cache')
+
+
+@query_budget(10)
+async def tour_public_data_async(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    meta = await aget_payload_meta(pk)
+    if meta is None or not meta['public']:
+        raise Http404("No Tour matches the given query.")
+    response = await _apayload_response(
+        request, pk, meta,
+        f'public, max-age={settings.TOUR_PUBLIC_MAX_AGE}, '
+        f'stale-while-revalidate={settings.TOUR_PUBLIC_STALE_WHILE_REVALIDATE}',
+    )
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+
+@query_budget(10)
+@require_safe
+def published_tour_view(request, pk, name='index.html'):
+    """Build a public tour's static bundle on a miss and serve the requested file from it"""
+    if prerender.build_tour(pk) not in (prerender.BUILT, prerender.UNCHANGED):
+        raise Http404("No Tour matches the given query.")
+    content_type = 'application/json' if name == 'tour.json' else 'text/html; charset=utf-8'
+    response = FileResponse(open(prerender.bundle_dir(pk) / name, 'rb'), content_type=content_type)
+    response['Cache-Control'] = f'public, max-age={settings.TOUR_PUBLIC_MAX_AGE}'
+    return response
+
+
+@query_budget(12)
 def tour_preview_enhanced_v2_view(request, pk):
     """Enhanced tour preview v2 with interactive step-by-step navigation"""
-    tour = get_object_or_404(Tour, pk=pk)
-    steps = tour.steps.all().order_by('step_number')
-    
-    # Convert steps to JSON for JavaScript
-    steps_data = []
-    for step in steps:
-        step_data = {
-            'id': step.id,
-            'title': step.title,
-            'description': step.description,
-            'screenshot': step.screenshot.url if step.screenshot else None,
-            'highlight_area': step.highlight_area,
-            'recording': {
-                'duration': step.recording.duration if hasattr(step, 'recording') and step.recording else 0
-            } if hasattr(step, 'recording') and step.recording else None
-        }
-        steps_data.append(step_data)
-    
+    payload = get_payload(pk)
+    if payload is None:
+        raise Http404("No Tour matches the given query.")
+    tour = payload['tour']
+    public = tour['status'] == 'Published' and tour['privacy'] == 'public'
+    if not public and tour['creator_id'] != request.user.pk:
+        raise Http404("No Tour matches the given query.")
+    record_view(pk, _client_ip(request), request.user.pk if request.user.is_authenticated else None)
+    if request.user.is_authenticated:
+        log_activity(request.user.pk, 'viewed', pk, tour['title'])
+
     context = {
         'tour': tour,
-        'steps': steps_data,
+        'steps': payload['steps'],
     }
     return render(request, 'tours/preview_enhanced_v2.html', context)
 
@@ -198,9 +352,21 @@ def saved_tours_view(request):
     saved_tours = SavedTour.objects.filter(user=request.user).order_by('-created_at')
     return render(request, 'tours/saved_tours.html', {'saved_tours': saved_tours})
 
+@login_required
+@require_safe
+def saved_tour_download_view(request, pk):
+    """Stream an exported tour bundle from storage"""
+    saved = get_object_or_404(SavedTour, pk=pk, user=request.user)
+    try:
+        bundle = saved.file_url.open('rb')
+    except FileNotFoundError:
+        raise Http404('The exported file is missing')
+    return FileResponse(bundle, as_attachment=True, filename=saved.file_url.name.rsplit('/', 1)[-1],
+                        content_type='application/zip')
+
 @login_required
 def tour_list(request):
-    tours = Tour.objects.filter(creator=request.user)
+    tours = Tour.objects.filter(creator=request.user).with_stats()
     return render(request, 'tours/steps.html', {'tours': tours})
 
 
@@ -229,11 +395,120 @@ def tour_create_view(request):
                 status='Draft'
             )
             messages.success(request, f'Tour "{title}" created successfully!')
-            return redirect('tours:tour_steps', pk=tour.id)
+            return redirect('tours:step_create', tour_pk=tour.id)
         else:
             messages.error(request, 'Tour title is required.')
     
     context = {
         'title': 'Create New Tour'
     }
-    return render(request, 'tours/tour_create.html', context)
\ No newline at end of file
+    return render(request, 'tours/tour_create.html', context)
+
+
+def _recording_state(recording, offset):
+    response = JsonResponse({
+        'id': str(recording.pk),
+        'status': recording.status,
+        'offset': offset,
+    })
+    response['Upload-Offset'] = str(offset)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@login_required
+@require_POST
+def recording_create_view(request):
+    """Start a recording that the browser uploads chunk by chunk"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    recording = Recording.objects.create(
+        user=request.user,
+        title=str(data.get('title', ''))[:200],
+        mime_type=str(data.get('mime_type', 'video/webm'))[:100],
+    )
+    return _recording_state(recording, 0)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH'])
+def recording_upload_view(request, pk):
+    """Report the stored offset (GET/HEAD) or append a chunk at Upload-Offset (PATCH)"""
+    recording = get_object_or_404(Recording, pk=pk, user=request.user)
+    if request.method != 'PATCH':
+        return _recording_state(recording, current_offset(recording.pk))
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset header is required'}, status=400)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid Content-Length header'}, status=400)
+    if length > settings.RECORDING_MAX_CHUNK_SIZE:
+        return JsonResponse({'error': 'Chunk too large'}, status=413)
+
+    try:
+        offset = append_chunk(recording, request, offset)
+    except OffsetMismatch as exc:
+        response = _recording_state(recording, exc.offset)
+        response.status_code = 409
+        return response
+    except UploadClosed:
+        return JsonResponse({'error': 'Recording is no longer accepting data'}, status=409)
+    return _recording_state(recording, offset)
+
+
+@login_required
+@require_POST
+def recording_finalize_view(request, pk):
+    """Finish the upload and queue the recording for processing"""
+    recording = get_object_or_404(Recording, pk=pk, user=request.user)
+    try:
+        recording = finalize_upload(recording.pk)
+    except UploadClosed:
+        return JsonResponse({'error': 'Recording was already finalized'}, status=409)
+    return _recording_state(recording, recording.size)
+
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def recording_events_view(request, pk):
+    """Read a time window of events (?from=30s&to=45s) or append a batch (POST)"""
+    recording = get_object_or_404(Recording.objects.only('pk', 'status'), pk=pk, user=request.user)
+
+    if request.method == 'POST':
+        if recording.status != 'recording':
+            return JsonResponse({'error': 'Recording is no longer accepting events'}, status=409)
+        try:
+            events = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        if not isinstance(events, list):
+            return JsonResponse({'error': 'Expected a list of events'}, status=400)
+        try:
+            stored = append_events(recording.pk, events)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        return JsonResponse({'stored': stored}, status=201)
+
+    try:
+        start = parse_offset(request.GET.get('from', '0'))
+        end = parse_offset(request.GET['to']) if 'to' in request.GET else start + settings.RECORDING_DEFAULT_WINDOW_MS
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if end < start:
+        return JsonResponse({'error': '"to" must not be before "from"'}, status=400)
+
+    duration = stream_duration(recording.pk)
+    return JsonResponse({
+        'from_ms': start,
+        'to_ms': end,
+        'duration_ms': duration,
+        'next_from_ms': end + 1 if duration is not None and end < duration else None,
+        'events': read_window(recording.pk, start, end),
+    })